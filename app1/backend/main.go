@@ -37,6 +37,11 @@ type ReserveRequest struct {
 	UserID int `json:"user_id" binding:"required"`
 }
 
+type ReleaseRequest struct {
+	SeatID int `json:"seat_id" binding:"required"`
+	UserID int `json:"user_id" binding:"required"`
+}
+
 var (
 	db           *sql.DB
 	seatMutex    sync.RWMutex
@@ -123,6 +128,7 @@ func main() {
 		api.GET("/events", getEvents)
 		api.GET("/events/:id/seats", getSeats)
 		api.POST("/reserve", reserveSeat)
+		api.POST("/release", releaseSeat)
 		api.GET("/instance", getInstance)
 	}
 
@@ -397,3 +403,44 @@ func reserveSeat(c *gin.Context) {
 		"instance":    instanceName,
 	})
 }
+
+// releaseSeat deshace una reserva (compensación desde App3 cuando la orden
+// nunca llegó a facturación). Solo libera si el asiento sigue reservado por
+// el mismo usuario, así que repetir la llamada es seguro.
+func releaseSeat(c *gin.Context) {
+	var req ReleaseRequest
+	if err := c.ShouldBindJSON(&req); err != nil {
+		c.JSON(http.StatusBadRequest, gin.H{"error": "Datos inválidos"})
+		return
+	}
+
+	seatMutex.Lock()
+	defer seatMutex.Unlock()
+
+	result, err := db.Exec(`
+		UPDATE seats
+		SET status = 'available', reserved_at = NULL, user_id = NULL
+		WHERE id = $1 AND user_id = $2 AND status = 'reserved'
+	`, req.SeatID, req.UserID)
+
+	if err != nil {
+		log.Printf("Error liberando asiento: %v", err)
+		c.JSON(http.StatusInternalServerError, gin.H{"error": "Error liberando asiento"})
+		return
+	}
+
+	rowsAffected, _ := result.RowsAffected()
+	if rowsAffected == 0 {
+		c.JSON(http.StatusConflict, gin.H{"error": "El asiento no está reservado por este usuario"})
+		return
+	}
+
+	log.Printf("[%s] Asiento %d liberado (reserva del usuario %d compensada)", instanceName, req.SeatID, req.UserID)
+
+	c.JSON(http.StatusOK, gin.H{
+		"message":  "Asiento liberado",
+		"seat_id":  req.SeatID,
+		"user_id":  req.UserID,
+		"instance": instanceName,
+	})
+}
@@ -8,16 +8,35 @@ def create_app(config_class=Config):
 
     db.init_app(app)
 
-    from .routes import auth_bp, ticket_bp
+    from .routes import auth_bp, ticket_bp, gate_bp
     app.register_blueprint(auth_bp)
     app.register_blueprint(ticket_bp)
+    app.register_blueprint(gate_bp)
 
+    from .metrics import init_metrics
+    init_metrics(app)
+
+    from .sql_profiler import init_sql_profiler
+    init_sql_profiler(app)
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Crea las tablas que falten (paso único de despliegue)."""
+        init_db(app)
+
+    # El esquema se crea en un paso único (init_db.py / flask init-db), no en cada
+    # proceso que arranca; APP2_AUTO_CREATE_SCHEMA=true recupera el comportamiento anterior.
+    if app.config.get('AUTO_CREATE_SCHEMA'):
+        init_db(app)
+
+    return app
+
+def init_db(app, retries=10, delay=5):
     with app.app_context():
         # Retry logic for DB connection
         import time
         from sqlalchemy.exc import OperationalError, ProgrammingError
         
-        retries = 10
         while retries > 0:
             try:
                 db.create_all()
@@ -29,10 +48,8 @@ def create_app(config_class=Config):
                 break
             except OperationalError as e:
                 retries -= 1
-                print(f"Database not ready yet, retrying in 5 seconds... ({retries} retries left)")
-                time.sleep(5)
+                print(f"Database not ready yet, retrying in {delay} seconds... ({retries} retries left)")
+                time.sleep(delay)
                 if retries == 0:
                     print("Could not connect to database after multiple attempts.")
                     raise e
-
-    return app
@@ -0,0 +1,155 @@
+"""
+Importación masiva de tickets desde un archivo NDJSON (opcionalmente .gz).
+
+Para reprocesar horas de mensajes después de una caída del middleware sin
+pasar por el socket. El archivo tiene un mensaje {id, rut, price, event} por
+línea, el mismo formato que recibe el listener. Se lee en streaming (memoria
+constante) y cada bloque de chunk_size líneas pasa por
+TicketService.receive_external_tickets_batch: validación, deduplicación
+contra los external_id existentes con un IN (...), inserción en bloque de
+usuarios provisorios y tickets y un único commit por bloque.
+
+Después de cada commit se guarda un checkpoint (posición en bytes del
+archivo descomprimido), así una importación interrumpida continúa donde
+quedó. Repetir un bloque es inofensivo: los duplicados se descartan.
+"""
+import gzip
+import json
+import os
+import time
+from .models import db
+from .services import TicketService
+from .json_codec import get_decoder
+from .ingest_cache import ingest_cache
+
+COUNTERS = ('lines', 'undecodable', 'invalid', 'duplicates', 'users_created', 'tickets_created', 'chunks', 'fallback_chunks')
+
+
+class CheckpointMismatch(Exception):
+    """El checkpoint es de otro archivo o el archivo cambió desde entonces."""
+
+
+def open_ndjson(path):
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    # GzipFile admite seek hacia adelante (descomprime y descarta), así se retoma igual
+    if magic == b'\x1f\x8b':
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+class BulkImporter:
+    def __init__(self, app, path, checkpoint_path=None, chunk_size=5000, progress_every=5.0, decoder='auto', log=print):
+        self.app = app
+        self.path = os.path.abspath(path)
+        self.checkpoint_path = checkpoint_path or f"{path}.checkpoint"
+        self.chunk_size = chunk_size
+        self.progress_every = progress_every
+        self.decoder_name, self.loads = get_decoder(decoder)
+        self.log = log
+        self.totals = dict.fromkeys(COUNTERS, 0)
+        self.offset = 0
+
+    # --- Checkpoint ---
+
+    def load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return False
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint['path'] != self.path or checkpoint['size'] != os.path.getsize(self.path):
+            raise CheckpointMismatch(
+                f"{self.checkpoint_path} belongs to {checkpoint['path']} ({checkpoint['size']} bytes); use --restart"
+            )
+        self.offset = checkpoint['offset']
+        self.totals.update(checkpoint['totals'])
+        return True
+
+    def save_checkpoint(self):
+        # Escritura atómica: un corte a mitad no deja un checkpoint corrupto
+        tmp = f"{self.checkpoint_path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({
+                'path': self.path,
+                'size': os.path.getsize(self.path),
+                'offset': self.offset,
+                'totals': self.totals,
+            }, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    def clear_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    # --- Lectura ---
+
+    def chunks(self, f):
+        """Bloques de mensajes decodificados junto con la posición al final del bloque."""
+        chunk = []
+        offset = self.offset
+        for line in f:
+            offset += len(line)
+            self.totals['lines'] += 1
+            if not line.strip():
+                continue
+            try:
+                data = self.loads(line)
+            except ValueError:
+                self.totals['undecodable'] += 1
+                continue
+            if not isinstance(data, dict):
+                self.totals['undecodable'] += 1
+                continue
+            chunk.append(data)
+            if len(chunk) >= self.chunk_size:
+                yield chunk, offset
+                chunk = []
+        yield chunk, offset
+
+    # --- Importación ---
+
+    def run(self, restart=False):
+        if restart:
+            self.clear_checkpoint()
+        elif self.load_checkpoint():
+            self.log(f"Resuming {self.path} at byte {self.offset} ({self.totals['lines']} lines done)")
+
+        ingest_cache.configure(self.app)
+        start = time.monotonic()
+        last_report = start
+        lines_before = self.totals['lines']
+        with self.app.app_context(), open_ndjson(self.path) as f:
+            f.seek(self.offset)
+            for chunk, offset in self.chunks(f):
+                if chunk:
+                    try:
+                        stats = TicketService.receive_external_tickets_batch(chunk)
+                    except Exception:
+                        # El checkpoint queda en el último bloque confirmado
+                        db.session.rollback()
+                        raise
+                    for key in ('invalid', 'duplicates', 'users_created', 'tickets_created'):
+                        self.totals[key] += stats[key]
+                    self.totals['chunks'] += 1
+                    self.totals['fallback_chunks'] += 1 if stats['fallback'] else 0
+                self.offset = offset
+                self.save_checkpoint()
+
+                now = time.monotonic()
+                if now - last_report >= self.progress_every:
+                    last_report = now
+                    self.report(self.totals['lines'] - lines_before, now - start)
+
+        elapsed = time.monotonic() - start
+        self.report(self.totals['lines'] - lines_before, elapsed, final=True)
+        self.clear_checkpoint()
+        return dict(self.totals, elapsed_s=round(elapsed, 2))
+
+    def report(self, lines, elapsed, final=False):
+        rate = lines / elapsed if elapsed else 0
+        t = self.totals
+        self.log(
+            f"{'done' if final else 'progress'}: {t['lines']} lines ({rate:.0f} rows/s), "
+            f"{t['tickets_created']} tickets and {t['users_created']} users created, "
+            f"{t['duplicates']} duplicates, {t['invalid'] + t['undecodable']} rejected"
+        )
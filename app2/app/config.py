@@ -17,3 +17,87 @@ class Config:
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Pool de conexiones: pre_ping y recycle descartan conexiones que ProxySQL o un
+    # failover de orchestrator dejaron muertas antes de que lleguen a una petición.
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_pre_ping': os.environ.get('APP2_DB_POOL_PRE_PING', 'true').lower() == 'true',
+        'pool_recycle': int(os.environ.get('APP2_DB_POOL_RECYCLE', '280')),
+    }
+    if SQLALCHEMY_DATABASE_URI and not SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        SQLALCHEMY_ENGINE_OPTIONS.update({
+            'pool_size': int(os.environ.get('APP2_DB_POOL_SIZE', '10')),
+            'max_overflow': int(os.environ.get('APP2_DB_MAX_OVERFLOW', '20')),
+            'pool_timeout': int(os.environ.get('APP2_DB_POOL_TIMEOUT', '10')),
+        })
+
+    # Crear el esquema al arrancar cada proceso (solo para desarrollo; en producción usar init_db.py)
+    AUTO_CREATE_SCHEMA = os.environ.get('APP2_AUTO_CREATE_SCHEMA', 'false').lower() == 'true'
+
+    # Tamaño de página del listado de tickets (web y API)
+    MY_TICKETS_PAGE_SIZE = int(os.environ.get('MY_TICKETS_PAGE_SIZE', '50'))
+
+    # Ingesta por lotes del listener (LISTENER_BATCH_SIZE <= 1 mantiene el camino mensaje a mensaje)
+    LISTENER_BATCH_SIZE = int(os.environ.get('LISTENER_BATCH_SIZE', '1'))
+    LISTENER_FLUSH_INTERVAL_MS = int(os.environ.get('LISTENER_FLUSH_INTERVAL_MS', '200'))
+    # Hilos de ingesta con reparto por RUT (ver listener_shards.py); 1 = todo en el hilo del socket
+    LISTENER_SHARDS = int(os.environ.get('LISTENER_SHARDS', '1'))
+    LISTENER_SHARD_QUEUE_SIZE = int(os.environ.get('LISTENER_SHARD_QUEUE_SIZE', '1000'))
+    # Tiempo máximo para drenar colas y lotes pendientes al recibir SIGTERM
+    LISTENER_DRAIN_TIMEOUT_S = float(os.environ.get('LISTENER_DRAIN_TIMEOUT_S', '25'))
+
+    # Notificaciones al middleware: 'outbox' (se escriben en la misma transacción y
+    # las entrega run_outbox_relay.py) o 'direct' (envío en segundo plano, sin garantía)
+    NOTIFICATION_MODE = os.environ.get('NOTIFICATION_MODE', 'outbox').lower()
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '200'))
+    OUTBOX_POLL_INTERVAL_MS = int(os.environ.get('OUTBOX_POLL_INTERVAL_MS', '500'))
+    OUTBOX_MAX_BACKOFF_S = int(os.environ.get('OUTBOX_MAX_BACKOFF_S', '60'))
+    OUTBOX_RETENTION_HOURS = int(os.environ.get('OUTBOX_RETENTION_HOURS', '24'))
+    # El relay marca un lote como entregado recién con el ack del consumidor (feed_ack.py);
+    # false = basta con que termine el sendall (a lo más una vez desde el socket)
+    OUTBOX_REQUIRE_ACK = os.environ.get('OUTBOX_REQUIRE_ACK', 'true').lower() == 'true'
+    OUTBOX_ACK_TIMEOUT_S = float(os.environ.get('OUTBOX_ACK_TIMEOUT_S', '10'))
+    # Duración del lease de un lote tomado; si el relay muere, otro lo reenvía al vencer
+    OUTBOX_CLAIM_LEASE_S = float(os.environ.get('OUTBOX_CLAIM_LEASE_S', '60'))
+
+    # Logging del listener: nivel, formato (text|json) y muestreo de los cuerpos de
+    # mensaje, que solo se registran en DEBUG y 1 de cada LISTENER_LOG_SAMPLE_EVERY
+    LISTENER_LOG_LEVEL = os.environ.get('LISTENER_LOG_LEVEL', 'INFO')
+    LISTENER_LOG_FORMAT = os.environ.get('LISTENER_LOG_FORMAT', 'text').lower()
+    LISTENER_LOG_SAMPLE_EVERY = int(os.environ.get('LISTENER_LOG_SAMPLE_EVERY', '100'))
+    # Decodificador JSON: auto (orjson/ujson si están instalados), orjson, ujson o json
+    LISTENER_JSON_DECODER = os.environ.get('LISTENER_JSON_DECODER', 'auto')
+
+    # Cachés de ingesta (RUTs conocidos y external_id recientes, ver ingest_cache.py)
+    INGEST_CACHE_ENABLED = os.environ.get('INGEST_CACHE_ENABLED', 'true').lower() == 'true'
+    INGEST_CACHE_USERS = int(os.environ.get('INGEST_CACHE_USERS', '50000'))
+    INGEST_CACHE_TICKETS = int(os.environ.get('INGEST_CACHE_TICKETS', '100000'))
+    # Tickets recientes a precargar al iniciar el listener (0 = sin precarga)
+    INGEST_CACHE_WARM = int(os.environ.get('INGEST_CACHE_WARM', '20000'))
+    # Cada cuántos mensajes el listener registra los contadores del caché
+    INGEST_CACHE_STATS_EVERY = int(os.environ.get('INGEST_CACHE_STATS_EVERY', '10000'))
+
+    # Métricas Prometheus (ver metrics.py): /metrics en la app web y un puerto propio
+    # para el listener (0 = sin exportador)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    LISTENER_METRICS_PORT = int(os.environ.get('LISTENER_METRICS_PORT', '9102'))
+
+    # API de check-in para los lectores de los accesos (ver gate_scanner.py). Tokens
+    # separados por comas en el header X-Gate-Token; sin tokens la API queda apagada
+    GATE_API_TOKENS = [t.strip() for t in os.environ.get('GATE_API_TOKENS', '').split(',') if t.strip()]
+    GATE_MAX_BATCH = int(os.environ.get('GATE_MAX_BATCH', '1000'))
+    # Segundos que se comparte un snapshot completo entre lectores (0 = sin caché)
+    GATE_SNAPSHOT_TTL_S = float(os.environ.get('GATE_SNAPSHOT_TTL_S', '2'))
+    # Solape de los deltas hacia atrás desde since (updated_at se guarda al segundo)
+    GATE_DELTA_OVERLAP_S = float(os.environ.get('GATE_DELTA_OVERLAP_S', '5'))
+
+    # Resumen de ventas por evento (tabla event_sales, ver SalesAggregates). Filas por
+    # (evento, estado) entre las que se reparten las escrituras concurrentes
+    SALES_AGGREGATE_SLOTS = int(os.environ.get('SALES_AGGREGATE_SLOTS', '8'))
+    # Token para /sales y /api/sales (header X-Sales-Token o ?token=); vacío = rutas deshabilitadas
+    SALES_DASHBOARD_TOKEN = os.environ.get('SALES_DASHBOARD_TOKEN', '')
+
+    # Perfilador SQL por petición / mensaje (ver sql_profiler.py); solo para desarrollo y benchmarks
+    SQL_PROFILE_ENABLED = os.environ.get('SQL_PROFILE_ENABLED', 'false').lower() == 'true'
+    SQL_PROFILE_SLOW_MS = float(os.environ.get('SQL_PROFILE_SLOW_MS', '50'))
+    # Repeticiones de una misma forma de sentencia en una unidad a partir de las cuales se avisa N+1
+    SQL_PROFILE_N_PLUS_ONE = int(os.environ.get('SQL_PROFILE_N_PLUS_ONE', '5'))
@@ -0,0 +1,29 @@
+"""
+Enrutamiento lectura/escritura sobre ProxySQL (ver app2_proxysql/conf/proxysql.cnf).
+
+ProxySQL decide por el texto de la consulta: los SELECT van a las réplicas
+(hostgroup 20) y todo lo demás al primario (hostgroup 10). Una réplica puede
+ir atrasada, así que las lecturas cuyo resultado decide una escritura deben
+marcarse explícitamente:
+
+- for_update(query): SELECT ... FOR UPDATE. Lee en el primario y bloquea las
+  filas hasta el commit; para leer-y-luego-escribir. Lleva además la marca
+  PRIMARY_HINT para no depender de la regla 100 (SQLAlchemy emite el SELECT
+  en varias líneas). Toda lectura con bloqueo del código pasa por aquí: no
+  usar .with_for_update() directamente.
+- on_primary(query): agrega el comentario PRIMARY_HINT (regla 50). Lee en el
+  primario sin bloquear; para comprobaciones de existencia antes de insertar
+  o lecturas que deben ver una escritura recién confirmada.
+
+Cualquier otra consulta puede ir a una réplica.
+"""
+
+PRIMARY_HINT = '/* route:primary */'
+
+
+def on_primary(query):
+    return query.prefix_with(PRIMARY_HINT)
+
+
+def for_update(query):
+    return on_primary(query).with_for_update()
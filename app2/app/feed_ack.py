@@ -0,0 +1,283 @@
+"""
+Protocolo opcional de confirmaciones con créditos para el feed TCP de tickets.
+
+Sin él, un productor no sabe qué mensajes quedaron confirmados en la BD y al
+reconectarse solo puede reenviar todo. Es el productor quien lo pide: si la
+primera línea de la conexión es
+
+    {"hello": "ack/1", "next_seq": 501}
+
+el listener responde con {"hello": "ack/1", "ack": 500, "limit": 1500} y desde
+ahí el n-ésimo mensaje de la conexión tiene el número de secuencia
+next_seq + n (la posición en el stream TCP, sin campos extra en el mensaje).
+El listener envía de vuelta líneas {"ack": A, "limit": L}:
+
+- ack es acumulativo: todos los mensajes con seq <= A ya se procesaron (el
+  commit ocurrió o el mensaje es inválido y reenviarlo no cambiaría nada).
+- limit es el crédito: el productor puede enviar hasta seq L (ventana de
+  MIDDLEWARE_ACK_WINDOW mensajes sin confirmar).
+
+Los acks se agrupan: se envía uno cada MIDDLEWARE_ACK_EVERY mensajes
+confirmados, o antes si el adaptador ya procesó todo lo leído del socket y
+está esperando más (idle()). Si un mensaje falla por un
+error de BD, el ack no avanza más allá y el listener cierra la conexión; el
+productor se reconecta y reenvía solo lo no confirmado (los duplicados que
+haya en eso los descarta el servicio). Un productor que no manda el hello
+sigue en el modo de siempre, líneas JSON sin respuesta.
+
+No depende de Flask ni del resto del paquete, así el simulador lo carga por
+ruta igual que framing.py.
+"""
+import json
+import socket
+import threading
+import time
+from collections import deque
+from functools import partial
+
+PROTOCOL = 'ack/1'
+HELLO_PREFIX = b'{"hello"'
+DEFAULT_WINDOW = 1000
+DEFAULT_ACK_EVERY = 100
+
+
+class FeedSession:
+    """
+    Lado del listener, una por conexión. admit(frame) devuelve (frame, ack) para
+    pasar al callback, con ack = None en el modo sin confirmaciones, o None si
+    el frame era el hello. ack(ok) se llama desde el hilo que hizo el commit.
+    El adaptador llama idle() antes de bloquearse esperando más datos.
+    """
+    def __init__(self, send, abort, window=DEFAULT_WINDOW, ack_every=DEFAULT_ACK_EVERY):
+        # send(bytes) y abort() deben poder llamarse desde cualquier hilo
+        self._send = send
+        self._abort = abort
+        self.window = max(int(window), 1)
+        self.ack_every = max(min(int(ack_every), self.window // 2), 1)
+        self.enabled = False
+        self._first = True
+        self._lock = threading.Lock()
+        self._received = 0   # último seq recibido
+        self._acked = 0      # último seq confirmado en forma contigua
+        self._sent_ack = 0   # último ack enviado
+        self._done = set()   # confirmados fuera de orden (shards, workers en paralelo)
+        self._failed = False
+        self._idle = False
+        self.stats = {'received': 0, 'acked': 0, 'acks_sent': 0, 'failed': 0, 'over_limit': 0}
+
+    def admit(self, frame):
+        if self._first:
+            self._first = False
+            # En frames binarios (framing.py) el hello llega ya decodificado
+            if isinstance(frame, dict):
+                is_hello = 'hello' in frame
+            else:
+                is_hello = frame.startswith(HELLO_PREFIX)
+            if is_hello:
+                self._hello(frame)
+                return None
+        if not self.enabled:
+            return frame, None
+        with self._lock:
+            self._idle = False
+            self._received += 1
+            seq = self._received
+            self.stats['received'] += 1
+            if seq > self._sent_ack + self.window:
+                self.stats['over_limit'] += 1
+        return frame, partial(self.done, seq)
+
+    def _hello(self, frame):
+        hello = json.loads(frame) if isinstance(frame, bytes) else frame
+        if hello.get('hello') != PROTOCOL:
+            raise ValueError(f"Unsupported feed protocol {hello.get('hello')!r}")
+        self.enabled = True
+        start = int(hello.get('next_seq', 1)) - 1
+        self._received = self._acked = self._sent_ack = start
+        self._send(_line({'hello': PROTOCOL, 'ack': start, 'limit': start + self.window}))
+
+    def idle(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._idle = True
+            if not self._failed:
+                self._reply(self._acked > self._sent_ack)
+
+    def done(self, seq, ok=True):
+        with self._lock:
+            if self._failed:
+                return
+            if not ok:
+                # Lo que sigue no se confirma: el productor lo reenviará al reconectarse
+                self._failed = True
+                self.stats['failed'] += 1
+                try:
+                    self._abort()
+                except OSError:
+                    pass
+                return
+            self._done.add(seq)
+            while self._acked + 1 in self._done:
+                self._acked += 1
+                self._done.discard(self._acked)
+            pending = self._acked - self._sent_ack
+            # Sin más datos por leer, el último del lote no espera a completar ack_every
+            self._reply(pending >= self.ack_every or (pending and self._idle and self._acked == self._received))
+
+    def _reply(self, due):
+        # Con _lock tomado: los acks salen en orden aunque lleguen de varios hilos
+        if not due:
+            return
+        self.stats['acked'] += self._acked - self._sent_ack
+        self.stats['acks_sent'] += 1
+        self._sent_ack = self._acked
+        try:
+            self._send(_line({'ack': self._acked, 'limit': self._acked + self.window}))
+        except OSError:
+            pass
+
+
+def _line(obj):
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+class AckingProducer:
+    """
+    Lado del productor (simulador, generador de carga). send() asigna el
+    siguiente seq, espera crédito si la ventana está llena y guarda el mensaje
+    hasta que llegue su ack. Si la conexión se cae, la siguiente llamada se
+    reconecta y reenvía, en orden, solo lo que no se confirmó.
+    """
+    def __init__(self, host, port, connect_timeout=5.0, retry_delay=1.0):
+        self.host = host
+        self.port = int(port)
+        self.connect_timeout = connect_timeout
+        self.retry_delay = retry_delay
+        self.next_seq = 1
+        self.acked = 0
+        self.limit = 0
+        self.unacked = deque()  # (seq, línea)
+        self.sock = None
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self.stats = {'sent': 0, 'retransmitted': 0, 'acked': 0, 'connects': 0, 'credit_waits': 0}
+
+    def _connect(self, fresh=None):
+        sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        first = self.unacked[0][0] if self.unacked else self.next_seq
+        sock.sendall(_line({'hello': PROTOCOL, 'next_seq': first}))
+        reader = sock.makefile('rb')
+        reply = json.loads(reader.readline() or b'null')
+        if not isinstance(reply, dict) or reply.get('hello') != PROTOCOL:
+            sock.close()
+            raise ValueError(f"Listener does not speak {PROTOCOL}: {reply!r}")
+        sock.settimeout(None)
+        with self._cond:
+            self.sock = sock
+            self._on_ack(reply)
+            pending = list(self.unacked)
+        self.stats['connects'] += 1
+        threading.Thread(target=self._read_acks, args=(sock, reader), daemon=True).start()
+        for seq, line in pending:
+            self._wait_credit(seq, sock)
+            sock.sendall(line)
+            if seq != fresh:
+                self.stats['retransmitted'] += 1
+
+    def _reconnect(self, fresh=None):
+        # Llamar con _write_lock tomado
+        while True:
+            try:
+                self._connect(fresh)
+                return
+            except OSError:
+                with self._cond:
+                    self.sock = None
+                time.sleep(self.retry_delay)
+
+    def _on_ack(self, reply):
+        # Llamar con _cond tomado
+        ack = reply.get('ack', self.acked)
+        while self.unacked and self.unacked[0][0] <= ack:
+            self.unacked.popleft()
+            self.stats['acked'] += 1
+        self.acked = max(self.acked, ack)
+        self.limit = max(self.limit, reply.get('limit', self.limit))
+        self._cond.notify_all()
+
+    def _read_acks(self, sock, reader):
+        try:
+            for line in reader:
+                reply = json.loads(line)
+                with self._cond:
+                    self._on_ack(reply)
+        except (OSError, ValueError):
+            pass
+        with self._cond:
+            if self.sock is sock:
+                self.sock = None
+            self._cond.notify_all()
+        sock.close()
+
+    def _wait_credit(self, seq, sock):
+        with self._cond:
+            if seq > self.limit:
+                self.stats['credit_waits'] += 1
+            while seq > self.limit and self.sock is sock:
+                self._cond.wait()
+            if self.sock is not sock:
+                raise ConnectionError("Connection lost while waiting for credit")
+
+    def send(self, message):
+        line = _line(message)
+        with self._write_lock:
+            with self._cond:
+                seq = self.next_seq
+                self.next_seq += 1
+                self.unacked.append((seq, line))
+            self.stats['sent'] += 1
+            sock = self.sock
+            if sock is not None:
+                try:
+                    self._wait_credit(seq, sock)
+                    sock.sendall(line)
+                    return seq
+                except OSError:
+                    with self._cond:
+                        if self.sock is sock:
+                            self.sock = None
+            # Reenvía lo pendiente, incluido este mensaje
+            self._reconnect(fresh=seq)
+            return seq
+
+    def flush(self, timeout=None):
+        """Espera a que todo lo enviado esté confirmado. Devuelve False si vence el timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.unacked:
+                if self.sock is None:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            lost = bool(self.unacked)
+        if lost:
+            # La conexión se cayó con mensajes en vuelo: reconectar los reenvía
+            with self._write_lock:
+                if self.sock is None:
+                    self._reconnect()
+            return self.flush(None if deadline is None else max(deadline - time.monotonic(), 0.001))
+        return True
+
+    def close(self):
+        with self._cond:
+            sock, self.sock = self.sock, None
+            self._cond.notify_all()
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
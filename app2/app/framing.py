@@ -0,0 +1,201 @@
+"""
+Codec de framing para los sockets del middleware: mensajes delimitados por '\n'
+(LineFramer) o, si el productor lo negocia, frames binarios con longitud
+(BinaryFramer, más abajo).
+
+Trabaja sobre un bytearray de tamaño fijo con un offset de búsqueda, de modo
+que cada byte se escanea una sola vez y solo el resto parcial se mueve al
+inicio del buffer (nada de `buffer += ...; buffer.split('\n', 1)` cuadrático).
+Los frames se entregan como bytes (json.loads los acepta directamente), sin
+decodificar ni re-codificar, y un carácter UTF-8 partido entre dos lecturas
+no rompe nada porque nunca se decodifica un trozo suelto.
+
+No depende de Flask para poder usarse también desde scripts sueltos.
+"""
+import struct
+import zlib
+
+DEFAULT_MAX_FRAME = 64 * 1024
+DEFAULT_RECV_SIZE = 256 * 1024
+
+
+class FrameTooLarge(ValueError):
+    pass
+
+
+class LineFramer:
+    def __init__(self, max_frame=DEFAULT_MAX_FRAME, recv_size=DEFAULT_RECV_SIZE):
+        self.max_frame = int(max_frame)
+        self.recv_size = int(recv_size)
+        # Tras compactar, el resto parcial nunca supera max_frame, así que
+        # siempre quedan al menos recv_size bytes libres para el próximo recv.
+        self._buf = bytearray(self.recv_size + self.max_frame)
+        self._view = memoryview(self._buf)
+        self._start = 0  # inicio del frame en curso
+        self._scan = 0   # posición hasta la que ya se buscó '\n'
+        self._end = 0    # fin de los datos válidos
+
+    def recv_into(self, sock):
+        """
+        Lee directamente del socket al buffer interno. Devuelve la lista de
+        frames completos, o None si el otro extremo cerró la conexión.
+        """
+        n = sock.recv_into(self._view[self._end:])
+        if n == 0:
+            return None
+        self._end += n
+        return self._drain()
+
+    def feed(self, data):
+        """Agrega bytes ya leídos (por ejemplo desde asyncio) y devuelve los frames completos."""
+        frames = []
+        data = memoryview(data)
+        while data:
+            n = min(len(self._buf) - self._end, len(data))
+            self._buf[self._end:self._end + n] = data[:n]
+            self._end += n
+            data = data[n:]
+            frames.extend(self._drain())
+        return frames
+
+    def pending(self):
+        """Bytes recibidos que aún no forman un frame completo."""
+        return self._end - self._start
+
+    def _drain(self):
+        start = self._start
+        end = self._end
+        # Un único rfind sobre lo no escaneado; el corte en frames lo hace split() en C
+        last = self._buf.rfind(b'\n', self._scan, end)
+        if last < 0:
+            frames = []
+        else:
+            frames = [frame for frame in bytes(self._view[start:last]).split(b'\n') if frame.strip()]
+            if frames and max(map(len, frames)) > self.max_frame:
+                raise FrameTooLarge(f"Frame exceeds limit of {self.max_frame} bytes")
+            start = last + 1
+
+        if end - start > self.max_frame:
+            raise FrameTooLarge(f"Partial frame of {end - start} bytes exceeds limit of {self.max_frame}")
+
+        # Compactar: mover solo el resto parcial al inicio del buffer
+        if start == end:
+            self._start = self._scan = self._end = 0
+        else:
+            remainder = end - start
+            if start:
+                self._buf[:remainder] = bytes(self._view[start:end])
+            self._start = 0
+            self._scan = self._end = remainder
+        return frames
+
+
+# --- Framing binario negociado ---
+#
+# El productor que lo quiere manda BINARY_HANDSHAKE como primer byte de la
+# conexión (0xB1 no puede iniciar una línea JSON) y espera un byte de vuelta:
+# el mismo si el otro extremo acepta, HANDSHAKE_REFUSED si no (p. ej. sin
+# msgpack instalado), y entonces la conexión sigue en líneas JSON. Un extremo
+# anterior a este cambio no responde nada: al vencer la espera (o ante EOF o
+# cualquier otro byte) el productor cierra y se reconecta en modo JSON.
+#
+# Cada frame es [flags: 1 byte][largo: 4 bytes big-endian][payload], y el
+# payload es un lote de mensajes codificado con MessagePack (una lista de
+# mapas), comprimido con zlib si flags tiene FLAG_ZLIB. Los acks de
+# feed_ack.py siguen yendo de vuelta como líneas JSON: son pocos y cortos.
+
+BINARY_HANDSHAKE = b'\xb1'
+HANDSHAKE_REFUSED = b'\x00'
+FLAG_ZLIB = 0x01
+HEADER = struct.Struct('>BI')
+# Un frame es un lote completo: límite para el payload, antes y después de descomprimir
+DEFAULT_MAX_BATCH_FRAME = 4 * 1024 * 1024
+DEFAULT_COMPRESS_MIN = 4096
+
+
+def msgpack_available():
+    try:
+        import msgpack  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def encode_batch(messages, compress_min=DEFAULT_COMPRESS_MIN, level=1):
+    """
+    Un frame con el lote de mensajes. Se comprime si el payload tiene al menos
+    compress_min bytes (0 = nunca) y la compresión efectivamente lo achica.
+    """
+    import msgpack
+    payload = msgpack.packb(list(messages), use_bin_type=True)
+    flags = 0
+    if compress_min and len(payload) >= compress_min:
+        compressed = zlib.compress(payload, level)
+        if len(compressed) < len(payload):
+            payload, flags = compressed, FLAG_ZLIB
+    return HEADER.pack(flags, len(payload)) + payload
+
+
+class BinaryFramer:
+    """
+    Misma interfaz que LineFramer, pero cada elemento devuelto es un mensaje ya
+    decodificado (dict): el listener no vuelve a pasar por el decodificador JSON.
+    """
+    def __init__(self, max_frame=DEFAULT_MAX_BATCH_FRAME, recv_size=DEFAULT_RECV_SIZE):
+        import msgpack
+        self._unpackb = msgpack.unpackb
+        self.max_frame = int(max_frame)
+        self.recv_size = int(recv_size)
+        self._buf = bytearray()
+
+    def recv_into(self, sock):
+        data = sock.recv(self.recv_size)
+        if not data:
+            return None
+        return self.feed(data)
+
+    def feed(self, data):
+        buf = self._buf
+        buf += data
+        messages = []
+        pos = 0
+        end = len(buf)
+        view = memoryview(buf)
+        try:
+            while end - pos >= HEADER.size:
+                flags, length = HEADER.unpack_from(buf, pos)
+                if length > self.max_frame:
+                    raise FrameTooLarge(f"Frame of {length} bytes exceeds limit of {self.max_frame}")
+                if end - pos - HEADER.size < length:
+                    break
+                start = pos + HEADER.size
+                # Sin copiar el payload; la vista se libera antes de compactar el buffer
+                with view[start:start + length] as payload:
+                    if flags & FLAG_ZLIB:
+                        batch = self._unpackb(self._inflate(payload), raw=False)
+                    else:
+                        batch = self._unpackb(payload, raw=False)
+                if isinstance(batch, list):
+                    messages.extend(batch)
+                else:
+                    messages.append(batch)
+                pos = start + length
+        finally:
+            view.release()
+        if pos:
+            del buf[:pos]
+        return messages
+
+    def pending(self):
+        return len(self._buf)
+
+    def _inflate(self, payload):
+        # Con tope: un lote comprimido no puede expandirse más allá de max_frame
+        inflater = zlib.decompressobj()
+        try:
+            data = inflater.decompress(payload, self.max_frame)
+        except zlib.error as e:
+            raise ValueError(f"Corrupt compressed frame: {e}")
+        if inflater.unconsumed_tail:
+            raise FrameTooLarge(f"Decompressed frame exceeds limit of {self.max_frame} bytes")
+        return data
@@ -0,0 +1,199 @@
+"""
+Cachés en proceso para la ingesta de tickets externos.
+
+- known_users: RUTs que ya existen en users (LRU acotado). Un hit evita el
+  SELECT del usuario; los usuarios no se borran, así que un hit solo puede
+  quedar obsoleto si alguien borra filas a mano, y en ese caso el INSERT del
+  ticket falla por FK y se vuelve al camino con lecturas.
+- recent_tickets: external_id ya persistidos (LRU acotado). Un hit indica un
+  reintento probable y se confirma en la BD; un miss se inserta directo y la
+  restricción UNIQUE detecta el duplicado.
+
+Solo se agregan claves después de un commit exitoso, por lo que un rollback
+no deja entradas falsas; ante un IntegrityError se descartan las claves del
+mensaje.
+
+EventInterner (event_ids) es aparte: nombre de evento -> events.id.
+"""
+import threading
+from collections import OrderedDict
+from sqlalchemy import select, insert
+from sqlalchemy.exc import IntegrityError, DataError
+from .models import db, Ticket, Event
+from .db_routing import on_primary, PRIMARY_HINT
+
+
+class LRUSet:
+    """Conjunto acotado: al superar max_size se descarta la clave usada hace más tiempo."""
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return True
+            return False
+
+    def __len__(self):
+        return len(self._data)
+
+    def add_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data[key] = None
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class IngestCache:
+    def __init__(self, max_users=50000, max_tickets=100000):
+        self.known_users = LRUSet(max_users)
+        self.recent_tickets = LRUSet(max_tickets)
+        self.enabled = True
+        self._lock = threading.Lock()
+        self.counters = {
+            'user_hits': 0,
+            'user_misses': 0,
+            'ticket_hits': 0,
+            'ticket_misses': 0,
+            'queries_saved': 0,
+            'duplicate_inserts': 0,
+            'stale_hits': 0,
+        }
+
+    def configure(self, app):
+        self.enabled = app.config.get('INGEST_CACHE_ENABLED', True)
+        self.known_users = LRUSet(app.config.get('INGEST_CACHE_USERS', 50000))
+        self.recent_tickets = LRUSet(app.config.get('INGEST_CACHE_TICKETS', 100000))
+
+    def warm(self, limit):
+        """Carga los RUTs y external_id de los tickets más recientes (llamar con app context)."""
+        rows = on_primary(
+            db.session.query(Ticket.user_rut, Ticket.external_id).order_by(Ticket.id.desc()).limit(limit)
+        ).all()
+        db.session.commit()
+        # Del más antiguo al más reciente, para que los recientes queden al final del LRU
+        rows.reverse()
+        self.known_users.add_many(rut for rut, _ in rows)
+        self.recent_tickets.add_many(external_id for _, external_id in rows)
+        return len(rows)
+
+    def has_user(self, rut):
+        hit = self.enabled and rut in self.known_users
+        self.count('user_hits' if hit else 'user_misses')
+        return hit
+
+    def has_ticket(self, external_id):
+        hit = self.enabled and external_id in self.recent_tickets
+        self.count('ticket_hits' if hit else 'ticket_misses')
+        return hit
+
+    def remember(self, ruts=(), external_ids=()):
+        """Registrar claves ya confirmadas (después del commit)."""
+        if self.enabled:
+            self.known_users.add_many(ruts)
+            self.recent_tickets.add_many(external_ids)
+
+    def forget(self, rut=None, external_id=None):
+        if rut is not None:
+            self.known_users.discard(rut)
+        if external_id is not None:
+            self.recent_tickets.discard(external_id)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        for kind in ('user', 'ticket'):
+            lookups = stats[f'{kind}_hits'] + stats[f'{kind}_misses']
+            stats[f'{kind}_hit_rate'] = round(stats[f'{kind}_hits'] / lookups, 4) if lookups else 0.0
+        stats['users_cached'] = len(self.known_users)
+        stats['tickets_cached'] = len(self.recent_tickets)
+        return stats
+
+    def count(self, key, n=1):
+        with self._lock:
+            self.counters[key] += n
+
+
+ingest_cache = IngestCache()
+
+
+class EventInterner:
+    """
+    Nombre de evento -> events.id, con los ids ya vistos en memoria. Los eventos
+    nuevos se insertan en una conexión propia con commit inmediato (sin tocar la
+    transacción de la sesión); si otro proceso lo insertó antes, la restricción
+    UNIQUE lo detecta y se vuelve a leer. Los eventos no se borran, así que una
+    entrada del caché no queda obsoleta. Un nombre que no cabe en events.name (o
+    que la BD rechaza) no se crea y queda fuera del resultado, sin afectar al resto.
+    """
+    def __init__(self):
+        self._ids = {}
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'created': 0}
+
+    def get_id(self, name, create=True):
+        return self.get_ids([name], create).get(name)
+
+    def get_ids(self, names, create=True):
+        """{nombre: id} para los nombres dados; sin create, los inexistentes no aparecen."""
+        result = {}
+        missing = []
+        with self._lock:
+            for name in set(names):
+                event_id = self._ids.get(name)
+                if event_id is None:
+                    missing.append(name)
+                else:
+                    result[name] = event_id
+            self.counters['hits'] += len(result)
+            self.counters['misses'] += len(missing)
+        if missing:
+            result.update(self._resolve(missing, create))
+        return result
+
+    def _resolve(self, names, create):
+        table = Event.__table__
+        query = select(table.c.name, table.c.id).where(table.c.name.in_(names)).prefix_with(PRIMARY_HINT)
+        with db.engine.connect() as conn:
+            found = dict(conn.execute(query).all())
+        max_length = table.c.name.type.length
+        new = [name for name in names if name not in found and (max_length is None or len(name) <= max_length)]
+        if new and create:
+            for name in new:
+                try:
+                    with db.engine.begin() as conn:
+                        conn.execute(insert(table).values(name=name))
+                    self.counters['created'] += 1
+                except IntegrityError:
+                    pass  # Lo creó otro proceso en paralelo
+                except DataError:
+                    pass  # Rechazado por la BD (sql_mode estricto): ese nombre queda sin id
+            with db.engine.connect() as conn:
+                found.update(conn.execute(query).all())
+        with self._lock:
+            self._ids.update(found)
+        return found
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, events_cached=len(self._ids))
+
+
+event_ids = EventInterner()
@@ -0,0 +1,33 @@
+"""
+Decodificador JSON intercambiable para el listener.
+
+'auto' usa orjson o ujson si están instalados (varias veces más rápidos que
+el json de la stdlib para mensajes pequeños) y si no, json. Todos aceptan
+bytes y lanzan una subclase de ValueError ante JSON inválido.
+"""
+import json
+
+DECODERS = ('auto', 'orjson', 'ujson', 'json')
+
+
+def get_decoder(name='auto'):
+    """Devuelve (nombre, loads) para el decodificador pedido."""
+    name = (name or 'auto').lower()
+    if name not in DECODERS:
+        raise ValueError(f"Unknown JSON decoder: {name} (options: {', '.join(DECODERS)})")
+
+    if name in ('auto', 'orjson'):
+        try:
+            import orjson
+            return 'orjson', orjson.loads
+        except ImportError:
+            if name == 'orjson':
+                raise
+    if name in ('auto', 'ujson'):
+        try:
+            import ujson
+            return 'ujson', ujson.loads
+        except ImportError:
+            if name == 'ujson':
+                raise
+    return 'json', json.loads
@@ -0,0 +1,92 @@
+"""
+Reparto de los mensajes del listener en K shards por RUT.
+
+El hilo del socket solo decodifica y encola; cada shard es un hilo con su
+propia cola acotada, su propio app context (y por lo tanto su propia sesión
+de BD) y, en modo por lotes, su propio TicketBatcher. Todos los mensajes de un
+mismo RUT caen en el mismo shard y se procesan en el orden de llegada;
+usuarios distintos avanzan en paralelo. Si la cola de un shard se llena, el
+put bloquea al socket (backpressure como en tcp_async).
+
+close() encola una marca de fin en cada shard: los mensajes ya encolados se
+procesan, cada batcher hace su último flush y recién entonces termina el hilo.
+"""
+import queue
+import threading
+import time
+import zlib
+
+_STOP = object()
+
+# Dispatcher activo en este proceso (lo lee el gauge de metrics.py)
+active = None
+
+
+class ShardedDispatcher:
+    def __init__(self, handle, shards, queue_size=1000, make_batcher=None):
+        # handle(data, arrived, batcher, ack) procesa un mensaje ya decodificado
+        self.handle = handle
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(shards)]
+        self.batchers = [make_batcher() if make_batcher else None for _ in range(shards)]
+        self.processed = [0] * shards
+        self.undrained = []
+        self.threads = [
+            threading.Thread(target=self._run, args=(i,), name=f'listener-shard-{i}', daemon=True)
+            for i in range(shards)
+        ]
+
+    def start(self):
+        global active
+        for thread in self.threads:
+            thread.start()
+        active = self
+
+    def shard_for(self, data):
+        # Sin RUT (mensaje inválido) se reparte por id; el servicio lo descartará igual
+        key = data.get('rut') if isinstance(data, dict) else None
+        if key is None and isinstance(data, dict):
+            key = data.get('id')
+        return zlib.crc32(str(key).encode('utf-8')) % len(self.queues)
+
+    def submit(self, data, arrived=None, ack=None):
+        self.queues[self.shard_for(data)].put((data, arrived, ack))
+
+    def _run(self, shard):
+        q = self.queues[shard]
+        batcher = self.batchers[shard]
+        while True:
+            item = q.get()
+            if item is _STOP:
+                break
+            self.handle(item[0], item[1], batcher, item[2])
+            self.processed[shard] += 1
+        if batcher:
+            batcher.close()
+
+    def close(self, timeout=None):
+        """
+        Drena las colas y los lotes pendientes. Devuelve False si algún shard no
+        terminó a tiempo; sus índices quedan en self.undrained.
+        """
+        global active
+        deadline = None if timeout is None else time.monotonic() + timeout
+        undrained = set()
+        for i, q in enumerate(self.queues):
+            # Con la cola llena el put bloquearía: el plazo del drenaje vale también aquí
+            try:
+                q.put(_STOP, timeout=None if deadline is None else max(deadline - time.monotonic(), 0))
+            except queue.Full:
+                undrained.add(i)
+        for thread in self.threads:
+            thread.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+        undrained.update(i for i, thread in enumerate(self.threads) if thread.is_alive())
+        self.undrained = sorted(undrained)
+        if active is self:
+            active = None
+        return not self.undrained
+
+    def depths(self):
+        return [q.qsize() for q in self.queues]
+
+    def stats(self):
+        return {'shards': len(self.queues), 'queue_depth': self.depths(), 'processed': list(self.processed)}
@@ -0,0 +1,323 @@
+"""
+Métricas en formato de texto de Prometheus, sin dependencias externas.
+
+Tres fuentes:
+- Hooks de Flask sobre auth_bp/ticket_bp/gate_bp: latencia por ruta (histograma) y
+  peticiones por ruta y código de estado.
+- Eventos del engine de SQLAlchemy: consultas y su duración por tipo de
+  sentencia, y espera por una conexión del pool.
+- Contadores del listener y de NotificationClient (ver socket_listener.py).
+
+La app web los expone en /metrics; el listener, que es otro proceso, en su
+propio puerto (LISTENER_METRICS_PORT). Con METRICS_ENABLED=false no se
+registra ningún hook ni evento. Los valores son por proceso: con gunicorn
+cada worker lleva los suyos y se distinguen por la etiqueta pid.
+"""
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = ('pid',) + tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return (os.getpid(),) + tuple(labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Valor fijado con set(), o leído al exportar si se pasa collect (devuelve {labels: valor})."""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def set(self, value, labels=()):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self):
+        if self.collect is not None:
+            try:
+                values = self.collect()
+            except Exception:
+                values = {}
+            with self._lock:
+                self._values = {self._key(labels): value for labels, value in values.items()}
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, labels=()):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, (list(state[0]), state[1], state[2])) for labels, state in self._values.items()]
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = _format_labels(self.labelnames, labels, [('le', bound)])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _format_labels(self.labelnames, labels, [('le', '+Inf')])
+            lines.append(f"{self.name}_bucket{le} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+def reset_after_fork():
+    """
+    Descarta las series heredadas del proceso padre (p. ej. el master de gunicorn
+    con preload): si no, cada worker las exportaría con el pid del master. Las
+    del proceso actual se crean de nuevo con el primer inc/observe.
+    """
+    pid = os.getpid()
+    for metric in _registry:
+        with metric._lock:
+            metric._values = {key: value for key, value in metric._values.items() if key[0] == pid}
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# --- Peticiones HTTP ---
+HTTP_REQUESTS = Counter('app2_http_requests_total', "Peticiones HTTP atendidas", ('route', 'method', 'status'))
+HTTP_LATENCY = Histogram('app2_http_request_duration_seconds', "Latencia de las peticiones HTTP", ('route', 'method'))
+
+# --- Base de datos ---
+DB_QUERIES = Counter('app2_db_queries_total', "Sentencias SQL ejecutadas", ('statement',))
+DB_QUERY_LATENCY = Histogram('app2_db_query_duration_seconds', "Duración de las sentencias SQL", ('statement',))
+DB_POOL_WAIT = Histogram('app2_db_pool_checkout_wait_seconds', "Espera para obtener una conexión del pool")
+
+# --- Check-in en accesos ---
+GATE_SCANS = Counter('app2_gate_scans_total', "Lecturas de check-in confirmadas por el servidor", ('result',))
+
+# --- Listener ---
+LISTENER_RECEIVED = Counter('app2_listener_messages_received_total', "Mensajes recibidos por el listener")
+LISTENER_PROCESSED = Counter('app2_listener_messages_processed_total', "Mensajes persistidos o descartados como duplicados")
+LISTENER_FAILED = Counter('app2_listener_messages_failed_total', "Mensajes que fallaron (JSON inválido o error de BD)")
+LISTENER_LAG = Histogram(
+    'app2_listener_lag_seconds',
+    "Desde que llega el mensaje (o desde su campo sent_at, si lo trae) hasta el commit"
+)
+
+
+def _notification_stats():
+    # Solo si este proceso ya creó el sender (leer las stats no debe arrancar su hilo)
+    from . import notification_client
+    sender = notification_client._sender
+    if sender is None or sender.pid != os.getpid():
+        return {}
+    return {(key,): value for key, value in sender.stats().items() if isinstance(value, (int, float))}
+
+
+def _shard_depths():
+    from . import listener_shards
+    dispatcher = listener_shards.active
+    if dispatcher is None:
+        return {}
+    return {(shard,): depth for shard, depth in enumerate(dispatcher.depths())}
+
+
+def _ingest_cache_stats():
+    from .ingest_cache import ingest_cache, event_ids
+    stats = {(key,): value for key, value in ingest_cache.stats().items()}
+    stats.update({(f'event_{key}',): value for key, value in event_ids.stats().items()})
+    return stats
+
+
+NOTIFICATION_SENDER = Gauge(
+    'app2_notification_sender', "Contadores y cola del sender de notificaciones al middleware",
+    ('stat',), collect=_notification_stats
+)
+LISTENER_SHARD_DEPTH = Gauge(
+    'app2_listener_shard_queue_depth', "Mensajes esperando en la cola de cada shard del listener",
+    ('shard',), collect=_shard_depths
+)
+INGEST_CACHE = Gauge('app2_ingest_cache', "Contadores del caché de ingesta", ('stat',), collect=_ingest_cache_stats)
+
+SQL_VERBS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE')
+
+
+def statement_type(statement):
+    # Se salta el comentario de enrutamiento (/* route:primary */) y espacios iniciales
+    text = statement.lstrip()
+    if text.startswith('/*'):
+        end = text.find('*/')
+        text = text[end + 2:].lstrip() if end != -1 else text
+    verb = text[:6].upper()
+    return verb if verb in SQL_VERBS else 'OTHER'
+
+
+def init_metrics(app, blueprints=('auth', 'ticket', 'gate')):
+    """Registra los hooks de Flask, los eventos del engine y la ruta /metrics."""
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timer():
+        if request.blueprint in blueprints:
+            g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('_metrics_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            HTTP_LATENCY.observe(time.perf_counter() - start, (route, request.method))
+            HTTP_REQUESTS.inc((route, request.method, response.status_code))
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render(), mimetype='text/plain; version=0.0.4')
+
+    from .models import db
+    with app.app_context():
+        instrument_engine(db.engine)
+
+
+def instrument_engine(engine):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_metrics_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('_metrics_start')
+        if starts:
+            kind = statement_type(statement)
+            DB_QUERY_LATENCY.observe(time.perf_counter() - starts.pop(), (kind,))
+            DB_QUERIES.inc((kind,))
+
+    @event.listens_for(engine, 'handle_error')
+    def _error(context):
+        # La sentencia falló: descartar su marca de inicio
+        conn = context.connection
+        if conn is not None and conn.info.get('_metrics_start'):
+            conn.info['_metrics_start'].pop()
+
+    # El pool no tiene evento "antes de pedir conexión": se envuelve connect(), y se
+    # vuelve a envolver cuando engine.dispose() lo reemplaza (p. ej. post_fork de gunicorn)
+    _instrument_pool(engine)
+    event.listen(engine, 'engine_disposed', _instrument_pool)
+
+
+def _instrument_pool(engine):
+    pool = engine.pool
+    connect = pool.connect
+
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - start)
+
+    pool.connect = timed_connect
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def start_exporter(port, host='0.0.0.0'):
+    """
+    Servidor /metrics en un hilo aparte, para procesos sin Flask sirviendo (el listener).
+    Uno por proceso: las llamadas siguientes (otro listener en el mismo proceso,
+    como en bench_listener --mode both) devuelven el mismo servidor.
+    """
+    global _exporter
+    with _exporter_lock:
+        if _exporter is not None and _exporter.pid == os.getpid():
+            return _exporter
+        reset_after_fork()
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        server.daemon_threads = True
+        server.pid = os.getpid()
+        threading.Thread(target=server.serve_forever, name='metrics-exporter', daemon=True).start()
+        _exporter = server
+        return server
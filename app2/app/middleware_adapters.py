@@ -2,17 +2,80 @@ import os
 import json
 import time
 import socket
+import asyncio
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from .framing import (LineFramer, BinaryFramer, FrameTooLarge, msgpack_available, DEFAULT_MAX_FRAME,
+                      DEFAULT_RECV_SIZE, BINARY_HANDSHAKE, HANDSHAKE_REFUSED)
+from .feed_ack import FeedSession, DEFAULT_WINDOW, DEFAULT_ACK_EVERY
 
 
 class MiddlewareAdapter:
+    # El callback recibe (frame, ack): ack es None salvo que el productor haya
+    # pedido confirmaciones (ver feed_ack.py), y entonces hay que llamarlo con
+    # ok=True/False una vez procesado el mensaje
+    ack_window = DEFAULT_WINDOW
+    ack_every = DEFAULT_ACK_EVERY
+    # Frames binarios (framing.py) para el productor que los pida con el byte de handshake;
+    # en ese modo el frame que llega al callback ya es un dict
+    binary = True
+
     def listen(self, callback):
         raise NotImplementedError
 
+    def choose_framer(self, first):
+        """Según el primer byte de la conexión: (framer, byte de respuesta o None)."""
+        if first[:1] != BINARY_HANDSHAKE:
+            return LineFramer(self.max_frame), None
+        if self.binary and msgpack_available():
+            return BinaryFramer(), BINARY_HANDSHAKE
+        return LineFramer(self.max_frame), HANDSHAKE_REFUSED
+
+    def blocking_session(self, sock):
+        send_lock = Lock()
+
+        def send(data):
+            with send_lock:
+                sock.sendall(data)
+
+        def abort():
+            # recv() devuelve 0 en el hilo lector y la conexión se cierra
+            sock.shutdown(socket.SHUT_RDWR)
+
+        return FeedSession(send, abort, self.ack_window, self.ack_every)
+
+    def serve_blocking(self, sock, callback):
+        """Lee frames de un socket bloqueante hasta que se cierre."""
+        first = sock.recv(1, socket.MSG_PEEK)
+        if not first:
+            return
+        framer, reply = self.choose_framer(first)
+        if reply:
+            sock.recv(1)
+            sock.sendall(reply)
+        session = self.blocking_session(sock)
+        while True:
+            session.idle()
+            frames = framer.recv_into(sock)
+            if frames is None:
+                break
+            for frame in frames:
+                item = session.admit(frame)
+                if item:
+                    callback(*item)
+        if session.enabled:
+            print(f"Ack session closed: {session.stats}")
+
 
 class TCPSocketAdapter(MiddlewareAdapter):
-    def __init__(self, host, port):
+    def __init__(self, host, port, max_frame=DEFAULT_MAX_FRAME, ack_window=DEFAULT_WINDOW, ack_every=DEFAULT_ACK_EVERY,
+                 binary=True):
         self.host = host
         self.port = int(port)
+        self.max_frame = int(max_frame)
+        self.ack_window = int(ack_window)
+        self.ack_every = int(ack_every)
+        self.binary = binary
 
     def listen(self, callback):
         while True:
@@ -23,18 +86,8 @@ class TCPSocketAdapter(MiddlewareAdapter):
                     s.connect((self.host, self.port))
                     print(f"Connected to Middleware at {self.host}:{self.port}")
 
-                    buffer = ""
-                    while True:
-                        data = s.recv(1024)
-                        if not data:
-                            break
-
-                        # Assume newline delimited JSON for simplicity in generic streams
-                        buffer += data.decode('utf-8')
-                        while '\n' in buffer:
-                            line, buffer = buffer.split('\n', 1)
-                            if line.strip():
-                                callback(line.encode('utf-8'))
+                    # Assume newline delimited JSON for simplicity in generic streams
+                    self.serve_blocking(s, callback)
             except ConnectionRefusedError:
                 print(f"Connection refused by Middleware at {self.host}:{self.port}, retrying in 5s...")
                 time.sleep(5)
@@ -44,8 +97,13 @@ class TCPSocketAdapter(MiddlewareAdapter):
 
 
 class TCPServerAdapter(MiddlewareAdapter):
-    def __init__(self, port):
+    def __init__(self, port, max_frame=DEFAULT_MAX_FRAME, ack_window=DEFAULT_WINDOW, ack_every=DEFAULT_ACK_EVERY,
+                 binary=True):
         self.port = int(port)
+        self.max_frame = int(max_frame)
+        self.ack_window = int(ack_window)
+        self.ack_every = int(ack_every)
+        self.binary = binary
 
     def listen(self, callback):
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
@@ -58,29 +116,121 @@ class TCPServerAdapter(MiddlewareAdapter):
                 conn, addr = s.accept()
                 with conn:
                     print(f"Connected by {addr}")
-                    buffer = ""
-                    while True:
-                        data = conn.recv(1024)
-                        if not data:
-                            break
-                        buffer += data.decode('utf-8')
-                        while '\n' in buffer:
-                            line, buffer = buffer.split('\n', 1)
-                            if line.strip():
-                                callback(line.encode('utf-8'))
+                    try:
+                        self.serve_blocking(conn, callback)
+                    except (FrameTooLarge, ConnectionError, ValueError) as e:
+                        print(f"Closing connection from {addr}: {e}")
+
+
+class AsyncTCPServerAdapter(MiddlewareAdapter):
+    """
+    Servidor asyncio que atiende muchas conexiones de productores a la vez.
+    Cada conexión encola sus líneas en una cola acotada; si la cola está llena
+    se deja de leer ese socket (backpressure vía la ventana TCP). Un pool de
+    hilos drena la cola y ejecuta el callback, que es donde ocurre el trabajo
+    de base de datos, así el I/O de red no espera a la BD.
+    """
+    def __init__(self, port, workers=4, queue_size=1000, max_frame=DEFAULT_MAX_FRAME,
+                 ack_window=DEFAULT_WINDOW, ack_every=DEFAULT_ACK_EVERY, binary=True):
+        self.port = int(port)
+        self.workers = int(workers)
+        self.queue_size = int(queue_size)
+        self.max_frame = int(max_frame)
+        self.ack_window = int(ack_window)
+        self.ack_every = int(ack_every)
+        self.binary = binary
+        self.connections = 0
+
+    def listen(self, callback):
+        asyncio.run(self._serve(callback))
+
+    async def _serve(self, callback):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='db-worker')
+        for _ in range(self.workers):
+            loop.create_task(self._worker(queue, executor, callback))
+
+        server = await asyncio.start_server(
+            lambda reader, writer: self._handle(reader, writer, queue),
+            '0.0.0.0', self.port, backlog=1024
+        )
+        print(f"Listening (asyncio) for Ticket connections on 0.0.0.0:{self.port} "
+              f"with {self.workers} DB workers, queue size {self.queue_size}...")
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader, writer, queue):
+        addr = writer.get_extra_info('peername')
+        self.connections += 1
+        print(f"Connected by {addr} ({self.connections} active)")
+        framer = None
+        loop = asyncio.get_running_loop()
+        # Los acks salen desde los hilos de BD: se escriben a través del loop
+        session = FeedSession(
+            lambda data: loop.call_soon_threadsafe(writer.write, data),
+            lambda: loop.call_soon_threadsafe(writer.transport.abort),
+            self.ack_window, self.ack_every
+        )
+        try:
+            while True:
+                session.idle()
+                data = await reader.read(DEFAULT_RECV_SIZE)
+                # Al cerrar, un resto sin '\n' es un mensaje incompleto: se descarta
+                if not data:
+                    break
+                if framer is None:
+                    framer, reply = self.choose_framer(data)
+                    if reply:
+                        writer.write(reply)
+                        data = data[1:]
+                for frame in framer.feed(data):
+                    item = session.admit(frame)
+                    if item:
+                        # Bloquea solo a esta conexión cuando los workers van atrasados
+                        await queue.put(item)
+        except (FrameTooLarge, ConnectionError, ValueError) as e:
+            print(f"Closing connection from {addr}: {e}")
+        finally:
+            self.connections -= 1
+            if session.enabled:
+                print(f"Ack session closed for {addr}: {session.stats}")
+            writer.close()
+
+    async def _worker(self, queue, executor, callback):
+        loop = asyncio.get_running_loop()
+        while True:
+            body, ack = await queue.get()
+            try:
+                await loop.run_in_executor(executor, callback, body, ack)
+            except Exception as e:
+                print(f"Error in DB worker: {e}")
+            finally:
+                queue.task_done()
 
 
 def get_middleware_adapter():
     mw_type = os.environ.get('MIDDLEWARE_TYPE', 'tcp_server').lower()
+    max_frame = os.environ.get('MIDDLEWARE_MAX_FRAME', DEFAULT_MAX_FRAME)
+    # Solo se usan con productores que piden confirmaciones (feed_ack.py)
+    ack_window = os.environ.get('MIDDLEWARE_ACK_WINDOW', DEFAULT_WINDOW)
+    ack_every = os.environ.get('MIDDLEWARE_ACK_EVERY', DEFAULT_ACK_EVERY)
+    binary = os.environ.get('MIDDLEWARE_BINARY_FRAMING', 'true').lower() == 'true'
 
     if mw_type == 'tcp_socket':
         host = os.environ.get('MIDDLEWARE_HOST', 'middleware')
         port = os.environ.get('MIDDLEWARE_PORT', '9000')
-        return TCPSocketAdapter(host, port)
+        return TCPSocketAdapter(host, port, max_frame, ack_window, ack_every, binary)
 
     elif mw_type == 'tcp_server':
         port = os.environ.get('MIDDLEWARE_PORT', '6002')
-        return TCPServerAdapter(port)
+        return TCPServerAdapter(port, max_frame, ack_window, ack_every, binary)
+
+    elif mw_type == 'tcp_async':
+        port = os.environ.get('MIDDLEWARE_PORT', '6002')
+        workers = os.environ.get('MIDDLEWARE_WORKERS', '4')
+        queue_size = os.environ.get('MIDDLEWARE_QUEUE_SIZE', '1000')
+        return AsyncTCPServerAdapter(port, workers, queue_size, max_frame, ack_window, ack_every, binary)
 
     else:
         raise ValueError(f"Unknown middleware type: {mw_type}")
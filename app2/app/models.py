@@ -1,7 +1,7 @@
 from datetime import datetime
 import enum
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from .password_hashing import get_password_hasher
 
 db = SQLAlchemy()
 
@@ -21,18 +21,26 @@ class User(db.Model):
     # Relación con Tickets
     tickets = db.relationship('Ticket', backref='user', lazy=True)
 
+    # El hash corre en el pool de password_hashing.py; ambos pueden lanzar HashingBusy
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = get_password_hasher().generate(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return get_password_hasher().check(self.password_hash, password)
+
+class Event(db.Model):
+    # Dimensión de eventos: los tickets guardan el id, no el nombre (ver ingest_cache.EventInterner)
+    __tablename__ = 'events'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(128), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Ticket(db.Model):
     __tablename__ = 'tickets'
     id = db.Column(db.Integer, primary_key=True)
     external_id = db.Column(db.String(64), unique=True, nullable=False)
     price = db.Column(db.Float, nullable=False)
-    event_name = db.Column(db.String(128), nullable=False)
+    event_id = db.Column(db.Integer, db.ForeignKey('events.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     status = db.Column(db.Enum(TicketStatus), default=TicketStatus.PENDING_PAYMENT)
@@ -41,6 +49,34 @@ class Ticket(db.Model):
     
     # Relación con Payment (0..1)
     payment = db.relationship('Payment', backref='ticket', uselist=False, lazy=True)
+    # Many-to-one por PK: cada evento se carga una vez por sesión (identity map);
+    # no es 'joined' para que los SELECT ... FOR UPDATE no bloqueen la fila del evento
+    event = db.relationship('Event', lazy=True)
+
+    # Listado "mis tickets" paginado por keyset (más recientes primero), y conteos
+    # y snapshots por evento y estado (gate, reportes) resueltos en el índice
+    __table_args__ = (
+        db.Index('ix_tickets_user_created', 'user_rut', 'created_at', 'id'),
+        db.Index('ix_tickets_event_status', 'event_id', 'status'),
+    )
+
+    @property
+    def event_name(self):
+        return self.event.name if self.event else None
+
+class EventSales(db.Model):
+    # Conteo e importe de tickets por evento y estado, mantenido por SalesAggregates en la
+    # misma transacción que cada cambio de estado. Cada (evento, estado) se reparte en
+    # slots para que las ventas concurrentes de un mismo evento no esperen por una sola
+    # fila; el valor real es la suma de los slots.
+    __tablename__ = 'event_sales'
+    event_id = db.Column(db.Integer, db.ForeignKey('events.id'), primary_key=True, autoincrement=False)
+    status = db.Column(db.Enum(TicketStatus), primary_key=True)
+    slot = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    tickets = db.Column(db.Integer, nullable=False, default=0)
+    # DECIMAL: la suma acumulada por deltas no arrastra error de redondeo
+    amount = db.Column(db.Numeric(14, 2, asdecimal=False), nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Payment(db.Model):
     __tablename__ = 'payments'
@@ -49,4 +85,19 @@ class Payment(db.Model):
     paid_at = db.Column(db.DateTime, default=datetime.utcnow)
     payment_method = db.Column(db.String(50))
     
-    ticket_id = db.Column(db.Integer, db.ForeignKey('tickets.id'), nullable=False)
+    ticket_id = db.Column(db.Integer, db.ForeignKey('tickets.id'), unique=True, nullable=False) # 1 a 1, como en init.sql
+
+class OutboxEvent(db.Model):
+    __tablename__ = 'outbox_events'
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(32), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON serializado
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(255), nullable=True)
+    delivered_at = db.Column(db.DateTime, nullable=True)
+    # Lease del lote tomado por un relay (el envío ocurre fuera de la transacción)
+    claimed_until = db.Column(db.DateTime, nullable=True)
+
+    # El relay busca pendientes (delivered_at IS NULL) en orden de id
+    __table_args__ = (db.Index('ix_outbox_pending', 'delivered_at', 'id'),)
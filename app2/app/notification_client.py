@@ -1,39 +1,280 @@
 import socket
+import select
 import json
 import os
-from threading import Thread
+import time
+import queue
+from threading import Thread, Lock
+from .framing import encode_batch, msgpack_available, BINARY_HANDSHAKE, HANDSHAKE_REFUSED, DEFAULT_COMPRESS_MIN
+from .feed_ack import PROTOCOL as ACK_PROTOCOL
+
+
+class NotificationConnection:
+    """
+    Conexión TCP persistente hacia el middleware. Se abre bajo demanda y se
+    vuelve a abrir sola si el otro extremo la cerró o falló un envío.
+
+    Con codec 'msgpack' (MIDDLEWARE_NOTIFY_CODEC) se negocia el framing binario
+    de framing.py al conectar; si el middleware lo rechaza o no responde, la
+    conexión queda (o se reabre) en líneas JSON.
+
+    Con acks=True (el relay del outbox) cada conexión pide confirmaciones con
+    el hello de feed_ack.py y send_confirmed() vuelve recién cuando el consumidor
+    confirmó todo lo enviado. Un consumidor que no contesta el hello no sirve:
+    la conexión falla con ConnectionError en vez de enviar sin confirmaciones.
+    """
+    def __init__(self, host, port, timeout=5, codec=None, compress_min=None, acks=False):
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.codec = (codec or os.environ.get('MIDDLEWARE_NOTIFY_CODEC', 'json')).lower()
+        if compress_min is None:
+            compress_min = os.environ.get('MIDDLEWARE_NOTIFY_COMPRESS_MIN', DEFAULT_COMPRESS_MIN)
+        self.compress_min = int(compress_min)
+        self.binary = False
+        self.acks = acks
+        self._sock = None
+        self._reset_acks()
+
+    def send_lines(self, payloads):
+        """Envía todos los payloads en un solo sendall (un frame en modo binario). Lanza OSError si falla."""
+        if self._sock is None or self._is_stale():
+            self.close()
+            self._connect()
+        self._send(payloads)
+
+    def send_confirmed(self, payloads, timeout):
+        """
+        Con acks=True: envía los payloads respetando el crédito del consumidor y
+        espera el ack del último. Lanza OSError (o socket.timeout) si la conexión
+        se cae o el ack no llega a tiempo; en ese caso nada se da por confirmado.
+        """
+        deadline = time.monotonic() + timeout
+        if self._sock is None or self._is_stale():
+            self.close()
+            self._connect()
+        try:
+            start = 0
+            while start < len(payloads):
+                room = self._limit - self._sent
+                if room <= 0:
+                    self._read_ack(deadline)
+                    continue
+                self._send(payloads[start:start + room])
+                start += room
+            while self._acked < self._sent:
+                self._read_ack(deadline)
+        except (OSError, ValueError) as e:
+            # Los seq son por conexión: lo no confirmado se reenvía en una nueva
+            self.close()
+            if isinstance(e, OSError):
+                raise
+            raise ConnectionError(f"Invalid ack from middleware: {e}")
+
+    def _send(self, payloads):
+        if self.binary:
+            data = encode_batch(payloads, self.compress_min)
+        else:
+            data = "".join(json.dumps(payload) + "\n" for payload in payloads).encode('utf-8')
+        try:
+            self._sock.sendall(data)
+        except OSError:
+            self.close()
+            raise
+        self._sent += len(payloads)
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+        self._reset_acks()
+
+    def _reset_acks(self):
+        # Sin acks el crédito no se agota nunca
+        self._sent = 0
+        self._acked = 0
+        self._limit = float('inf')
+        self._ack_buffer = b''
+
+    def _read_ack(self, deadline):
+        """Lee una línea {"ack": A, "limit": L} del consumidor (con _sock en modo acks)."""
+        while b'\n' not in self._ack_buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout("No ack from middleware")
+            self._sock.settimeout(remaining)
+            try:
+                data = self._sock.recv(4096)
+            finally:
+                self._sock.settimeout(self.timeout)
+            if not data:
+                raise ConnectionError("Middleware closed the connection before acking")
+            self._ack_buffer += data
+        line, self._ack_buffer = self._ack_buffer.split(b'\n', 1)
+        reply = json.loads(line)
+        self._acked = max(self._acked, int(reply.get('ack', self._acked)))
+        self._limit = max(self._limit, int(reply.get('limit', self._limit)))
+        return reply
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.binary = False
+        if self.codec == 'msgpack' and msgpack_available():
+            try:
+                sock.sendall(BINARY_HANDSHAKE)
+                reply = sock.recv(1)
+            except socket.timeout:
+                reply = None
+            if reply == BINARY_HANDSHAKE:
+                self.binary = True
+            elif reply != HANDSHAKE_REFUSED:
+                # Sin respuesta, EOF u otro byte: no se sabe en qué estado quedó
+                # el otro extremo (ya leyó el byte), así que no se reusa este
+                # socket; se reconecta en modo JSON y no se vuelve a intentar.
+                # Con HANDSHAKE_REFUSED la conexión sigue en líneas JSON.
+                sock.close()
+                self.codec = 'json'
+                print(f" [!] No binary framing handshake from {self.host}:{self.port} "
+                      f"(reply {reply!r}), using JSON lines")
+                return self._connect()
+        self._sock = sock
+        if self.acks:
+            self._hello()
+        print(f" [->] Connected to Middleware notifications at {self.host}:{self.port}"
+              f"{' (binary frames)' if self.binary else ''}{' (acks)' if self.acks else ''}")
+
+    def _hello(self):
+        # El seq es la posición en esta conexión: cada conexión empieza en 1
+        self._reset_acks()
+        self._limit = 0
+        try:
+            self._send([{'hello': ACK_PROTOCOL, 'next_seq': 1}])
+            self._sent = 0
+            reply = self._read_ack(time.monotonic() + self.timeout)
+            if reply.get('hello') != ACK_PROTOCOL:
+                raise ConnectionError(f"Middleware does not speak {ACK_PROTOCOL}: {reply!r}")
+        except (OSError, ValueError) as e:
+            self.close()
+            if isinstance(e, OSError):
+                raise
+            raise ConnectionError(f"Middleware does not speak {ACK_PROTOCOL}: {e}")
+
+    def _is_stale(self):
+        # El middleware no responde nada por este canal: si el socket está
+        # legible es porque lo cerró (EOF) o hubo error, y el envío se perdería.
+        try:
+            readable, _, _ = select.select([self._sock], [], [], 0)
+            if not readable:
+                return False
+            return self._sock.recv(1, socket.MSG_PEEK) == b''
+        except OSError:
+            return True
+
+
+class NotificationSender:
+    """
+    Un único hilo de fondo con cola acotada: agrupa los eventos pendientes en
+    un solo sendall por flush y reintenta con backoff sin descartar el lote.
+    Si la cola se llena, los eventos nuevos se descartan y se cuentan.
+    """
+    def __init__(self, host, port, max_queue=10000, max_batch=500, max_backoff=30):
+        self.connection = NotificationConnection(host, port)
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.max_batch = max_batch
+        self.max_backoff = max_backoff
+        self.pid = os.getpid()
+        self.counters = {
+            'enqueued': 0,
+            'sent': 0,
+            'dropped': 0,
+            'send_errors': 0,
+            'flushes': 0,
+            'last_latency_ms': 0.0,
+            'max_latency_ms': 0.0,
+        }
+        self._thread = Thread(target=self._run, name='notification-sender', daemon=True)
+        self._thread.start()
+
+    def submit(self, payload):
+        try:
+            self.queue.put_nowait((time.monotonic(), payload))
+            self.counters['enqueued'] += 1
+        except queue.Full:
+            self.counters['dropped'] += 1
+            print(f" [!] Notification queue full, dropping {payload['type']}")
+
+    def stats(self):
+        return dict(self.counters, queue_depth=self.queue.qsize())
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            payloads = [payload for _, payload in batch]
+            backoff = 0.5
+            while True:
+                try:
+                    self.connection.send_lines(payloads)
+                    break
+                except OSError as e:
+                    self.counters['send_errors'] += 1
+                    print(f" [!] Failed to send {len(payloads)} notifications: {e}, retrying in {backoff:.1f}s")
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+
+            # Latencia desde que se encoló el evento más antiguo del lote hasta que salió por el socket
+            latency_ms = (time.monotonic() - batch[0][0]) * 1000
+            self.counters['sent'] += len(payloads)
+            self.counters['flushes'] += 1
+            self.counters['last_latency_ms'] = latency_ms
+            self.counters['max_latency_ms'] = max(self.counters['max_latency_ms'], latency_ms)
+
+
+_sender = None
+_sender_lock = Lock()
+
 
 class NotificationClient:
     @staticmethod
     def send_event(event_type, ticket_data):
         """
-        Envía una notificación al middleware de forma asíncrona (fuego y olvido)
-        para no bloquear la petición web del usuario.
+        Encola una notificación para el middleware (fuego y olvido) para no
+        bloquear la petición web del usuario. El envío lo hace NotificationSender.
         """
         payload = {
             "type": event_type,
             "data": ticket_data,
             "timestamp": str(os.times()) # Simple timestamp
         }
-        
-        # Ejecutar en un hilo separado para no bloquear
-        thread = Thread(target=NotificationClient._send_internal, args=(payload,))
-        thread.start()
+        NotificationClient._get_sender().submit(payload)
 
     @staticmethod
-    def _send_internal(payload):
-        host = os.environ.get('MIDDLEWARE_NOTIFY_HOST', '172.17.0.1')
-        port = int(os.environ.get('MIDDLEWARE_NOTIFY_PORT', 7002))
-        
-        print(f" [->] Sending notification to Middleware at {host}:{port}...")
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(5) # Timeout de 5 segundos
-                s.connect((host, port))
-                
-                message = json.dumps(payload) + "\n"
-                s.sendall(message.encode('utf-8'))
-                print(f" [->] Notification Sent: {payload['type']}")
-        except Exception as e:
-            print(f" [!] Failed to send notification: {e}")
+    def stats():
+        """Contadores del sender: profundidad de cola, descartes, errores y latencia de envío."""
+        return NotificationClient._get_sender().stats()
 
+    @staticmethod
+    def _get_sender():
+        global _sender
+        # Tras un fork (p. ej. workers del servidor WSGI) el hilo no existe en el hijo
+        if _sender is None or _sender.pid != os.getpid():
+            with _sender_lock:
+                if _sender is None or _sender.pid != os.getpid():
+                    host = os.environ.get('MIDDLEWARE_NOTIFY_HOST', '172.17.0.1')
+                    port = int(os.environ.get('MIDDLEWARE_NOTIFY_PORT', 7002))
+                    max_queue = int(os.environ.get('MIDDLEWARE_NOTIFY_QUEUE_SIZE', 10000))
+                    max_batch = int(os.environ.get('MIDDLEWARE_NOTIFY_BATCH', 500))
+                    _sender = NotificationSender(host, port, max_queue, max_batch)
+        return _sender
@@ -0,0 +1,130 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from sqlalchemy.exc import SQLAlchemyError
+from .models import db, OutboxEvent
+from .notification_client import NotificationConnection
+from .db_routing import for_update
+
+
+class OutboxRelay:
+    """
+    Drena la tabla outbox_events hacia el middleware en orden de id. Un lote se
+    toma con SELECT ... FOR UPDATE (al primario) solo para ponerle un lease
+    (claimed_until) y se confirma enseguida: el envío ocurre fuera de la
+    transacción, sin filas bloqueadas. Mientras el lote más antiguo tenga un
+    lease vigente ningún otro relay toma filas, así el orden se conserva.
+
+    Garantía: al menos una vez. Con OUTBOX_REQUIRE_ACK (por defecto) el lote se
+    marca entregado recién cuando el consumidor lo confirmó con el protocolo de
+    feed_ack.py; si el envío falla o el ack no llega, se libera el lease y se
+    reintenta con backoff exponencial, y si el relay muere, otro lo reenvía al
+    vencer el lease. Los reenvíos pueden duplicar eventos: de ahí el event_id.
+    Con OUTBOX_REQUIRE_ACK=false basta con que termine el sendall, y un lote que
+    quedó en el buffer del socket cuando el consumidor se cayó se pierde sin
+    error (a lo más una vez desde ahí). Las filas entregadas se purgan tras
+    OUTBOX_RETENTION_HOURS.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.batch_size = app.config.get('OUTBOX_BATCH_SIZE', 200)
+        self.poll_interval = app.config.get('OUTBOX_POLL_INTERVAL_MS', 500) / 1000.0
+        self.max_backoff = app.config.get('OUTBOX_MAX_BACKOFF_S', 60)
+        self.retention = timedelta(hours=app.config.get('OUTBOX_RETENTION_HOURS', 24))
+        self.require_ack = app.config.get('OUTBOX_REQUIRE_ACK', True)
+        self.ack_timeout = app.config.get('OUTBOX_ACK_TIMEOUT_S', 10)
+        self.lease = timedelta(seconds=app.config.get('OUTBOX_CLAIM_LEASE_S', 60))
+        host = os.environ.get('MIDDLEWARE_NOTIFY_HOST', '172.17.0.1')
+        port = int(os.environ.get('MIDDLEWARE_NOTIFY_PORT', 7002))
+        self.connection = NotificationConnection(host, port, acks=self.require_ack)
+        self.delivered = 0
+
+    def claim(self):
+        """Toma el siguiente lote con un lease. Devuelve (ids, payloads); vacío si no hay o lo tiene otro relay."""
+        now = datetime.utcnow()
+        # for_update lleva la marca de primario: sin ella ProxySQL mandaría el SELECT
+        # multilínea a una réplica y dos relays podrían tomar las mismas filas
+        rows = for_update(
+            OutboxEvent.query
+            .filter(OutboxEvent.delivered_at.is_(None))
+            .order_by(OutboxEvent.id)
+            .limit(self.batch_size)
+        ).all()
+        if not rows or (rows[0].claimed_until is not None and rows[0].claimed_until > now):
+            # Nada pendiente, o el lote más antiguo está en vuelo en otro relay
+            db.session.commit()
+            return [], []
+
+        payloads = [{
+            "type": row.event_type,
+            "data": json.loads(row.payload),
+            "timestamp": row.created_at.isoformat(),
+            # Permite al consumidor deduplicar los reenvíos
+            "event_id": row.id,
+        } for row in rows]
+        ids = [row.id for row in rows]
+        OutboxEvent.query.filter(OutboxEvent.id.in_(ids)).update(
+            {OutboxEvent.claimed_until: now + self.lease}, synchronize_session=False
+        )
+        db.session.commit()
+        return ids, payloads
+
+    def drain_once(self):
+        """Entrega un lote. Devuelve cuántos eventos se entregaron; lanza OSError si el envío falla."""
+        ids, payloads = self.claim()
+        if not ids:
+            return 0
+
+        try:
+            if self.require_ack:
+                self.connection.send_confirmed(payloads, self.ack_timeout)
+            else:
+                self.connection.send_lines(payloads)
+        except OSError as e:
+            OutboxEvent.query.filter(OutboxEvent.id.in_(ids)).update({
+                OutboxEvent.attempts: OutboxEvent.attempts + 1,
+                OutboxEvent.last_error: str(e)[:255],
+                OutboxEvent.claimed_until: None,
+            }, synchronize_session=False)
+            db.session.commit()
+            raise
+
+        OutboxEvent.query.filter(OutboxEvent.id.in_(ids)).update(
+            {OutboxEvent.delivered_at: datetime.utcnow()}, synchronize_session=False
+        )
+        db.session.commit()
+        self.delivered += len(ids)
+        return len(ids)
+
+    def prune(self):
+        cutoff = datetime.utcnow() - self.retention
+        deleted = OutboxEvent.query.filter(OutboxEvent.delivered_at < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+        if deleted:
+            print(f" [outbox] Pruned {deleted} delivered events older than {cutoff.isoformat()}")
+        return deleted
+
+    def run_forever(self):
+        print(f" [*] Starting Outbox Relay (batch {self.batch_size}, poll {self.poll_interval:.2f}s)...")
+        backoff = self.poll_interval
+        last_prune = 0
+        while True:
+            sent = 0
+            with self.app.app_context():
+                try:
+                    sent = self.drain_once()
+                    backoff = self.poll_interval
+                    if time.monotonic() - last_prune > 3600:
+                        self.prune()
+                        last_prune = time.monotonic()
+                except (OSError, SQLAlchemyError) as e:
+                    db.session.rollback()
+                    backoff = min(backoff * 2, self.max_backoff)
+                    print(f" [!] Outbox delivery failed: {e}, retrying in {backoff:.1f}s")
+                    time.sleep(backoff)
+                    continue
+            if sent:
+                print(f" [outbox] Delivered {sent} events ({self.delivered} total)")
+            else:
+                time.sleep(self.poll_interval)
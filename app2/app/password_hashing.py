@@ -0,0 +1,117 @@
+"""
+Hashing de contraseñas fuera del hilo de la petición.
+
+PBKDF2/scrypt consumen decenas de ms de CPU con el GIL tomado: una avalancha
+de logins antes de una venta deja sin CPU a los pagos y check-ins del mismo
+worker. Aquí el hash corre en un pool de procesos propio
+(PASSWORD_HASH_WORKERS, 0 = en línea) con control de admisión: como máximo
+PASSWORD_HASH_MAX_CONCURRENCY hashes en curso por proceso, y quien no consigue
+turno en PASSWORD_HASH_QUEUE_TIMEOUT_S recibe HashingBusy (la vista responde
+503) en vez de acumular hilos esperando.
+
+PASSWORD_HASH_METHOD usa la sintaxis de werkzeug (p. ej. pbkdf2:sha256:600000
+o scrypt:32768:8:1); vacío = el método por defecto de werkzeug. Si cambia,
+los hashes existentes se regeneran en el siguiente login (needs_rehash).
+"""
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HashingBusy(Exception):
+    """No hubo turno para hashear dentro del tiempo máximo de espera."""
+
+
+def _generate(password, method):
+    # Se ejecuta en el proceso del pool
+    if method:
+        return generate_password_hash(password, method=method)
+    return generate_password_hash(password)
+
+
+def _check(pwhash, password):
+    return check_password_hash(pwhash, password)
+
+
+class PasswordHasher:
+    def __init__(self, method=None, workers=2, max_concurrency=4, queue_timeout=2.0):
+        self.method = method or None
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self.pid = os.getpid()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._method_prefix = None
+        self.counters = {'hashes': 0, 'checks': 0, 'rejected': 0, 'rehashes': 0}
+
+    def generate(self, password):
+        self.counters['hashes'] += 1
+        return self._run(_generate, password, self.method)
+
+    def check(self, pwhash, password):
+        self.counters['checks'] += 1
+        return self._run(_check, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True si el hash fue generado con otro método o parámetros que los configurados."""
+        if self._method_prefix is None:
+            # El prefijo normalizado (método:parámetros) sale de un hash de muestra
+            self._method_prefix = self._run(_generate, '', self.method).split('$', 1)[0]
+        return pwhash.split('$', 1)[0] != self._method_prefix
+
+    def stats(self):
+        return dict(self.counters, workers=self.workers, method=self.method or 'werkzeug default')
+
+    def _run(self, fn, *args):
+        # Admisión: sin turno a tiempo se rechaza en vez de encolar sin límite
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self.counters['rejected'] += 1
+            raise HashingBusy()
+        try:
+            if not self.workers:
+                return fn(*args)
+            return self._get_pool().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def start(self):
+        """
+        Crea los procesos del pool ya. Conviene llamarlo cuando el proceso aún no
+        tiene otros hilos (post_fork de gunicorn), para que el fork sea limpio.
+        """
+        if self.workers:
+            pool = self._get_pool()
+            for future in [pool.submit(os.getpid) for _ in range(self.workers)]:
+                future.result()
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    # fork: los hijos no vuelven a importar __main__ (run.py crearía otra app)
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context('fork')
+                    )
+        return self._pool
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_password_hasher():
+    global _hasher
+    # Tras un fork (workers de gunicorn) el pool del padre no sirve en el hijo
+    if _hasher is None or _hasher.pid != os.getpid():
+        with _hasher_lock:
+            if _hasher is None or _hasher.pid != os.getpid():
+                _hasher = PasswordHasher(
+                    method=os.environ.get('PASSWORD_HASH_METHOD', ''),
+                    workers=int(os.environ.get('PASSWORD_HASH_WORKERS', 2)),
+                    max_concurrency=int(os.environ.get('PASSWORD_HASH_MAX_CONCURRENCY', 4)),
+                    queue_timeout=float(os.environ.get('PASSWORD_HASH_QUEUE_TIMEOUT_S', 2)),
+                )
+    return _hasher
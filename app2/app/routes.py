@@ -1,8 +1,13 @@
-from flask import Blueprint, request, jsonify, session, g, render_template, redirect, url_for, flash
-from .services import AuthService, TicketService
+import hmac
+from datetime import datetime
+from flask import Blueprint, request, jsonify, session, g, render_template, redirect, url_for, flash, current_app
+from .models import TicketStatus
+from .services import AuthService, TicketService, GateService, SalesAggregates
+from .password_hashing import HashingBusy
 
 auth_bp = Blueprint('auth', __name__)
 ticket_bp = Blueprint('ticket', __name__)
+gate_bp = Blueprint('gate', __name__, url_prefix='/api/gate')
 
 # --- Auth Routes ---
 
@@ -25,7 +30,11 @@ def register():
             flash('RUT must be a number', 'danger')
             return render_template('register.html')
 
-        user = AuthService.register(rut_int, email, full_name, password)
+        try:
+            user = AuthService.register(rut_int, email, full_name, password)
+        except HashingBusy:
+            flash('Too many requests right now, please try again in a moment', 'warning')
+            return render_template('register.html'), 503
         if user:
             flash('User registered successfully! Please login.', 'success')
             return redirect(url_for('auth.login'))
@@ -40,7 +49,11 @@ def login():
         email = request.form.get('email')
         password = request.form.get('password')
         
-        user = AuthService.login(email, password)
+        try:
+            user = AuthService.login(email, password)
+        except HashingBusy:
+            flash('Too many login attempts right now, please try again in a moment', 'warning')
+            return render_template('login.html'), 503
         if user:
             session['user_rut'] = user.rut
             flash(f'Welcome back, {user.full_name}!', 'success')
@@ -78,10 +91,49 @@ def my_tickets():
         flash('Please login to view your tickets', 'warning')
         return redirect(url_for('auth.login'))
         
-    tickets = TicketService.get_user_tickets(g.user_rut)
+    cursor = request.args.get('cursor')
+    status = request.args.get('status')
+    try:
+        tickets, next_cursor = TicketService.get_user_tickets_page(
+            g.user_rut, current_app.config['MY_TICKETS_PAGE_SIZE'], cursor, status
+        )
+    except ValueError:
+        flash('Invalid page or status filter', 'warning')
+        return redirect(url_for('ticket.my_tickets'))
     # Pass the enum objects or values to the template if needed, 
     # but simpler to just pass the ticket objects.
-    return render_template('my_tickets.html', tickets=tickets)
+    return render_template('my_tickets.html', tickets=tickets, next_cursor=next_cursor,
+                           cursor=cursor, status=status, statuses=[s.value for s in TicketStatus])
+
+@ticket_bp.route('/api/my-tickets', methods=['GET'])
+def api_my_tickets():
+    if g.user_rut is None:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    limit = min(request.args.get('limit', current_app.config['MY_TICKETS_PAGE_SIZE'], type=int), 200)
+    try:
+        tickets, next_cursor = TicketService.get_user_tickets_page(
+            g.user_rut, max(limit, 1), request.args.get('cursor'), request.args.get('status')
+        )
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor or status'}), 400
+
+    return jsonify({
+        'tickets': [{
+            'id': ticket.id,
+            'external_id': ticket.external_id,
+            'event_name': ticket.event_name,
+            'price': ticket.price,
+            'status': ticket.status.value,
+            'created_at': ticket.created_at.isoformat() if ticket.created_at else None,
+            'payment': {
+                'id': ticket.payment.id,
+                'amount': ticket.payment.amount,
+                'paid_at': ticket.payment.paid_at.isoformat() if ticket.payment.paid_at else None,
+            } if ticket.payment else None,
+        } for ticket in tickets],
+        'next_cursor': next_cursor,
+    })
 
 @ticket_bp.route('/payment/<int:ticket_id>', methods=['GET'])
 def payment_page(ticket_id):
@@ -143,4 +195,71 @@ def use_ticket(ticket_id):
         flash('Ticket used! Enjoy the event.', 'success')
     else:
         flash('Could not use ticket.', 'danger')
-    return redirect(url_for('ticket.my_tickets'))
\ No newline at end of file
+    return redirect(url_for('ticket.my_tickets'))
+
+# --- Ventas por evento (desde event_sales, sin recorrer tickets) ---
+
+def sales_token_error():
+    # Igual que la API del gate: sin token configurado las rutas quedan deshabilitadas
+    expected = current_app.config.get('SALES_DASHBOARD_TOKEN')
+    if not expected:
+        return 'Sales dashboard disabled', 404
+    token = request.headers.get('X-Sales-Token') or request.args.get('token', '')
+    if not hmac.compare_digest(token, expected):
+        return 'Invalid sales token', 401
+    return None
+
+@ticket_bp.route('/api/sales', methods=['GET'])
+def api_sales():
+    error = sales_token_error()
+    if error:
+        return jsonify({'error': error[0]}), error[1]
+    return jsonify({'events': SalesAggregates.summary(), 'generated_at': datetime.utcnow().isoformat()})
+
+@ticket_bp.route('/sales', methods=['GET'])
+def sales_dashboard():
+    error = sales_token_error()
+    if error:
+        return error
+    return render_template('sales.html', events=SalesAggregates.summary(), statuses=[s.value for s in TicketStatus])
+
+# --- Gate (lectores de QR en los accesos) ---
+
+@gate_bp.before_request
+def require_gate_token():
+    tokens = current_app.config.get('GATE_API_TOKENS')
+    if not tokens:
+        return jsonify({'error': 'Gate API disabled'}), 404
+    token = request.headers.get('X-Gate-Token', '')
+    if not any(hmac.compare_digest(token, allowed) for allowed in tokens):
+        return jsonify({'error': 'Invalid gate token'}), 401
+
+@gate_bp.route('/snapshot', methods=['GET'])
+def gate_snapshot():
+    event_name = request.args.get('event')
+    if not event_name:
+        return jsonify({'error': 'event is required'}), 400
+    since = request.args.get('since')
+    if since:
+        try:
+            since = datetime.fromisoformat(since)
+        except ValueError:
+            return jsonify({'error': 'Invalid since'}), 400
+    return jsonify(GateService.event_snapshot(event_name, since or None))
+
+@gate_bp.route('/check-ins', methods=['POST'])
+def gate_check_ins():
+    data = request.get_json(silent=True) or {}
+    event_name = data.get('event')
+    scans = data.get('scans')
+    if not event_name or not isinstance(scans, list) or not all(isinstance(s, str) for s in scans):
+        return jsonify({'error': 'event and scans (list of external_id) are required'}), 400
+    if len(scans) > current_app.config['GATE_MAX_BATCH']:
+        return jsonify({'error': f"At most {current_app.config['GATE_MAX_BATCH']} scans per batch"}), 413
+    if not scans:
+        return jsonify({'results': []})
+    return jsonify({'results': GateService.check_in_batch(event_name, scans)})
+
+@gate_bp.route('/stats', methods=['GET'])
+def gate_stats():
+    return jsonify(GateService.stats())
@@ -1,6 +1,18 @@
-from datetime import datetime
-from .models import db, User, Ticket, Payment, TicketStatus
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from threading import Lock
+from flask import current_app
+from sqlalchemy import or_, and_, func, insert, literal
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from .models import db, User, Ticket, Payment, TicketStatus, OutboxEvent, Event, EventSales
 from .notification_client import NotificationClient
+from .db_routing import on_primary, for_update
+from .ingest_cache import ingest_cache, event_ids
+from .password_hashing import get_password_hasher
+from . import metrics
 
 class PaymentGateway:
     @staticmethod
@@ -15,19 +27,189 @@ class PaymentGateway:
         print(f"Refunding transaction {transaction_id}")
         return True
 
+class EventPublisher:
+    """
+    Publica eventos hacia el middleware según NOTIFICATION_MODE:
+    - 'outbox': stage() agrega la fila al outbox en la transacción en curso
+      (llamar antes del commit); run_outbox_relay.py la entrega después.
+    - 'direct': after_commit() la envía con NotificationClient (sin garantía).
+    """
+    @staticmethod
+    def stage(event_type, data):
+        if current_app.config.get('NOTIFICATION_MODE', 'outbox') == 'outbox':
+            db.session.add(OutboxEvent(event_type=event_type, payload=json.dumps(data)))
+
+    @staticmethod
+    def after_commit(event_type, data):
+        if current_app.config.get('NOTIFICATION_MODE', 'outbox') == 'direct':
+            NotificationClient.send_event(event_type, data)
+
+class SalesAggregates:
+    """
+    Mantiene event_sales: cada cambio de estado de un ticket se registra con
+    record() antes del commit de la misma transacción, así el resumen por evento
+    nunca diverge de tickets salvo por escrituras hechas por fuera de
+    TicketService/GateService (para eso están rebuild() y verify()).
+
+    record() recibe tuplas (event_id, estado_anterior, estado_nuevo, precio);
+    estado_anterior es None para un ticket nuevo. Los deltas se aplican con un
+    upsert por (evento, estado) sobre un slot al azar. Las herramientas que
+    siembran tickets los registran con record() y los borran con
+    delete_tickets().
+    """
+    @staticmethod
+    def record(changes):
+        deltas = {}
+        for event_id, old_status, new_status, price in changes:
+            if old_status is not None:
+                delta = deltas.setdefault((event_id, old_status), [0, 0.0])
+                delta[0] -= 1
+                delta[1] -= price
+            delta = deltas.setdefault((event_id, new_status), [0, 0.0])
+            delta[0] += 1
+            delta[1] += price
+        SalesAggregates._apply(deltas)
+
+    @staticmethod
+    def delete_tickets(*criterion):
+        """
+        Borra los tickets que cumplen el filtro descontándolos de event_sales en
+        la misma transacción (para herramientas que limpian lo que sembraron).
+        No hace commit; devuelve cuántos tickets borró.
+        """
+        rows = db.session.query(
+            Ticket.event_id, Ticket.status, func.count(Ticket.id), func.sum(Ticket.price)
+        ).filter(*criterion).group_by(Ticket.event_id, Ticket.status).all()
+        SalesAggregates._apply({(event_id, status): [-count, -float(amount or 0)]
+                                for event_id, status, count, amount in rows})
+        return Ticket.query.filter(*criterion).delete(synchronize_session=False)
+
+    @staticmethod
+    def _apply(deltas):
+        slot = random.randrange(max(current_app.config.get('SALES_AGGREGATE_SLOTS', 8), 1))
+        now = datetime.utcnow()
+        # Sin autoflush: los INSERT pendientes del llamador (ticket, usuario
+        # placeholder) deben fallar en su commit, dentro de su try/except
+        # IntegrityError, y no aquí
+        with db.session.no_autoflush:
+            # Siempre en el mismo orden, para que dos transacciones no se bloqueen en cruz
+            for (event_id, status), (count, amount) in sorted(deltas.items(), key=lambda item: (item[0][0], item[0][1].value)):
+                if count or amount:
+                    db.session.execute(SalesAggregates._upsert(event_id, status, slot, count, amount, now))
+
+    @staticmethod
+    def _upsert(event_id, status, slot, count, amount, now):
+        table = EventSales.__table__
+        values = {'event_id': event_id, 'status': status, 'slot': slot,
+                  'tickets': count, 'amount': amount, 'updated_at': now}
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('mysql', 'mariadb'):
+            from sqlalchemy.dialects.mysql import insert as mysql_insert
+            stmt = mysql_insert(table).values(**values)
+            return stmt.on_duplicate_key_update(
+                tickets=table.c.tickets + stmt.inserted.tickets,
+                amount=table.c.amount + stmt.inserted.amount,
+                updated_at=stmt.inserted.updated_at,
+            )
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        stmt = sqlite_insert(table).values(**values)
+        return stmt.on_conflict_do_update(
+            index_elements=['event_id', 'status', 'slot'],
+            set_={'tickets': table.c.tickets + stmt.excluded.tickets,
+                  'amount': table.c.amount + stmt.excluded.amount,
+                  'updated_at': stmt.excluded.updated_at},
+        )
+
+    @staticmethod
+    def summary():
+        """Resumen por evento desde event_sales: O(eventos), sin recorrer tickets."""
+        rows = db.session.query(
+            EventSales.event_id, EventSales.status, func.sum(EventSales.tickets), func.sum(EventSales.amount)
+        ).group_by(EventSales.event_id, EventSales.status).all()
+        names = dict(db.session.query(Event.id, Event.name))
+        return SalesAggregates._by_event(rows, names)
+
+    @staticmethod
+    def _by_event(rows, names):
+        events = {}
+        for event_id, status, count, amount in rows:
+            event = events.setdefault(event_id, {
+                'event_id': event_id,
+                'event': names.get(event_id),
+                'counts': {s.value: 0 for s in TicketStatus},
+                'amounts': {s.value: 0.0 for s in TicketStatus},
+            })
+            event['counts'][status.value] = int(count or 0)
+            event['amounts'][status.value] = round(float(amount or 0), 2)
+        for event in events.values():
+            counts, amounts = event['counts'], event['amounts']
+            event['issued'] = sum(counts.values())
+            event['sold'] = counts['PAID'] + counts['USED'] + counts['REFUNDED']
+            event['revenue'] = round(amounts['PAID'] + amounts['USED'], 2)
+            event['refunded_amount'] = amounts['REFUNDED']
+        return sorted(events.values(), key=lambda event: (-event['revenue'], event['event'] or ''))
+
+    @staticmethod
+    def full_scan():
+        """El mismo resumen calculado recorriendo tickets (lento; para verify)."""
+        rows = db.session.query(
+            Ticket.event_id, Ticket.status, func.count(Ticket.id), func.sum(Ticket.price)
+        ).group_by(Ticket.event_id, Ticket.status).all()
+        names = dict(db.session.query(Event.id, Event.name))
+        return SalesAggregates._by_event(rows, names)
+
+    @staticmethod
+    def rebuild():
+        """Recalcula event_sales desde tickets en una sola transacción (en el slot 0)."""
+        table = EventSales.__table__
+        db.session.execute(table.delete())
+        source = db.session.query(
+            Ticket.event_id, Ticket.status, literal(0),
+            func.count(Ticket.id), func.sum(Ticket.price), literal(datetime.utcnow())
+        ).group_by(Ticket.event_id, Ticket.status)
+        db.session.execute(insert(table).from_select(
+            ['event_id', 'status', 'slot', 'tickets', 'amount', 'updated_at'], source
+        ))
+        db.session.commit()
+
+    @staticmethod
+    def verify():
+        """Diferencias entre event_sales y un recorrido completo: lista de (evento, estado, agregado, real)."""
+        def flatten(summary):
+            return {
+                (event['event_id'], status): (event['counts'][status], event['amounts'][status])
+                for event in summary for status in event['counts']
+            }
+        aggregated = flatten(SalesAggregates.summary())
+        actual = flatten(SalesAggregates.full_scan())
+        db.session.commit()
+        zero = (0, 0.0)
+        mismatches = []
+        for key in sorted(set(aggregated) | set(actual), key=lambda k: (k[0] or 0, k[1])):
+            got, expected = aggregated.get(key, zero), actual.get(key, zero)
+            if got[0] != expected[0] or abs(got[1] - expected[1]) > 0.01:
+                mismatches.append((key[0], key[1], got, expected))
+        return mismatches
+
 class AuthService:
     @staticmethod
     def login(email, password):
         user = User.query.filter_by(email=email).first()
         # Verificar que exista, que tenga password setead (no sea placeholder) y que el password coincida
         if user and user.password_hash and user.check_password(password):
+            # Si cambió PASSWORD_HASH_METHOD, se regenera el hash con la contraseña ya verificada
+            hasher = get_password_hasher()
+            if hasher.needs_rehash(user.password_hash):
+                user.set_password(password)
+                db.session.commit()
+                hasher.counters['rehashes'] += 1
             return user
         return None
 
     @staticmethod
     def register(rut, email, full_name, password):
         # Verificar si existe por RUT primero
-        existing_user = User.query.filter_by(rut=rut).first()
+        existing_user = on_primary(User.query.filter_by(rut=rut)).first()
         
         if existing_user:
             if existing_user.password_hash:
@@ -43,7 +225,7 @@ class AuthService:
                 return existing_user
         
         # Verificar si el email ya está en uso por OTRO usuario (aunque el RUT sea nuevo)
-        if User.query.filter_by(email=email).first():
+        if on_primary(User.query.filter_by(email=email)).first():
             return None
         
         new_user = User(rut=rut, email=email, full_name=full_name)
@@ -64,38 +246,204 @@ class TicketService:
         if not user_rut:
             print("Error: Ticket received without RUT")
             return None
-        
-        user = User.query.filter_by(rut=user_rut).first()
-        if not user:
+        # Antes de cualquier escritura de la sesión: un evento nuevo se confirma aparte
+        event_id = event_ids.get_id(event_name) if isinstance(event_name, str) and event_name else None
+        if event_id is None:
+            print(f"Error: Ticket {external_id} received with invalid event {event_name!r}")
+            return None
+
+        # Camino rápido (ver ingest_cache.py): RUT conocido sin SELECT, y el ticket se
+        # inserta directo; la restricción UNIQUE de external_id detecta los duplicados.
+        if ingest_cache.has_ticket(external_id):
+            # Reintento probable: se confirma en la BD
+            existing_ticket = on_primary(Ticket.query.filter_by(external_id=external_id)).first()
+            if existing_ticket:
+                return existing_ticket
+            ingest_cache.count('stale_hits')
+            ingest_cache.forget(external_id=external_id)
+        else:
+            ingest_cache.count('queries_saved')
+
+        if ingest_cache.has_user(user_rut):
+            ingest_cache.count('queries_saved')
+        elif not on_primary(User.query.filter_by(rut=user_rut)).first():
             # Crear usuario Placeholder (sin email/password) para vincular el ticket
             # Cuando el usuario real se registre con este RUT, tomará posesión de estos tickets.
+            # Se confirma en el mismo commit que el ticket.
+            db.session.add(User(rut=user_rut, full_name="Usuario Pendiente"))
+
+        new_ticket = Ticket(
+            external_id=external_id,
+            price=float(price),
+            event_id=event_id,
+            user_rut=user_rut,
+            status=TicketStatus.PENDING_PAYMENT
+        )
+        db.session.add(new_ticket)
+        SalesAggregates.record([(event_id, None, TicketStatus.PENDING_PAYMENT, float(price))])
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Duplicado (o usuario creado por otro listener, o RUT en caché obsoleto):
+            # se descarta lo del mensaje y se resuelve con lecturas.
+            db.session.rollback()
+            ingest_cache.count('duplicate_inserts')
+            ingest_cache.forget(rut=user_rut, external_id=external_id)
+            return TicketService._receive_external_ticket_checked(json_data)
+        ingest_cache.remember([user_rut], [external_id])
+        return new_ticket
+
+    @staticmethod
+    def _receive_external_ticket_checked(json_data):
+        """Camino con lecturas previas (antes del caché); idempotente ante duplicados."""
+        external_id = json_data.get('id')
+        user_rut = json_data.get('rut')
+        event_id = event_ids.get_id(json_data.get('event', 'Unknown Event'))
+
+        # Comprobaciones de existencia en el primario: una réplica atrasada
+        # provocaría inserts duplicados
+        user = on_primary(User.query.filter_by(rut=user_rut)).first()
+        if not user:
             user = User(rut=user_rut, full_name="Usuario Pendiente")
             db.session.add(user)
             db.session.commit()
         
-        existing_ticket = Ticket.query.filter_by(external_id=external_id).first()
+        existing_ticket = on_primary(Ticket.query.filter_by(external_id=external_id)).first()
         if existing_ticket:
+            ingest_cache.remember([user.rut], [external_id])
             return existing_ticket
             
         new_ticket = Ticket(
             external_id=external_id,
-            price=float(price),
-            event_name=event_name,
+            price=float(json_data.get('price')),
+            event_id=event_id,
             user_rut=user.rut,
             status=TicketStatus.PENDING_PAYMENT
         )
         db.session.add(new_ticket)
+        SalesAggregates.record([(event_id, None, TicketStatus.PENDING_PAYMENT, new_ticket.price)])
         db.session.commit()
+        ingest_cache.remember([user.rut], [external_id])
         return new_ticket
 
+    @staticmethod
+    def receive_external_tickets_batch(messages):
+        """
+        Versión por lotes de receive_external_ticket: resuelve usuarios y
+        external_id con un IN (...) cada uno, inserta en bloque y hace un
+        único commit. Devuelve un dict con las métricas del lote.
+        """
+        stats = {
+            'received': len(messages),
+            'invalid': 0,
+            'duplicates': 0,
+            'users_created': 0,
+            'tickets_created': 0,
+            'fallback': False,
+        }
+
+        valid = []
+        new_rows = {}
+        for json_data in messages:
+            external_id = json_data.get('id')
+            try:
+                user_rut = int(json_data.get('rut'))
+                price = float(json_data.get('price'))
+            except (TypeError, ValueError):
+                user_rut = None
+            event_name = json_data.get('event', 'Unknown Event')
+            if not user_rut or external_id is None or not isinstance(event_name, str) or not event_name:
+                stats['invalid'] += 1
+                continue
+
+            valid.append(json_data)
+            if external_id in new_rows:
+                # Repetido dentro del mismo lote: gana el primero, igual que en el camino por mensaje
+                stats['duplicates'] += 1
+                continue
+            new_rows[external_id] = {
+                'external_id': external_id,
+                'price': price,
+                'event_name': event_name,
+                'user_rut': user_rut,
+                'status': TicketStatus.PENDING_PAYMENT,
+            }
+
+        if not new_rows:
+            return stats
+
+        # Un SELECT (y un INSERT por evento nuevo) para todos los nombres del lote
+        ids_by_name = event_ids.get_ids({row['event_name'] for row in new_rows.values()})
+        for external_id, row in list(new_rows.items()):
+            row['event_id'] = ids_by_name.get(row.pop('event_name'))
+            if row['event_id'] is None:
+                # Nombre que no se pudo insertar (p. ej. demasiado largo): solo se descarta esa fila
+                del new_rows[external_id]
+                stats['invalid'] += 1
+        valid = [json_data for json_data in valid if json_data.get('id') in new_rows]
+        if not new_rows:
+            return stats
+
+        ruts = {row['user_rut'] for row in new_rows.values()}
+        # Los RUTs ya conocidos por el caché no se consultan
+        unknown_ruts = {rut for rut in ruts if not ingest_cache.has_user(rut)}
+        existing_ruts = set()
+        if unknown_ruts:
+            existing_ruts = {
+                rut for (rut,) in on_primary(db.session.query(User.rut).filter(User.rut.in_(unknown_ruts)))
+            }
+        else:
+            ingest_cache.count('queries_saved')
+        new_users = [
+            {'rut': rut, 'full_name': "Usuario Pendiente"}
+            for rut in unknown_ruts - existing_ruts
+        ]
+
+        existing_ids = {
+            external_id for (external_id,) in
+            on_primary(db.session.query(Ticket.external_id).filter(Ticket.external_id.in_(list(new_rows))))
+        }
+        new_tickets = [row for external_id, row in new_rows.items() if external_id not in existing_ids]
+        stats['duplicates'] += len(existing_ids)
+
+        try:
+            if new_users:
+                db.session.bulk_insert_mappings(User, new_users)
+            if new_tickets:
+                db.session.bulk_insert_mappings(Ticket, new_tickets)
+                SalesAggregates.record([
+                    (row['event_id'], None, TicketStatus.PENDING_PAYMENT, row['price']) for row in new_tickets
+                ])
+            db.session.commit()
+            stats['users_created'] = len(new_users)
+            stats['tickets_created'] = len(new_tickets)
+            ingest_cache.remember(ruts, new_rows)
+        except IntegrityError:
+            # Otro listener insertó el mismo usuario o ticket entre el SELECT y el INSERT
+            # (o un RUT del caché quedó obsoleto): se reprocesa el lote mensaje a mensaje,
+            # que es idempotente.
+            db.session.rollback()
+            for rut in ruts:
+                ingest_cache.forget(rut=rut)
+            stats['fallback'] = True
+            stats['duplicates'] = 0
+            for json_data in valid:
+                try:
+                    TicketService.receive_external_ticket(json_data)
+                except Exception as e:
+                    db.session.rollback()
+                    stats['invalid'] += 1
+                    print(f"Error processing message in fallback: {e}")
+        return stats
+
     @staticmethod
     def process_payment(user_rut, ticket_id, payment_token="dummy_token"):
-        ticket = Ticket.query.filter_by(id=ticket_id, user_rut=user_rut).first()
-        if not ticket:
+        # Leer-y-luego-escribir: FOR UPDATE lee en el primario y bloquea la fila hasta
+        # el commit, así dos pagos concurrentes del mismo ticket no pasan ambos el chequeo
+        ticket = for_update(Ticket.query.filter_by(id=ticket_id, user_rut=user_rut)).one_or_none()
+        if not ticket or ticket.status != TicketStatus.PENDING_PAYMENT:
+            db.session.rollback() # Libera el bloqueo (no existe, ya pagado o usado)
             return False
-        
-        if ticket.status != TicketStatus.PENDING_PAYMENT:
-            return False # Ya pagado o usado
             
         if PaymentGateway.charge_credit_card(ticket.price, payment_token):
             ticket.status = TicketStatus.PAID
@@ -105,55 +453,252 @@ class TicketService:
                 ticket_id=ticket.id
             )
             db.session.add(payment)
-            db.session.commit()
-            
-            # Notify Middleware
-            NotificationClient.send_event("TICKET_PAID", {
+            SalesAggregates.record([(ticket.event_id, TicketStatus.PENDING_PAYMENT, TicketStatus.PAID, ticket.price)])
+
+            # Notify Middleware (el evento se confirma junto con el pago)
+            event = {
                 "external_id": ticket.external_id,
                 "price": ticket.price,
                 "user_rut": ticket.user_rut
-            })
+            }
+            EventPublisher.stage("TICKET_PAID", event)
+            db.session.commit()
+            EventPublisher.after_commit("TICKET_PAID", event)
             
             return True
+        db.session.rollback()
         return False
 
     @staticmethod
     def use_ticket(user_rut, ticket_id):
-        ticket = Ticket.query.filter_by(id=ticket_id, user_rut=user_rut).first()
-        if not ticket:
-            return False
-        
-        if ticket.status == TicketStatus.PAID:
-            ticket.status = TicketStatus.USED
-            db.session.commit()
-            return True
-        return False
+        # Transición atómica en un solo UPDATE condicional: solo una petición
+        # concurrente puede cambiar PAID -> USED (rowcount 1), el resto ve 0.
+        updated = Ticket.query.filter_by(
+            id=ticket_id, user_rut=user_rut, status=TicketStatus.PAID
+        ).update({Ticket.status: TicketStatus.USED}, synchronize_session=False)
+        if updated == 1:
+            event_id, price = on_primary(
+                db.session.query(Ticket.event_id, Ticket.price).filter(Ticket.id == ticket_id)
+            ).one()
+            SalesAggregates.record([(event_id, TicketStatus.PAID, TicketStatus.USED, price)])
+        db.session.commit()
+        return updated == 1
 
     @staticmethod
     def refund_ticket(user_rut, ticket_id):
-        ticket = Ticket.query.filter_by(id=ticket_id, user_rut=user_rut).first()
+        # Ticket y pago en una sola consulta bloqueante en el primario (sin lazy-load de ticket.payment)
+        ticket = for_update(
+            Ticket.query.options(joinedload(Ticket.payment)).filter_by(id=ticket_id, user_rut=user_rut)
+        ).one_or_none()
         if not ticket or not ticket.payment:
+            db.session.rollback()
             return False
         
         if ticket.status == TicketStatus.PAID:
             # Solo se puede devolver si está pagado y no usado
             if PaymentGateway.refund_transaction(ticket.payment.id):
                 ticket.status = TicketStatus.REFUNDED
-                db.session.commit()
-                
-                # Notify Middleware
-                NotificationClient.send_event("TICKET_REFUNDED", {
+                SalesAggregates.record([(ticket.event_id, TicketStatus.PAID, TicketStatus.REFUNDED, ticket.price)])
+
+                # Notify Middleware (el evento se confirma junto con el reembolso)
+                event = {
                     "external_id": ticket.external_id,
                     "user_rut": ticket.user_rut
-                })
+                }
+                EventPublisher.stage("TICKET_REFUNDED", event)
+                db.session.commit()
+                EventPublisher.after_commit("TICKET_REFUNDED", event)
                 
                 return True
+        db.session.rollback()
         return False
 
     @staticmethod
-    def get_user_tickets(user_rut):
-        return Ticket.query.filter_by(user_rut=user_rut).all()
+    def get_user_tickets_page(user_rut, limit=50, cursor=None, status=None):
+        """
+        Una página de tickets del usuario, más recientes primero. Pagina por
+        keyset sobre (created_at, id) usando ix_tickets_user_created, así cada
+        página cuesta lo mismo sin importar cuántos tickets tenga el usuario,
+        y carga el pago y el evento en la misma consulta (sin N+1 en la
+        plantilla). Devuelve (tickets, next_cursor); lanza ValueError si el
+        cursor o el estado no son válidos.
+        """
+        query = Ticket.query.options(joinedload(Ticket.payment), joinedload(Ticket.event)).filter(
+            Ticket.user_rut == user_rut
+        )
+        if status:
+            query = query.filter(Ticket.status == TicketStatus(status))
+        if cursor:
+            created_at, ticket_id = TicketService._decode_cursor(cursor)
+            query = query.filter(or_(
+                Ticket.created_at < created_at,
+                and_(Ticket.created_at == created_at, Ticket.id < ticket_id)
+            ))
+
+        # Se pide una fila extra solo para saber si hay página siguiente
+        tickets = query.order_by(Ticket.created_at.desc(), Ticket.id.desc()).limit(limit + 1).all()
+        next_cursor = None
+        if len(tickets) > limit:
+            tickets = tickets[:limit]
+            next_cursor = TicketService._encode_cursor(tickets[-1])
+        return tickets, next_cursor
+
+    @staticmethod
+    def _encode_cursor(ticket):
+        return f"{ticket.created_at.isoformat()}_{ticket.id}"
+
+    @staticmethod
+    def _decode_cursor(cursor):
+        created_at, _, ticket_id = cursor.rpartition('_')
+        return datetime.fromisoformat(created_at), int(ticket_id)
 
     @staticmethod
     def get_ticket(user_rut, ticket_id):
         return Ticket.query.filter_by(id=ticket_id, user_rut=user_rut).first()
+
+
+class GateService:
+    """
+    Check-in en los accesos con lectores de QR (ver gate_scanner.py). Los
+    lectores descargan un snapshot compacto de los tickets válidos del evento,
+    validan cada lectura en memoria y envían los USED por lotes;
+    check_in_batch es la verificación final del servidor y rechaza el doble
+    uso entre accesos distintos.
+    """
+    RESULTS = ('accepted', 'already_used', 'unknown', 'wrong_event', 'not_paid')
+    counters = dict.fromkeys(RESULTS + ('batches', 'fallback_batches'), 0)
+    started_at = time.monotonic()
+    _lock = Lock()
+    _snapshots = {}
+
+    @staticmethod
+    def event_snapshot(event_name, since=None):
+        """
+        Tickets PAID y USED del evento. Con since (datetime) solo los modificados
+        desde entonces, incluidos los que dejaron de ser válidos (revoked), para
+        que el lector actualice su copia. La ventana empieza GATE_DELTA_OVERLAP_S
+        antes de since truncado al segundo: updated_at se guarda sin
+        microsegundos y un cambio del mismo segundo que generated_at quedaría
+        fuera para siempre; repetir un cambio no le hace nada a la copia. Los
+        snapshots completos se comparten entre lectores durante GATE_SNAPSHOT_TTL_S.
+        """
+        ttl = current_app.config.get('GATE_SNAPSHOT_TTL_S', 0)
+        if since is None and ttl:
+            cached = GateService._snapshots.get(event_name)
+            if cached and time.monotonic() - cached[0] < ttl:
+                return cached[1]
+
+        # Se toma antes de consultar: lo que cambie durante la consulta entra en el próximo delta
+        generated_at = datetime.utcnow()
+        event_id = event_ids.get_id(event_name, create=False)
+        query = db.session.query(Ticket.external_id, Ticket.status).filter(Ticket.event_id == event_id)
+        if since is None:
+            query = query.filter(Ticket.status.in_([TicketStatus.PAID, TicketStatus.USED]))
+        else:
+            overlap = timedelta(seconds=current_app.config.get('GATE_DELTA_OVERLAP_S', 5))
+            query = query.filter(Ticket.updated_at >= since.replace(microsecond=0) - overlap)
+        snapshot = {
+            'event': event_name,
+            'generated_at': generated_at.isoformat(),
+            'full': since is None,
+            'paid': [],
+            'used': [],
+            'revoked': [],
+        }
+        for external_id, status in query:
+            key = 'paid' if status == TicketStatus.PAID else 'used' if status == TicketStatus.USED else 'revoked'
+            snapshot[key].append(external_id)
+        db.session.commit()
+
+        if since is None and ttl:
+            GateService._snapshots[event_name] = (time.monotonic(), snapshot)
+        return snapshot
+
+    @staticmethod
+    def check_in_batch(event_name, external_ids):
+        """
+        Marca como USED los tickets PAID del lote con un solo UPDATE condicional.
+        Devuelve un resultado por lectura, en el mismo orden; una lectura repetida
+        dentro del lote cuenta como already_used.
+        """
+        unique = list(dict.fromkeys(external_ids))
+        event_id = event_ids.get_id(event_name, create=False)
+        # Leer-y-luego-escribir: las filas quedan bloqueadas hasta el commit, así un
+        # lote concurrente de otro acceso espera y luego las ve USED
+        rows = for_update(
+            db.session.query(Ticket.id, Ticket.external_id, Ticket.status, Ticket.event_id, Ticket.price)
+            .filter(Ticket.external_id.in_(unique))
+        ).all()
+        found = {external_id: (ticket_id, status, row_event) for ticket_id, external_id, status, row_event, _ in rows}
+        prices = {ticket_id: price for ticket_id, _, _, _, price in rows}
+
+        outcome = {}
+        to_use = {}
+        for external_id in unique:
+            row = found.get(external_id)
+            if row is None:
+                outcome[external_id] = 'unknown'
+            elif row[2] != event_id:
+                outcome[external_id] = 'wrong_event'
+            elif row[1] == TicketStatus.USED:
+                outcome[external_id] = 'already_used'
+            elif row[1] != TicketStatus.PAID:
+                outcome[external_id] = 'not_paid'
+            else:
+                outcome[external_id] = 'accepted'
+                to_use[row[0]] = external_id
+
+        fallback = False
+        if to_use:
+            updated = Ticket.query.filter(
+                Ticket.id.in_(list(to_use)), Ticket.status == TicketStatus.PAID
+            ).update({Ticket.status: TicketStatus.USED}, synchronize_session=False)
+            if updated != len(to_use):
+                # Sin bloqueo de filas (p. ej. SQLite) otro lote ganó alguna carrera:
+                # se resuelve ticket a ticket con el UPDATE condicional de use_ticket
+                db.session.rollback()
+                fallback = True
+                for ticket_id, external_id in to_use.items():
+                    won = Ticket.query.filter_by(id=ticket_id, status=TicketStatus.PAID).update(
+                        {Ticket.status: TicketStatus.USED}, synchronize_session=False
+                    )
+                    outcome[external_id] = 'accepted' if won == 1 else 'already_used'
+        accepted = [ticket_id for ticket_id, external_id in to_use.items() if outcome[external_id] == 'accepted']
+        if accepted:
+            SalesAggregates.record([
+                (event_id, TicketStatus.PAID, TicketStatus.USED, prices[ticket_id]) for ticket_id in accepted
+            ])
+        db.session.commit()
+
+        results = []
+        seen = set()
+        tally = dict.fromkeys(GateService.RESULTS, 0)
+        for external_id in external_ids:
+            result = outcome[external_id]
+            if external_id in seen and result == 'accepted':
+                result = 'already_used'
+            seen.add(external_id)
+            results.append(result)
+            tally[result] += 1
+
+        with GateService._lock:
+            GateService.counters['batches'] += 1
+            GateService.counters['fallback_batches'] += 1 if fallback else 0
+            for result, n in tally.items():
+                GateService.counters[result] += n
+        if current_app.config.get('METRICS_ENABLED', True):
+            for result, n in tally.items():
+                if n:
+                    metrics.GATE_SCANS.inc((result,), n)
+        return results
+
+    @staticmethod
+    def stats():
+        with GateService._lock:
+            stats = dict(GateService.counters)
+        scans = sum(stats[result] for result in GateService.RESULTS)
+        elapsed = time.monotonic() - GateService.started_at
+        stats['scans'] = scans
+        stats['scans_per_s'] = round(scans / elapsed, 2) if elapsed else 0.0
+        stats['conflict_rate'] = round(stats['already_used'] / scans, 4) if scans else 0.0
+        return stats
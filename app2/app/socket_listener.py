@@ -1,22 +1,329 @@
 import json
 import os
+import sys
+import time
+import logging
+import signal
+from threading import Thread, Lock, Event, local
+from sqlalchemy.exc import OperationalError, InterfaceError
+from .models import db
 from .services import TicketService
-from .middleware_adapters import get_middleware_adapter
+from .middleware_adapters import get_middleware_adapter, AsyncTCPServerAdapter
+from .json_codec import get_decoder
+from .ingest_cache import ingest_cache
+from . import metrics
+from .sql_profiler import profiler
+from .listener_shards import ShardedDispatcher
+
+logger = logging.getLogger('app.listener')
+
+_worker = local()
+
+
+class JsonLogFormatter(logging.Formatter):
+    """Una línea JSON por registro; los campos de extra={'fields': {...}} se agregan al objeto."""
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        return json.dumps(entry, default=str)
+
+
+def configure_listener_logging(level='INFO', fmt='text'):
+    handler = logging.StreamHandler(sys.stdout)
+    if fmt == 'json':
+        handler.setFormatter(JsonLogFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    # El perfilador SQL (sql_profiler.py) escribe en el mismo stream y formato
+    for target in (logger, logging.getLogger('app.sqlprofile')):
+        target.handlers[:] = [handler]
+        target.setLevel(level.upper())
+        target.propagate = False
+
+
+def ensure_worker_context(app):
+    """
+    Deja un app context activo por hilo durante toda su vida, en vez de crear
+    uno por mensaje: cada worker reutiliza su propia sesión de BD.
+    """
+    if getattr(_worker, 'app', None) is not app:
+        ctx = app.app_context()
+        ctx.push()
+        _worker.app = app
+        _worker.ctx = ctx
+
+
+def observe_lag(data, arrived, now):
+    # Con sent_at (epoch en segundos, puesto por el productor) el lag es extremo a extremo
+    sent_at = data.get('sent_at') if isinstance(data, dict) else None
+    if isinstance(sent_at, (int, float)):
+        metrics.LISTENER_LAG.observe(max(time.time() - sent_at, 0.0))
+    else:
+        metrics.LISTENER_LAG.observe(now - arrived)
+
+
+def is_transient(error):
+    """
+    Errores que justifican que el productor reenvíe el mensaje (BD caída o
+    conexión perdida). Un mensaje con datos inválidos fallaría igual otra vez:
+    se registra y se confirma.
+    """
+    return isinstance(error, (OperationalError, InterfaceError))
+
+
+class TicketBatcher:
+    """
+    Acumula los mensajes decodificados y los persiste por lotes: se hace flush
+    al llegar a batch_size mensajes o cuando el más antiguo supera flush_interval_ms.
+    Los acks del lote (feed_ack.py) se confirman después del commit.
+    """
+    def __init__(self, app, batch_size, flush_interval_ms, record_metrics=False):
+        self.app = app
+        self.record_metrics = record_metrics
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.totals = {
+            'batches': 0,
+            'received': 0,
+            'invalid': 0,
+            'duplicates': 0,
+            'users_created': 0,
+            'tickets_created': 0,
+            'failed': 0,
+        }
+        self._pending = []
+        self._arrivals = []
+        self._acks = []
+        self._oldest = None
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._stop = Event()
+        self._timer = Thread(target=self._timer_loop, daemon=True)
+        self._timer.start()
+
+    def add(self, data, arrived=None, ack=None):
+        with self._lock:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append(data)
+            self._arrivals.append(arrived)
+            self._acks.append(ack)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        # Un solo flush a la vez; mientras tanto el socket sigue llenando _pending
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                arrivals, self._arrivals = self._arrivals, []
+                acks, self._acks = self._acks, []
+                self._oldest = None
+            if not batch:
+                return
+
+            start = time.monotonic()
+            ensure_worker_context(self.app)
+            try:
+                with profiler.unit('listener:batch'):
+                    stats = TicketService.receive_external_tickets_batch(batch)
+            except Exception as e:
+                db.session.rollback()
+                logger.error("Error processing batch of %d messages: %s", len(batch), e)
+                self.totals['failed'] += len(batch)
+                if self.record_metrics:
+                    metrics.LISTENER_FAILED.inc(amount=len(batch))
+                for ack in acks:
+                    if ack:
+                        ack(not is_transient(e))
+                return
+            for ack in acks:
+                if ack:
+                    ack(True)
+            elapsed_ms = (time.monotonic() - start) * 1000
+            if self.record_metrics:
+                metrics.LISTENER_PROCESSED.inc(amount=stats['received'] - stats['invalid'])
+                metrics.LISTENER_FAILED.inc(amount=stats['invalid'])
+                now = time.monotonic()
+                for data, arrived in zip(batch, arrivals):
+                    observe_lag(data, arrived, now)
+
+            self.totals['batches'] += 1
+            for key in ('received', 'invalid', 'duplicates', 'users_created', 'tickets_created'):
+                self.totals[key] += stats[key]
+            rate = stats['received'] / (elapsed_ms / 1000) if elapsed_ms else 0
+            logger.info(
+                "batch %d msgs: %d new, %d dup, %d users, %d invalid%s in %.1f ms (%.0f msg/s)",
+                stats['received'], stats['tickets_created'], stats['duplicates'],
+                stats['users_created'], stats['invalid'], ' (fallback)' if stats['fallback'] else '',
+                elapsed_ms, rate,
+                extra={'fields': dict(stats, elapsed_ms=round(elapsed_ms, 1))}
+            )
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    def _timer_loop(self):
+        tick = max(self.flush_interval / 2, 0.01)
+        while not self._stop.wait(tick):
+            with self._lock:
+                due = self._oldest is not None and time.monotonic() - self._oldest >= self.flush_interval
+            if due:
+                self.flush()
+
 
 class TicketSocketListener:
     def __init__(self):
         self.adapter = get_middleware_adapter()
+        self.batcher = None
+        self.shards = None
+        self.drain_timeout = None
+        self.decoder_name, self.loads = get_decoder('json')
+        self.log_sample_every = 1
+        self.stats_every = 0
+        self.record_metrics = False
+        self._received = 0
 
-    def process_message(self, body):
-        print(f" [x] Received event: {body}")
+    def process_message(self, body, ack=None):
+        self._received += 1
+        arrived = None
+        if self.record_metrics:
+            metrics.LISTENER_RECEIVED.inc()
+            arrived = time.monotonic()
+        # El cuerpo completo solo se registra en DEBUG y muestreado (1 de cada N)
+        if self._received % self.log_sample_every == 0 and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received event: %s", body)
+        if self.stats_every and self._received % self.stats_every == 0:
+            stats = ingest_cache.stats()
+            logger.info("ingest cache after %d msgs: users %.0f%% hit, tickets %.0f%% hit, %d queries saved",
+                        self._received, stats['user_hit_rate'] * 100, stats['ticket_hit_rate'] * 100,
+                        stats['queries_saved'], extra={'fields': stats})
+            if self.shards:
+                shard_stats = self.shards.stats()
+                logger.info("shard queue depths: %s", shard_stats['queue_depth'], extra={'fields': shard_stats})
         try:
-            data = json.loads(body)
-            with self.app.app_context():
-                TicketService.receive_external_ticket(data)
+            # Con frames binarios (framing.py) el adaptador entrega el mensaje ya decodificado
+            data = body if isinstance(body, dict) else self.loads(body)
+            if not isinstance(data, dict):
+                raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
         except Exception as e:
-            print(f"Error processing message: {e}")
+            logger.error("Error processing message: %s", e)
+            if self.record_metrics:
+                metrics.LISTENER_FAILED.inc()
+            # Reenviarlo no lo arregla: se confirma igual
+            if ack:
+                ack(True)
+            return
+        if self.shards:
+            self.shards.submit(data, arrived, ack)
+        else:
+            self.handle(data, arrived, self.batcher, ack)
 
-    def listen_loop(self, app):
+    def handle(self, data, arrived=None, batcher=None, ack=None):
+        """Persiste un mensaje ya decodificado (en el hilo del socket o en el de su shard)."""
+        try:
+            if batcher:
+                batcher.add(data, arrived, ack)
+                return
+            ensure_worker_context(self.app)
+            with profiler.unit('listener:message'):
+                ticket = TicketService.receive_external_ticket(data)
+            if self.record_metrics:
+                if ticket is None:
+                    metrics.LISTENER_FAILED.inc()
+                else:
+                    metrics.LISTENER_PROCESSED.inc()
+                    observe_lag(data, arrived, time.monotonic())
+            # Después del commit; un mensaje sin RUT (ticket None) también se confirma
+            if ack:
+                ack(True)
+        except Exception as e:
+            logger.error("Error processing message: %s", e)
+            if self.record_metrics:
+                metrics.LISTENER_FAILED.inc()
+            if getattr(_worker, 'app', None) is self.app:
+                db.session.rollback()
+            if ack:
+                ack(not is_transient(e))
+
+    def configure(self, app):
         self.app = app
-        print(' [*] Starting Middleware Listener...')
-        self.adapter.listen(self.process_message)
+        configure_listener_logging(app.config.get('LISTENER_LOG_LEVEL', 'INFO'),
+                                   app.config.get('LISTENER_LOG_FORMAT', 'text'))
+        self.log_sample_every = max(app.config.get('LISTENER_LOG_SAMPLE_EVERY', 1), 1)
+        self.decoder_name, self.loads = get_decoder(app.config.get('LISTENER_JSON_DECODER', 'auto'))
+
+        ingest_cache.configure(app)
+        self.stats_every = app.config.get('INGEST_CACHE_STATS_EVERY', 0)
+        warm = app.config.get('INGEST_CACHE_WARM', 0)
+        if ingest_cache.enabled and warm:
+            with app.app_context():
+                loaded = ingest_cache.warm(warm)
+            logger.info("Ingest cache warmed with %d recent tickets", loaded)
+
+        self.record_metrics = app.config.get('METRICS_ENABLED', True)
+        metrics_port = app.config.get('LISTENER_METRICS_PORT', 0)
+        if self.record_metrics and metrics_port:
+            metrics.start_exporter(metrics_port)
+            logger.info("Metrics exporter on :%d/metrics", metrics_port)
+
+        if profiler.enabled and hasattr(signal, 'SIGUSR1'):
+            # kill -USR1 <pid> escribe en el log la tabla por unidad de trabajo
+            signal.signal(signal.SIGUSR1, lambda signum, frame: logger.info(
+                "SQL profile:\n%s", profiler.summary_table()))
+            logger.info("SQL profiler on (SIGUSR1 dumps the summary)")
+
+        batch_size = app.config.get('LISTENER_BATCH_SIZE', 1)
+        flush_interval_ms = app.config.get('LISTENER_FLUSH_INTERVAL_MS', 200)
+        shards = app.config.get('LISTENER_SHARDS', 1)
+        self.drain_timeout = app.config.get('LISTENER_DRAIN_TIMEOUT_S', 25)
+        if shards > 1:
+            make_batcher = None
+            if batch_size > 1:
+                make_batcher = lambda: TicketBatcher(app, batch_size, flush_interval_ms, self.record_metrics)
+            self.shards = ShardedDispatcher(self.handle, shards, app.config.get('LISTENER_SHARD_QUEUE_SIZE', 1000),
+                                            make_batcher)
+            self.shards.start()
+            if isinstance(self.adapter, AsyncTCPServerAdapter):
+                # Con varios hilos llamando al callback se perdería el orden antes de
+                # repartir; decodificar y encolar es barato, basta con uno
+                self.adapter.workers = 1
+            logger.info("Sharded mode: %d shards by rut, queue size %d", shards,
+                        app.config.get('LISTENER_SHARD_QUEUE_SIZE', 1000))
+        elif batch_size > 1:
+            self.batcher = TicketBatcher(app, batch_size, flush_interval_ms, self.record_metrics)
+        if batch_size > 1:
+            logger.info("Batch mode: up to %d msgs or %d ms per commit", batch_size, flush_interval_ms)
+        logger.info("JSON decoder: %s", self.decoder_name)
+
+    def listen_loop(self, app):
+        self.configure(app)
+        # docker stop manda SIGTERM: salir del bucle del adaptador y drenar lo pendiente
+        signal.signal(signal.SIGTERM, _exit_on_sigterm)
+        logger.info("Starting Middleware Listener...")
+        try:
+            self.adapter.listen(self.process_message)
+        finally:
+            self.close()
+
+    def close(self):
+        if self.shards:
+            logger.info("Draining shards: %s", self.shards.stats()['queue_depth'])
+            if not self.shards.close(self.drain_timeout):
+                logger.warning("Shards not drained after %ss: shards %s, queue depth %s",
+                               self.drain_timeout, self.shards.undrained, self.shards.depths())
+            else:
+                logger.info("Shards drained")
+        if self.batcher:
+            self.batcher.close()
+
+
+def _exit_on_sigterm(signum, frame):
+    raise SystemExit(0)
@@ -0,0 +1,232 @@
+"""
+Perfilador SQL por unidad de trabajo (opcional, SQL_PROFILE_ENABLED=true).
+
+Una unidad de trabajo es una petición HTTP ("GET /my-tickets") o un mensaje /
+lote del listener ("listener:message", "listener:batch"). Por unidad se cuentan
+las sentencias, el tiempo total en la BD y cuántas veces se repite cada forma de
+sentencia (fingerprint: sin literales, con las listas IN colapsadas). Al cerrar
+la unidad:
+
+- cada sentencia que superó SQL_PROFILE_SLOW_MS ya quedó registrada en el log
+  con su duración y el punto del código de la app que la emitió;
+- una forma que se repitió más de SQL_PROFILE_N_PLUS_ONE veces se reporta como
+  posible N+1 (típico de ticket.payment o ticket.user cargados de a uno).
+
+Los totales se acumulan por unidad y summary_table() los muestra como tabla:
+la app web la sirve en /sql-profile (?reset=1 la reinicia) y el listener la
+escribe en el log al recibir SIGUSR1. Con el perfilador apagado no se registra
+ningún evento ni hook.
+"""
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger('app.sqlprofile')
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_THIS_FILE = os.path.abspath(__file__)
+
+_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:\?|%s|:\w+)\s*,?)+\)', re.I)
+_SPACES = re.compile(r'\s+')
+
+
+def fingerprint(statement):
+    """Forma normalizada de la sentencia, para agrupar las que solo cambian en sus valores."""
+    text = _COMMENT.sub(' ', statement)
+    text = _STRING.sub('?', text)
+    text = _NUMBER.sub('?', text)
+    text = _IN_LIST.sub('IN (...)', text)
+    return _SPACES.sub(' ', text).strip()
+
+
+def call_site():
+    """Primer frame del código de la app (fuera de este módulo) en la pila actual."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(_APP_DIR) and filename != _THIS_FILE:
+            return f"{os.path.relpath(filename, os.path.dirname(_APP_DIR))}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return '?'
+
+
+class _Unit:
+    def __init__(self, name):
+        self.name = name
+        self.queries = 0
+        self.db_time = 0.0
+        self.shapes = Counter()
+        self.sites = {}
+        self.slow = 0
+        self.start = time.perf_counter()
+
+
+class SQLProfiler:
+    def __init__(self, slow_ms=50, n_plus_one=5):
+        self.slow_ms = slow_ms
+        self.n_plus_one = n_plus_one
+        self.enabled = False
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._fingerprints = {}
+        self.routes = {}
+
+    def configure(self, app):
+        self.enabled = app.config.get('SQL_PROFILE_ENABLED', False)
+        self.slow_ms = app.config.get('SQL_PROFILE_SLOW_MS', 50)
+        self.n_plus_one = app.config.get('SQL_PROFILE_N_PLUS_ONE', 5)
+
+    # --- Unidades de trabajo ---
+
+    def begin(self, name):
+        self._local.unit = _Unit(name)
+
+    def end(self):
+        unit = getattr(self._local, 'unit', None)
+        if unit is None:
+            return
+        self._local.unit = None
+        elapsed = time.perf_counter() - unit.start
+        repeated = [(shape, n) for shape, n in unit.shapes.items() if n > self.n_plus_one]
+        for shape, n in repeated:
+            logger.warning("possible N+1 in %s: %d x %s (first at %s)",
+                           unit.name, n, shape[:200], unit.sites.get(shape, '?'))
+
+        with self._lock:
+            route = self.routes.get(unit.name)
+            if route is None:
+                route = self.routes[unit.name] = {
+                    'units': 0, 'queries': 0, 'max_queries': 0, 'db_time': 0.0,
+                    'elapsed': 0.0, 'slow': 0, 'n_plus_one': 0,
+                }
+            route['units'] += 1
+            route['queries'] += unit.queries
+            route['max_queries'] = max(route['max_queries'], unit.queries)
+            route['db_time'] += unit.db_time
+            route['elapsed'] += elapsed
+            route['slow'] += unit.slow
+            route['n_plus_one'] += 1 if repeated else 0
+
+    @contextmanager
+    def unit(self, name):
+        if not self.enabled:
+            yield
+            return
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end()
+
+    # --- Sentencias ---
+
+    def _fingerprint(self, statement):
+        shape = self._fingerprints.get(statement)
+        if shape is None:
+            if len(self._fingerprints) > 5000:
+                self._fingerprints.clear()
+            shape = self._fingerprints[statement] = fingerprint(statement)
+        return shape
+
+    def record(self, statement, duration):
+        unit = getattr(self._local, 'unit', None)
+        if unit is None:
+            return
+        shape = self._fingerprint(statement)
+        unit.queries += 1
+        unit.db_time += duration
+        unit.shapes[shape] += 1
+        # La pila solo se recorre la primera vez que aparece cada forma en la unidad
+        if shape not in unit.sites:
+            unit.sites[shape] = call_site()
+        if duration * 1000 >= self.slow_ms:
+            unit.slow += 1
+            logger.warning("slow query in %s: %.1f ms at %s: %s",
+                           unit.name, duration * 1000, call_site(), shape[:500])
+
+    # --- Resumen ---
+
+    def summary(self):
+        with self._lock:
+            routes = {name: dict(route) for name, route in self.routes.items()}
+        for route in routes.values():
+            units = route['units']
+            route['avg_queries'] = round(route['queries'] / units, 2)
+            route['avg_db_ms'] = round(route['db_time'] * 1000 / units, 2)
+            route['avg_ms'] = round(route['elapsed'] * 1000 / units, 2)
+            del route['db_time'], route['elapsed']
+        return routes
+
+    def summary_table(self):
+        routes = sorted(self.summary().items(), key=lambda item: -item[1]['queries'])
+        header = ('unit', 'count', 'q/avg', 'q/max', 'db ms/avg', 'ms/avg', 'slow', 'n+1')
+        rows = [(name, r['units'], r['avg_queries'], r['max_queries'], r['avg_db_ms'],
+                 r['avg_ms'], r['slow'], r['n_plus_one']) for name, r in routes]
+        width = max([len(header[0])] + [len(row[0]) for row in rows])
+        lines = [f"{header[0]:<{width}} " + ' '.join(f"{h:>9}" for h in header[1:])]
+        for row in rows:
+            lines.append(f"{row[0]:<{width}} " + ' '.join(f"{v:>9}" for v in row[1:]))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self.routes = {}
+
+
+profiler = SQLProfiler()
+
+
+def init_sql_profiler(app):
+    """Registra los eventos del engine, los hooks por petición y la ruta /sql-profile."""
+    profiler.configure(app)
+    if not profiler.enabled:
+        return
+    from flask import Response, request
+
+    @app.before_request
+    def _begin_unit():
+        rule = request.url_rule.rule if request.url_rule else 'unmatched'
+        profiler.begin(f"{request.method} {rule}")
+
+    @app.teardown_request
+    def _end_unit(exc):
+        profiler.end()
+
+    @app.route('/sql-profile')
+    def sql_profile():
+        table = profiler.summary_table()
+        if request.args.get('reset'):
+            profiler.reset()
+        return Response(table, mimetype='text/plain')
+
+    from .models import db
+    with app.app_context():
+        instrument_engine(db.engine)
+
+
+def instrument_engine(engine):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_profile_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('_profile_start')
+        if starts:
+            profiler.record(statement, time.perf_counter() - starts.pop())
+
+    @event.listens_for(engine, 'handle_error')
+    def _error(context):
+        conn = context.connection
+        if conn is not None and conn.info.get('_profile_start'):
+            conn.info['_profile_start'].pop()
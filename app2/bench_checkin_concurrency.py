@@ -0,0 +1,106 @@
+"""
+Arnés de concurrencia para el check-in: por cada ticket PAID dispara --threads
+llamadas paralelas a use_ticket (liberadas a la vez con una barrera) y cuenta
+cuántas tuvieron éxito. Más de un éxito sobre el mismo ticket es un doble uso.
+
+--impl legacy ejecuta el patrón anterior (SELECT, chequeo en Python, UPDATE)
+para comparar con el UPDATE condicional actual.
+
+Uso: python bench_checkin_concurrency.py [--tickets 50] [--threads 16] [--impl atomic|legacy]
+Usa la misma base de datos que la app (APP2_DB_* o DATABASE_URL).
+"""
+import argparse
+import time
+import uuid
+from threading import Barrier, Thread
+from app import create_app
+from app.models import db, User, Ticket, TicketStatus
+from app.services import TicketService, SalesAggregates
+from app.ingest_cache import event_ids
+
+BENCH_RUT = 990000001
+
+
+def legacy_use_ticket(user_rut, ticket_id):
+    ticket = Ticket.query.filter_by(id=ticket_id, user_rut=user_rut).first()
+    if not ticket:
+        return False
+    if ticket.status == TicketStatus.PAID:
+        ticket.status = TicketStatus.USED
+        db.session.commit()
+        return True
+    return False
+
+
+def seed(count):
+    event_id = event_ids.get_id("Benchmark Check-in")
+    if not db.session.get(User, BENCH_RUT):
+        db.session.add(User(rut=BENCH_RUT, full_name="Benchmark"))
+    prefix = f"BENCH-{uuid.uuid4().hex[:8]}"
+    tickets = [
+        Ticket(external_id=f"{prefix}-{i}", price=1000, event_id=event_id,
+               user_rut=BENCH_RUT, status=TicketStatus.PAID)
+        for i in range(count)
+    ]
+    db.session.add_all(tickets)
+    SalesAggregates.record([(event_id, None, TicketStatus.PAID, 1000)] * count)
+    db.session.commit()
+    return prefix, [ticket.id for ticket in tickets]
+
+
+def fire(app, impl, ticket_id, threads):
+    barrier = Barrier(threads)
+    results = []
+
+    def worker():
+        with app.app_context():
+            barrier.wait()
+            try:
+                results.append(impl(BENCH_RUT, ticket_id))
+            except Exception as e:
+                db.session.rollback()
+                results.append(e)
+            finally:
+                db.session.remove()
+
+    pool = [Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--impl', choices=['atomic', 'legacy'], default='atomic')
+    parser.add_argument('--keep', action='store_true', help="No borrar los tickets de prueba")
+    args = parser.parse_args()
+
+    impl = TicketService.use_ticket if args.impl == 'atomic' else legacy_use_ticket
+    app = create_app()
+    with app.app_context():
+        prefix, ticket_ids = seed(args.tickets)
+
+    successes = errors = double_spends = 0
+    start = time.perf_counter()
+    for ticket_id in ticket_ids:
+        results = fire(app, impl, ticket_id, args.threads)
+        ok = sum(1 for r in results if r is True)
+        successes += ok
+        errors += sum(1 for r in results if isinstance(r, Exception))
+        if ok > 1:
+            double_spends += 1
+    elapsed = time.perf_counter() - start
+
+    attempts = args.tickets * args.threads
+    print(f"impl={args.impl} tickets={args.tickets} threads={args.threads}")
+    print(f"attempts={attempts} in {elapsed:.2f}s ({attempts / elapsed:.0f} check-ins/s)")
+    print(f"successes={successes} errors={errors} double_spends={double_spends}")
+
+    if not args.keep:
+        with app.app_context():
+            SalesAggregates.delete_tickets(Ticket.external_id.like(f"{prefix}-%"))
+            db.session.commit()
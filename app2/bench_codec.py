@@ -0,0 +1,116 @@
+"""
+Micro-benchmark del codec del enlace TCP con el middleware: líneas JSON
+(LineFramer + decodificador JSON) contra frames binarios negociados
+(BinaryFramer: MessagePack por lotes, con y sin zlib; ver app/framing.py).
+
+Mide bytes en el cable por mensaje y costo de decodificación por mensaje
+(framing + decode, alimentando el framer en trozos de --chunk bytes como
+llegarían de recv). Necesita msgpack instalado.
+
+Uso: python bench_codec.py [--messages 200000] [--batch 1 100 500] [--chunk 65536]
+"""
+import argparse
+import json
+import random
+import time
+from app.framing import LineFramer, BinaryFramer, encode_batch, msgpack_available
+from app.json_codec import get_decoder
+
+EVENTS = ("Concierto TCP Rock", "Gala de Sockets", "Festival Async")
+
+
+def make_messages(count, seed=1):
+    rng = random.Random(seed)
+    return [{
+        "id": f"TCP-{i:08d}",
+        "rut": 11223344 + rng.randrange(50000),
+        "price": rng.choice((5000, 7500, 12000)),
+        "event": rng.choice(EVENTS),
+        "sent_at": 1700000000.0 + i / 1000.0,
+    } for i in range(count)]
+
+
+def chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def json_lines(messages):
+    return "".join(json.dumps(m) + "\n" for m in messages).encode('utf-8')
+
+
+def binary_frames(messages, batch, compress_min):
+    return b"".join(encode_batch(messages[i:i + batch], compress_min) for i in range(0, len(messages), batch))
+
+
+def decode_lines(parts, loads):
+    count = 0
+    framer = LineFramer()
+    for data in parts:
+        for frame in framer.feed(data):
+            loads(frame)
+            count += 1
+    return count
+
+
+def decode_binary(parts):
+    count = 0
+    framer = BinaryFramer()
+    for data in parts:
+        count += len(framer.feed(data))
+    return count
+
+
+def timed(fn, *args, repeat=3):
+    # Mejor de N corridas, para no medir ruido del sistema
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return count, best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--batch', type=int, nargs='+', default=[1, 100, 500], help="Mensajes por frame binario")
+    parser.add_argument('--chunk', type=int, default=65536, help="Bytes por recv simulado")
+    parser.add_argument('--compress-min', type=int, default=4096, help="Payload mínimo para comprimir con zlib")
+    args = parser.parse_args()
+    if not msgpack_available():
+        raise SystemExit("msgpack is not installed (pip install msgpack)")
+
+    messages = make_messages(args.messages)
+    n = len(messages)
+    rows = []
+
+    lines = json_lines(messages)
+    # El decodificador de la stdlib y los rápidos que estén instalados (LISTENER_JSON_DECODER)
+    names = ['json']
+    for name in ('orjson', 'ujson'):
+        try:
+            get_decoder(name)
+            names.append(name)
+        except ImportError:
+            pass
+    for name in names:
+        _, loads = get_decoder(name)
+        count, elapsed = timed(decode_lines, chunks(lines, args.chunk), loads)
+        assert count == n, (name, count)
+        rows.append((f"json lines ({name})", '-', len(lines), elapsed))
+
+    for batch in args.batch:
+        for compress_min, label in ((0, 'no'), (args.compress_min, 'zlib')):
+            data = binary_frames(messages, batch, compress_min)
+            count, elapsed = timed(decode_binary, chunks(data, args.chunk))
+            assert count == n, (batch, label, count)
+            rows.append((f"msgpack ({label})", batch, len(data), elapsed))
+
+    baseline_bytes = len(lines)
+    baseline_time = rows[0][3]
+    print(f"{n} messages, recv chunks of {args.chunk} bytes")
+    print(f"{'codec':<22} {'batch':>6} {'bytes/msg':>10} {'vs json':>8} {'decode us/msg':>14} {'vs json':>8} {'msgs/s':>11}")
+    for name, batch, size, elapsed in rows:
+        print(f"{name:<22} {batch:>6} {size / n:>10.1f} {size / baseline_bytes:>8.2f} "
+              f"{elapsed / n * 1e6:>14.3f} {elapsed / baseline_time:>8.2f} {n / elapsed:>11.0f}")
@@ -0,0 +1,72 @@
+"""
+Micro-benchmark del framing de mensajes: compara el bucle original
+(decode + split de str + encode por línea) contra LineFramer, para ráfagas
+de varios MB de líneas JSON pequeñas.
+
+Uso: python bench_framing.py [--mb 1 8 32] [--chunk 1024 65536 262144]
+"""
+import argparse
+import json
+import time
+from app.framing import LineFramer
+
+
+def make_burst(size_mb):
+    lines = []
+    total = 0
+    i = 0
+    while total < size_mb * 1024 * 1024:
+        line = json.dumps({"id": f"TCP-{i}", "rut": 11223344 + i % 5000, "price": 7500, "event": "Concierto TCP Rock"}) + "\n"
+        lines.append(line)
+        total += len(line)
+        i += 1
+    return "".join(lines).encode('utf-8'), i
+
+
+def chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def legacy_framing(parts):
+    count = 0
+    buffer = ""
+    for data in parts:
+        buffer += data.decode('utf-8')
+        while '\n' in buffer:
+            line, buffer = buffer.split('\n', 1)
+            if line.strip():
+                line.encode('utf-8')
+                count += 1
+    return count
+
+
+def line_framer(parts):
+    count = 0
+    framer = LineFramer()
+    for data in parts:
+        count += len(framer.feed(data))
+    return count
+
+
+def run(fn, parts, total_bytes):
+    start = time.perf_counter()
+    count = fn(parts)
+    elapsed = time.perf_counter() - start
+    return count, elapsed, total_bytes / elapsed / (1024 * 1024)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mb', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--chunk', type=int, nargs='+', default=[1024, 65536, 262144])
+    args = parser.parse_args()
+
+    print(f"{'MB':>4} {'chunk':>7} {'impl':>8} {'frames':>9} {'secs':>8} {'MB/s':>9} {'frames/s':>11}")
+    for size_mb in args.mb:
+        data, expected = make_burst(size_mb)
+        for chunk in args.chunk:
+            parts = chunks(data, chunk)
+            for name, fn in (('legacy', legacy_framing), ('framer', line_framer)):
+                count, elapsed, mbps = run(fn, parts, len(data))
+                assert count == expected, (name, count, expected)
+                print(f"{size_mb:>4} {chunk:>7} {name:>8} {count:>9} {elapsed:>8.3f} {mbps:>9.1f} {count / elapsed:>11.0f}")
@@ -0,0 +1,107 @@
+"""
+Reproduce un archivo de mensajes grabados (NDJSON, uno por línea) a través de
+TicketSocketListener.process_message y reporta mensajes/s, sin pasar por el
+socket. Compara el listener anterior (print de cada mensaje, json de la
+stdlib, un app context por mensaje) con el actual (logging muestreado,
+decodificador configurable, app context de larga vida por worker).
+
+Uso:
+  python bench_listener.py messages.ndjson --generate 20000   # graba un archivo de prueba
+  python bench_listener.py messages.ndjson [--mode both|legacy|current]
+
+Con SQL_PROFILE_ENABLED=true imprime al final la tabla de sentencias por
+mensaje / lote (ver app/sql_profiler.py).
+
+Usa la misma base de datos que la app (APP2_DB_* o DATABASE_URL). Los ids
+externos se prefijan por corrida para que cada modo inserte tickets nuevos.
+La salida por stdout de los listeners se descarta durante la medición.
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import time
+import uuid
+from app import create_app
+from app.models import db, Ticket
+from app.services import TicketService, SalesAggregates
+from app.socket_listener import TicketSocketListener
+from app.sql_profiler import profiler
+
+
+class LegacyListener(TicketSocketListener):
+    """process_message tal como estaba antes de este cambio."""
+    def process_message(self, body):
+        print(f" [x] Received event: {body}")
+        try:
+            data = json.loads(body)
+            with self.app.app_context():
+                TicketService.receive_external_ticket(data)
+        except Exception as e:
+            print(f"Error processing message: {e}")
+
+
+def generate(path, count):
+    with open(path, 'w') as f:
+        for i in range(count):
+            f.write(json.dumps({
+                "id": f"REC-{i}",
+                "rut": random.randint(10000000, 10000000 + count // 10),
+                "price": random.choice([5000, 7500, 12000]),
+                "event": random.choice(["Concierto TCP Rock", "Gala de Sockets", "Festival Async"]),
+            }) + "\n")
+    print(f"Wrote {count} messages to {path}")
+
+
+def load(path, prefix):
+    bodies = []
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                msg = json.loads(line)
+                msg['id'] = f"{prefix}-{msg['id']}"
+                bodies.append(json.dumps(msg).encode('utf-8'))
+    return bodies
+
+
+def replay(app, listener_class, bodies):
+    listener = listener_class()
+    listener.configure(app)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        for body in bodies:
+            listener.process_message(body)
+        if listener.batcher:
+            listener.batcher.close()
+        elapsed = time.perf_counter() - start
+    return elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path')
+    parser.add_argument('--generate', type=int, help="Graba N mensajes de prueba en path y termina")
+    parser.add_argument('--mode', choices=['both', 'legacy', 'current'], default='both')
+    args = parser.parse_args()
+
+    if args.generate:
+        generate(args.path, args.generate)
+        raise SystemExit(0)
+
+    app = create_app()
+    modes = [('legacy', LegacyListener), ('current', TicketSocketListener)]
+    for name, listener_class in modes:
+        if args.mode not in ('both', name):
+            continue
+        prefix = f"BENCH-{uuid.uuid4().hex[:8]}"
+        bodies = load(args.path, prefix)
+        elapsed = replay(app, listener_class, bodies)
+        with app.app_context():
+            stored = Ticket.query.filter(Ticket.external_id.like(f"{prefix}-%")).count()
+            SalesAggregates.delete_tickets(Ticket.external_id.like(f"{prefix}-%"))
+            db.session.commit()
+        print(f"{name:>8}: {len(bodies)} msgs in {elapsed:.2f}s ({len(bodies) / elapsed:.0f} msg/s), {stored} tickets stored")
+        if profiler.enabled:
+            print(profiler.summary_table())
+            profiler.reset()
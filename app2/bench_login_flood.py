@@ -0,0 +1,165 @@
+"""
+Latencia de /pay-ticket durante una avalancha de logins concurrentes.
+
+Levanta la app en un subproceso (servidor WSGI con hilos) y, mientras
+--flooders hilos hacen POST /login sin pausa, un cliente paga tickets a
+--pay-rate por segundo y mide la latencia de cada POST /pay-ticket. Se
+repite con el hash en línea (PASSWORD_HASH_WORKERS=0, comportamiento
+anterior) y con el pool de procesos, y se comparan p50/p95/p99.
+
+Uso: python bench_login_flood.py [--flooders 16] [--duration 10] [--pay-rate 20] [--workers 2] [--out res.json]
+Usa DATABASE_URL si está definida; si no, un SQLite temporal.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import requests
+
+PASSWORD = 'bench-password'
+
+
+def serve(port):
+    from werkzeug.serving import make_server
+    from app import create_app
+    app = create_app()
+    make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+
+
+def seed(tickets):
+    """Crea el usuario del flood y un pagador con tickets pendientes (hash en línea)."""
+    os.environ['PASSWORD_HASH_WORKERS'] = '0'
+    from app import create_app
+    from app.models import db, User, Ticket, TicketStatus
+    from app.ingest_cache import event_ids
+    from app.services import SalesAggregates
+    app = create_app()
+    suffix = uuid.uuid4().hex[:8]
+    base = 900000000 + int(suffix, 16) % 90000000
+    with app.app_context():
+        db.create_all()
+        flood = User(rut=base, email=f"flood-{suffix}@bench", full_name="Flood")
+        payer = User(rut=base + 1, email=f"payer-{suffix}@bench", full_name="Payer")
+        flood.set_password(PASSWORD)
+        payer.set_password(PASSWORD)
+        db.session.add_all([flood, payer])
+        db.session.commit()
+        event_id = event_ids.get_id("Bench Login Flood")
+        rows = [Ticket(external_id=f"PAY-{suffix}-{i}", price=1000, event_id=event_id,
+                       user_rut=payer.rut, status=TicketStatus.PENDING_PAYMENT) for i in range(tickets)]
+        db.session.add_all(rows)
+        SalesAggregates.record([(event_id, None, TicketStatus.PENDING_PAYMENT, 1000)] * tickets)
+        db.session.commit()
+        return flood.email, payer.email, [row.id for row in rows]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(p / 100.0 * len(values))) - 1))]
+
+
+def run_mode(name, hash_workers, args, flood_email, payer_email, ticket_ids, port):
+    env = dict(os.environ, PASSWORD_HASH_WORKERS=str(hash_workers))
+    server = subprocess.Popen([sys.executable, __file__, '--serve', '--port', str(port)], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                requests.get(f"{base}/login", timeout=1)
+                break
+            except requests.exceptions.ConnectionError:
+                time.sleep(0.1)
+
+        payer = requests.Session()
+        r = payer.post(f"{base}/login", data={'email': payer_email, 'password': PASSWORD}, allow_redirects=False)
+        if r.status_code != 302:
+            raise SystemExit(f"El login del pagador falló ({r.status_code})")
+
+        stop = threading.Event()
+        logins = {'ok': 0, 'busy': 0, 'other': 0}
+
+        def flood():
+            session = requests.Session()
+            while not stop.is_set():
+                r = session.post(f"{base}/login", data={'email': flood_email, 'password': PASSWORD},
+                                 allow_redirects=False)
+                logins['ok' if r.status_code == 302 else 'busy' if r.status_code == 503 else 'other'] += 1
+
+        flooders = [threading.Thread(target=flood, daemon=True) for _ in range(args.flooders)]
+        for t in flooders:
+            t.start()
+        time.sleep(1)  # que la avalancha esté en régimen
+
+        latencies = []
+        interval = 1.0 / args.pay_rate
+        start = time.monotonic()
+        next_at = start
+        ids = iter(ticket_ids)
+        while time.monotonic() - start < args.duration:
+            next_at += interval
+            t0 = time.monotonic()
+            payer.post(f"{base}/pay-ticket/{next(ids)}", allow_redirects=False)
+            latencies.append((time.monotonic() - t0) * 1000)
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        elapsed = time.monotonic() - start + 1
+        stop.set()
+        for t in flooders:
+            t.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    result = {
+        'mode': name,
+        'hash_workers': hash_workers,
+        'payments': len(latencies),
+        'pay_p50_ms': round(percentile(latencies, 50), 1),
+        'pay_p95_ms': round(percentile(latencies, 95), 1),
+        'pay_p99_ms': round(percentile(latencies, 99), 1),
+        'logins_per_s': round(logins['ok'] / elapsed, 1),
+        'logins_rejected': logins['busy'],
+        'logins_other': logins['other'],
+    }
+    print(f"{name:>7}: pay p50 {result['pay_p50_ms']:.1f} ms, p95 {result['pay_p95_ms']:.1f} ms, "
+          f"p99 {result['pay_p99_ms']:.1f} ms | {result['logins_per_s']:.0f} logins/s, "
+          f"{result['logins_rejected']} rechazados (503)")
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--flooders', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--pay-rate', type=float, default=20)
+    parser.add_argument('--workers', type=int, default=2, help="Procesos del pool de hash en el modo pool")
+    parser.add_argument('--port', type=int, default=5902)
+    parser.add_argument('--out', default=None)
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        raise SystemExit(0)
+
+    os.environ.setdefault('APP2_SECRET_KEY', 'bench-login-flood')
+    if not os.environ.get('DATABASE_URL') and not os.environ.get('APP2_DB_HOST'):
+        os.environ['DATABASE_URL'] = f"sqlite:///{tempfile.mkdtemp()}/bench_login.db"
+
+    needed = int(args.pay_rate * args.duration * 2) + 10
+    flood_email, payer_email, ticket_ids = seed(needed * 2)
+    results = [
+        run_mode('inline', 0, args, flood_email, payer_email, ticket_ids[:needed], args.port),
+        run_mode('pool', args.workers, args, flood_email, payer_email, ticket_ids[needed:], args.port),
+    ]
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
@@ -0,0 +1,291 @@
+"""
+Cliente de lector de QR para el check-in en los accesos (API /api/gate).
+
+GateScanner descarga el snapshot del evento (external_id PAID y USED) a un
+dict en memoria y valida cada lectura localmente: un PAID pasa a USED en la
+copia local y queda pendiente de envío; un USED se rechaza sin ir a la red.
+Los pendientes se envían por lotes (batch_size o cada flush_interval) y el
+servidor confirma cada uno con un UPDATE condicional: si otro acceso lo usó
+primero, la lectura cuenta como conflicto. Un external_id que no está en la
+copia (p. ej. pagado después del último refresh) se consulta en línea. El
+snapshot se actualiza con deltas cada refresh_interval (el servidor solapa la
+ventana, así que un cambio puede llegar repetido) y se vuelve a descargar
+completo cada resync_interval, por si algún cambio no llegó en los deltas.
+
+Modo simulación (necesita la app corriendo con GATE_API_TOKENS y acceso a la BD
+para crear los tickets de prueba):
+  python gate_scanner.py --base-url http://localhost:5002 --token T [--tickets 20000] [--gates 4] [--rescan 0.05]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from collections import deque
+
+PAID, USED = 'P', 'U'
+
+
+class GateScanner:
+    def __init__(self, base_url, token, event, batch_size=200, flush_interval=0.5, refresh_interval=10.0,
+                 resync_interval=300.0, timeout=5.0):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.event = event
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+        self.resync_interval = resync_interval
+        self.timeout = timeout
+        self.state = {}
+        self.pending = []
+        self.generated_at = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        # Últimas lecturas locales, para los percentiles
+        self.latencies_us = deque(maxlen=100000)
+        self.counters = {
+            'scans': 0,
+            'accepted': 0,
+            'rejected_used': 0,
+            'online_checks': 0,
+            'online_rejected': 0,
+            'flushed': 0,
+            'server_conflicts': 0,
+            'server_rejected': 0,
+            'flush_errors': 0,
+            'refreshes': 0,
+            'resyncs': 0,
+        }
+
+    def _request(self, method, path, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        req = urllib.request.Request(f"{self.base_url}{path}", data=data, method=method, headers={
+            'X-Gate-Token': self.token, 'Content-Type': 'application/json',
+        })
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            return json.loads(resp.read())
+
+    def refresh(self, full=False):
+        """Snapshot completo la primera vez (o con full); después solo los cambios desde el anterior."""
+        params = {'event': self.event}
+        if self.generated_at and not full:
+            params['since'] = self.generated_at
+        snapshot = self._request('GET', f"/api/gate/snapshot?{urllib.parse.urlencode(params)}")
+        with self._lock:
+            if snapshot['full'] and self.generated_at:
+                # Reemplaza la copia: lo que ya no viene (p. ej. un reembolso que no
+                # llegó en un delta) se descarta, pero lo marcado USED aquí se conserva
+                paid = set(snapshot['paid'])
+                self.state = {external_id: USED for external_id, status in self.state.items()
+                              if status == USED and external_id in paid}
+                self.counters['resyncs'] += 1
+            # Lo marcado USED localmente (enviado o no) no vuelve a PAID por un delta atrasado
+            for external_id in snapshot['paid']:
+                if self.state.get(external_id) != USED:
+                    self.state[external_id] = PAID
+            for external_id in snapshot['used']:
+                self.state[external_id] = USED
+            for external_id in snapshot['revoked']:
+                self.state.pop(external_id, None)
+            self.generated_at = snapshot['generated_at']
+            self.counters['refreshes'] += 1
+        return len(self.state)
+
+    def scan(self, external_id):
+        """Devuelve 'accepted', 'already_used' o el resultado del servidor si no estaba en la copia local."""
+        start = time.perf_counter()
+        with self._lock:
+            self.counters['scans'] += 1
+            status = self.state.get(external_id)
+            if status == PAID:
+                self.state[external_id] = USED
+                self.pending.append(external_id)
+                self.counters['accepted'] += 1
+                result = 'accepted'
+                full = len(self.pending) >= self.batch_size
+            elif status == USED:
+                self.counters['rejected_used'] += 1
+                result = 'already_used'
+                full = False
+            else:
+                result = None
+            if result is not None:
+                self.latencies_us.append((time.perf_counter() - start) * 1e6)
+        if result is None:
+            return self._scan_online(external_id)
+        if full:
+            # El envío lo hace el hilo de fondo; sin él, aquí mismo
+            if self._thread:
+                self._wake.set()
+            else:
+                self.flush()
+        return result
+
+    def _scan_online(self, external_id):
+        result = self._request('POST', '/api/gate/check-ins', {'event': self.event, 'scans': [external_id]})['results'][0]
+        with self._lock:
+            self.counters['online_checks'] += 1
+            if result == 'accepted':
+                self.state[external_id] = USED
+                self.counters['accepted'] += 1
+            else:
+                self.counters['online_rejected'] += 1
+                if result == 'already_used':
+                    self.state[external_id] = USED
+        return result
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            if not batch:
+                return
+            try:
+                results = self._request('POST', '/api/gate/check-ins', {'event': self.event, 'scans': batch})['results']
+            except Exception:
+                # Se reintenta en el próximo flush, antes que lo nuevo
+                with self._lock:
+                    self.pending[:0] = batch
+                    self.counters['flush_errors'] += 1
+                return
+            with self._lock:
+                self.counters['flushed'] += len(batch)
+                for result in results:
+                    if result == 'already_used':
+                        self.counters['server_conflicts'] += 1
+                    elif result != 'accepted':
+                        self.counters['server_rejected'] += 1
+
+    def start(self):
+        self.refresh()
+        self._thread = threading.Thread(target=self._loop, name='gate-scanner', daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        last_refresh = last_resync = time.monotonic()
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+            if time.monotonic() - last_refresh >= self.refresh_interval:
+                last_refresh = time.monotonic()
+                full = time.monotonic() - last_resync >= self.resync_interval
+                try:
+                    self.refresh(full)
+                    if full:
+                        last_resync = last_refresh
+                except Exception:
+                    pass
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+        while True:
+            with self._lock:
+                if not self.pending or self.counters['flush_errors'] > 10:
+                    break
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters, tickets_cached=len(self.state), pending=len(self.pending))
+            latencies = sorted(self.latencies_us)
+        if latencies:
+            stats['local_scan_p50_us'] = round(latencies[len(latencies) // 2], 2)
+            stats['local_scan_p99_us'] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 2)
+        return stats
+
+
+def seed(count, event_name):
+    from app import create_app
+    from app.models import db, User, Ticket, TicketStatus
+    from app.ingest_cache import event_ids
+    from app.services import SalesAggregates
+    app = create_app()
+    rut = 980000001
+    with app.app_context():
+        if not db.session.get(User, rut):
+            db.session.add(User(rut=rut, full_name="Gate Benchmark"))
+            db.session.commit()
+        prefix = f"GATE-{uuid.uuid4().hex[:8]}"
+        event_id = event_ids.get_id(event_name)
+        db.session.bulk_insert_mappings(Ticket, [
+            {'external_id': f"{prefix}-{i}", 'price': 1000, 'event_id': event_id,
+             'user_rut': rut, 'status': TicketStatus.PAID}
+            for i in range(count)
+        ])
+        SalesAggregates.record([(event_id, None, TicketStatus.PAID, 1000)] * count)
+        db.session.commit()
+    return app, [f"{prefix}-{i}" for i in range(count)], prefix
+
+
+def cleanup(app, prefix):
+    from app.models import db, Ticket
+    from app.services import SalesAggregates
+    with app.app_context():
+        SalesAggregates.delete_tickets(Ticket.external_id.like(f"{prefix}-%"))
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--base-url', default='http://localhost:5002')
+    parser.add_argument('--token', required=True)
+    parser.add_argument('--tickets', type=int, default=20000)
+    parser.add_argument('--gates', type=int, default=4)
+    parser.add_argument('--rescan', type=float, default=0.05,
+                        help="Fracción de tickets que se vuelven a presentar en otro acceso")
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--keep', action='store_true', help="No borrar los tickets de prueba")
+    args = parser.parse_args()
+
+    event_name = f"Gate Benchmark {uuid.uuid4().hex[:6]}"
+    app, ids, prefix = seed(args.tickets, event_name)
+    scans = ids + random.sample(ids, int(len(ids) * args.rescan))
+    random.shuffle(scans)
+    lanes = [scans[i::args.gates] for i in range(args.gates)]
+
+    scanners = [GateScanner(args.base_url, args.token, event_name, args.batch_size) for _ in range(args.gates)]
+    for scanner in scanners:
+        scanner.start()
+
+    def run_gate(scanner, lane):
+        for external_id in lane:
+            scanner.scan(external_id)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=run_gate, args=(s, lane)) for s, lane in zip(scanners, lanes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    scan_elapsed = time.perf_counter() - start
+    for scanner in scanners:
+        scanner.close()
+    total_elapsed = time.perf_counter() - start
+
+    totals = {}
+    for scanner in scanners:
+        for key, value in scanner.stats().items():
+            if key in scanner.counters:
+                totals[key] = totals.get(key, 0) + value
+    p99 = max(s.stats().get('local_scan_p99_us', 0) for s in scanners)
+    print(f"{len(scans)} scans on {args.gates} gates: {len(scans) / scan_elapsed:.0f} scans/s "
+          f"(all confirmed in {total_elapsed:.2f}s), local p99 {p99:.1f} us")
+    print(f"accepted {totals['accepted']}, rejected locally {totals['rejected_used']}, "
+          f"double use caught by server {totals['server_conflicts']}, online checks {totals['online_checks']}")
+    with app.app_context():
+        from app.models import Ticket, TicketStatus
+        used = Ticket.query.filter(Ticket.external_id.like(f"{prefix}-%"), Ticket.status == TicketStatus.USED).count()
+    print(f"tickets USED in DB: {used} / {len(ids)}")
+    if not args.keep:
+        cleanup(app, prefix)
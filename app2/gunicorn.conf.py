@@ -0,0 +1,39 @@
+# Configuración de Gunicorn para servir App2 en producción (APP2_SERVER=gunicorn en start.sh).
+# Recarga en caliente sin cortar peticiones: kill -HUP <pid del master>
+import multiprocessing
+import os
+
+bind = f"{os.environ.get('APP2_RUN_HOST', '0.0.0.0')}:{os.environ.get('APP2_RUN_PORT', '5002')}"
+
+# Procesos x hilos: las vistas pasan casi todo el tiempo esperando a la BD
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+
+# Cargar la app una vez en el master y hacer fork (arranque rápido, memoria compartida)
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Reciclar workers periódicamente para acotar fugas de memoria
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    # Con preload, las conexiones abiertas en el master no deben compartirse entre procesos
+    from run import app
+    from app.models import db
+    with app.app_context():
+        db.engine.dispose()
+    # Las series de métricas creadas en el master llevan su pid: se empiezan de cero
+    from app import metrics
+    metrics.reset_after_fork()
+    # Pool de hashing de contraseñas del worker, creado antes de que arranquen sus hilos
+    from app.password_hashing import get_password_hasher
+    get_password_hasher().start()
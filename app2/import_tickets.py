@@ -0,0 +1,40 @@
+"""
+Importa (o reprocesa) tickets desde un archivo NDJSON, opcionalmente .gz,
+con el mismo formato de mensaje que recibe el listener. Ver app/bulk_import.py.
+
+Uso:
+  python import_tickets.py tickets.ndjson.gz [--chunk 5000] [--checkpoint PATH] [--restart]
+
+Si se interrumpe, volver a ejecutar el mismo comando continúa desde el último
+bloque confirmado (PATH por defecto: <archivo>.checkpoint). --restart ignora
+el checkpoint y empieza desde el inicio. Usa la misma base de datos que la app
+(APP2_DB_* o DATABASE_URL).
+"""
+import argparse
+import json
+from app import create_app
+from app.bulk_import import BulkImporter, CheckpointMismatch
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path')
+    parser.add_argument('--chunk', type=int, default=5000, help="Filas por transacción")
+    parser.add_argument('--checkpoint', default=None)
+    parser.add_argument('--restart', action='store_true')
+    parser.add_argument('--progress-every', type=float, default=5.0, help="Segundos entre reportes")
+    parser.add_argument('--decoder', default='auto', help="auto, orjson, ujson o json")
+    parser.add_argument('--out', default=None, help="Escribe los totales en JSON")
+    args = parser.parse_args()
+
+    app = create_app()
+    importer = BulkImporter(app, args.path, args.checkpoint, args.chunk, args.progress_every, args.decoder)
+    try:
+        totals = importer.run(restart=args.restart)
+    except CheckpointMismatch as e:
+        raise SystemExit(str(e))
+    except KeyboardInterrupt:
+        raise SystemExit(f"Interrupted at byte {importer.offset}; run again to resume")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(totals, f, indent=2)
@@ -0,0 +1,7 @@
+from app import create_app, init_db
+
+app = create_app()
+
+if __name__ == '__main__':
+    print("Initializing App2 database schema...")
+    init_db(app)
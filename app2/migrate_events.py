@@ -0,0 +1,110 @@
+"""
+Migra tickets.event_name (texto repetido en cada fila) a la dimensión events:
+
+1. Crea la tabla events y la columna tickets.event_id (nullable por ahora).
+2. Inserta un evento por cada event_name distinto.
+3. Rellena event_id por rangos de id (--chunk filas por transacción).
+4. Índices (event_id, status) e (user_rut, created_at, id) si faltan; en
+   MariaDB además event_id NOT NULL y la FK, en el mismo ALTER que quita
+   event_name (una sola reconstrucción de la tabla).
+
+Es idempotente: cada paso revisa el esquema actual, así que se puede volver a
+ejecutar después de un corte. El código nuevo ya no escribe event_name:
+detener app2 (web, listener y relay) antes de migrar y desplegar después.
+
+Uso: python migrate_events.py [--chunk 10000]
+Usa la misma base de datos que la app (APP2_DB_* o DATABASE_URL).
+"""
+import argparse
+import time
+from sqlalchemy import inspect, text
+from app import create_app
+from app.models import db, Event
+
+
+def index_columns(inspector, name):
+    for index in inspector.get_indexes('tickets'):
+        if index['name'] == name:
+            return index['column_names']
+    return None
+
+
+def migrate(chunk):
+    engine = db.engine
+    sqlite = engine.dialect.name == 'sqlite'
+    Event.__table__.create(engine, checkfirst=True)
+
+    columns = {column['name'] for column in inspect(engine).get_columns('tickets')}
+    if 'event_name' in columns:
+        with engine.begin() as conn:
+            if 'event_id' not in columns:
+                print("Adding tickets.event_id...")
+                conn.execute(text("ALTER TABLE tickets ADD COLUMN event_id INTEGER NULL"))
+            created = conn.execute(text(
+                "INSERT INTO events (name, created_at) "
+                "SELECT DISTINCT t.event_name, CURRENT_TIMESTAMP FROM tickets t "
+                "WHERE NOT EXISTS (SELECT 1 FROM events e WHERE e.name = t.event_name)"
+            )).rowcount
+            print(f"{created} events created")
+
+        with engine.connect() as conn:
+            max_id = conn.execute(text("SELECT MAX(id) FROM tickets")).scalar() or 0
+        start = time.monotonic()
+        updated = 0
+        for low in range(0, max_id + 1, chunk):
+            with engine.begin() as conn:
+                updated += conn.execute(text(
+                    "UPDATE tickets SET event_id = (SELECT e.id FROM events e WHERE e.name = tickets.event_name) "
+                    "WHERE id >= :low AND id < :high AND event_id IS NULL"
+                ), {'low': low, 'high': low + chunk}).rowcount
+            print(f"  backfill up to id {min(low + chunk, max_id)} / {max_id} ({updated} rows)", end='\r')
+        print(f"\nBackfilled {updated} tickets in {time.monotonic() - start:.1f}s")
+
+        with engine.connect() as conn:
+            missing = conn.execute(text("SELECT COUNT(*) FROM tickets WHERE event_id IS NULL")).scalar()
+        if missing:
+            raise SystemExit(f"{missing} tickets still without event_id; is the old app still writing?")
+
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        # La versión anterior de ix_tickets_event_status era sobre (event_name, status)
+        if index_columns(inspector, 'ix_tickets_event_status') not in (None, ['event_id', 'status']):
+            conn.execute(text("DROP INDEX ix_tickets_event_status" + ("" if sqlite else " ON tickets")))
+        if index_columns(inspector, 'ix_tickets_user_created') is None:
+            print("Creating ix_tickets_user_created...")
+            conn.execute(text("CREATE INDEX ix_tickets_user_created ON tickets (user_rut, created_at, id)"))
+
+    inspector = inspect(engine)
+    columns = {column['name'] for column in inspector.get_columns('tickets')}
+    new_index = index_columns(inspector, 'ix_tickets_event_status') is None
+    with engine.begin() as conn:
+        if sqlite:
+            # SQLite no agrega NOT NULL ni FK a una tabla existente; sí índice y DROP COLUMN (3.35+)
+            if new_index:
+                conn.execute(text("CREATE INDEX ix_tickets_event_status ON tickets (event_id, status)"))
+            if 'event_name' in columns:
+                conn.execute(text("ALTER TABLE tickets DROP COLUMN event_name"))
+        else:
+            changes = []
+            if 'event_name' in columns:
+                changes += [
+                    "MODIFY event_id INT NOT NULL",
+                    "ADD CONSTRAINT fk_tickets_event FOREIGN KEY (event_id) REFERENCES events(id)",
+                    "DROP COLUMN event_name",
+                ]
+            if new_index:
+                changes.append("ADD INDEX ix_tickets_event_status (event_id, status)")
+            if changes:
+                print("Altering tickets: " + ", ".join(changes))
+                conn.execute(text("ALTER TABLE tickets " + ", ".join(changes)))
+    print("Migration complete.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunk', type=int, default=10000, help="Filas por transacción en el backfill")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        migrate(args.chunk)
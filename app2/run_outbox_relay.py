@@ -0,0 +1,9 @@
+from app import create_app
+from app.outbox_relay import OutboxRelay
+
+app = create_app()
+relay = OutboxRelay(app)
+
+if __name__ == '__main__':
+    print("Starting Outbox Relay...")
+    relay.run_forever()
@@ -0,0 +1,41 @@
+"""
+Mantenimiento del resumen de ventas por evento (tabla event_sales, ver
+SalesAggregates en app/services.py).
+
+Uso:
+  python sales_aggregates.py verify    # compara con un recorrido completo de tickets; sale con 1 si difieren
+  python sales_aggregates.py rebuild   # recalcula event_sales desde tickets
+
+rebuild reemplaza la tabla en una sola transacción: las ventas que se confirmen
+mientras corre pueden quedar fuera (MariaDB, REPEATABLE READ) o contarse dos
+veces, así que conviene ejecutarlo con app2 detenida o volver a ejecutar verify
+después. Usa la misma base de datos que la app (APP2_DB_* o DATABASE_URL).
+"""
+import argparse
+import time
+from app import create_app
+from app.models import db, EventSales
+from app.services import SalesAggregates
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=('verify', 'rebuild'))
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        EventSales.__table__.create(db.engine, checkfirst=True)
+        start = time.monotonic()
+        if args.command == 'rebuild':
+            SalesAggregates.rebuild()
+            print(f"event_sales rebuilt in {time.monotonic() - start:.2f}s "
+                  f"({len(SalesAggregates.summary())} events)")
+        else:
+            mismatches = SalesAggregates.verify()
+            for event_id, status, got, expected in mismatches:
+                print(f"event {event_id} {status}: aggregate {got[0]} tickets / {got[1]:.2f}, "
+                      f"actual {expected[0]} tickets / {expected[1]:.2f}")
+            print(f"{len(mismatches)} mismatches ({time.monotonic() - start:.2f}s)")
+            if mismatches:
+                raise SystemExit(1)
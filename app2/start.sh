@@ -1,8 +1,22 @@
 #!/bin/bash
 
-# Start the Flask web server in the background
+# Start the web server in the background
+# APP2_SERVER=gunicorn (default): multi-process/multi-thread WSGI server, see gunicorn.conf.py
+# APP2_SERVER=flask: single-process development server
 export FLASK_APP=run.py
-flask run --host=0.0.0.0 --port=5002 &
+if [ "${APP2_SERVER:-gunicorn}" = "flask" ]; then
+    flask run --host=0.0.0.0 --port=5002 &
+else
+    gunicorn -c gunicorn.conf.py run:app &
+fi
 
-# Start the Socket Listener in the foreground
-python -u run_listener.py
\ No newline at end of file
+# Start the Outbox Relay (delivers TICKET_PAID / TICKET_REFUNDED to the middleware)
+python -u run_outbox_relay.py &
+
+# Start the Socket Listener and wait for it. bash is PID 1 and does not pass
+# docker stop's SIGTERM to its children: forward it so the listener drains its queues
+python -u run_listener.py &
+LISTENER_PID=$!
+trap 'kill -TERM $(jobs -p) 2>/dev/null' TERM INT
+wait "$LISTENER_PID"
+wait "$LISTENER_PID"
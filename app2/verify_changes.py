@@ -4,7 +4,8 @@ import os
 import unittest
 from app import create_app, db
 from app.models import User, Ticket, TicketStatus, Payment
-from app.services import AuthService, TicketService
+from app.services import AuthService, TicketService, SalesAggregates
+from app.ingest_cache import ingest_cache
 
 class TestSequenceCompliance(unittest.TestCase):
     def setUp(self):
@@ -40,7 +41,8 @@ class TestSequenceCompliance(unittest.TestCase):
         if existing_user:
             print(f"Found existing user {target_rut}. Cleaning up...")
             # Delete associated tickets first due to Foreign Key constraint
-            Ticket.query.filter_by(user_rut=target_rut).delete()
+            # (through SalesAggregates so event_sales stays in sync)
+            SalesAggregates.delete_tickets(Ticket.user_rut == target_rut)
             db.session.delete(existing_user)
             db.session.commit()
             print(f"Cleaned up existing user {target_rut} and tickets.")
@@ -90,10 +92,57 @@ class TestSequenceCompliance(unittest.TestCase):
         print("Login successful.")
         
         # 4. Verify Ticket Ownership
-        user_tickets = TicketService.get_user_tickets(target_rut)
+        user_tickets, _ = TicketService.get_user_tickets_page(target_rut)
         self.assertEqual(len(user_tickets), 1)
         self.assertEqual(user_tickets[0].external_id, "EXT999")
         print("Ticket ownership verified.")
 
+class TestIngestEdgeCases(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        SalesAggregates.delete_tickets(Ticket.external_id.like("VERIFY-%"))
+        db.session.commit()
+        db.session.remove()
+        self.app_context.pop()
+
+    def test_duplicate_external_id_cold_cache(self):
+        print("\n--- Testing redelivery of an existing external_id with a cold cache ---")
+        ticket_data = {"id": "VERIFY-DUP-1", "price": 150.0, "event": "Future Event", "rut": 12345679}
+        first = TicketService.receive_external_ticket(ticket_data)
+        self.assertIsNotNone(first)
+
+        # Como tras un reinicio del listener: ni el RUT ni el ticket en caché
+        ingest_cache.forget(rut=ticket_data["rut"], external_id=ticket_data["id"])
+        duplicates = ingest_cache.stats()['duplicate_inserts']
+        second = TicketService.receive_external_ticket(ticket_data)
+
+        self.assertIsNotNone(second)
+        self.assertEqual(second.id, first.id)
+        self.assertEqual(ingest_cache.stats()['duplicate_inserts'], duplicates + 1)
+        self.assertEqual(Ticket.query.filter_by(external_id=ticket_data["id"]).count(), 1)
+        self.assertEqual(SalesAggregates.verify(), [])
+        print("Duplicate resolved to the existing ticket.")
+
+    def test_batch_with_overlong_event_name(self):
+        print("\n--- Testing a batch with an event name longer than events.name ---")
+        messages = [
+            {"id": "VERIFY-BATCH-1", "price": 100.0, "event": "Future Event", "rut": 12345679},
+            {"id": "VERIFY-BATCH-2", "price": 100.0, "event": "x" * 300, "rut": 12345679},
+            {"id": "VERIFY-BATCH-3", "price": 100.0, "event": "Future Event", "rut": 12345679},
+        ]
+        stats = TicketService.receive_external_tickets_batch(messages)
+
+        # Solo se descarta la fila con el nombre demasiado largo
+        self.assertEqual(stats['invalid'], 1)
+        self.assertEqual(stats['tickets_created'], 2)
+        self.assertEqual(Ticket.query.filter(Ticket.external_id.like("VERIFY-BATCH-%")).count(), 2)
+        self.assertIsNone(TicketService.receive_external_ticket(messages[1]))
+        print("Overlong event name rejected, rest of the batch stored.")
+
 if __name__ == '__main__':
     unittest.main()
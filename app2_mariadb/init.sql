@@ -14,17 +14,27 @@ CREATE TABLE IF NOT EXISTS users (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Dimensión de eventos (los tickets guardan el id, no el nombre)
+CREATE TABLE IF NOT EXISTS events (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(128) NOT NULL UNIQUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Tabla de Tickets
 CREATE TABLE IF NOT EXISTS tickets (
     id INT AUTO_INCREMENT PRIMARY KEY,
     external_id VARCHAR(64) NOT NULL UNIQUE COMMENT 'Identificador del Middleware',
     price FLOAT NOT NULL,
-    event_name VARCHAR(128) NOT NULL,
+    event_id INT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     status ENUM('PENDING_PAYMENT', 'PAID', 'USED', 'REFUNDED') DEFAULT 'PENDING_PAYMENT',
     user_rut INT NOT NULL,
-    FOREIGN KEY (user_rut) REFERENCES users(rut)
+    FOREIGN KEY (user_rut) REFERENCES users(rut),
+    FOREIGN KEY (event_id) REFERENCES events(id),
+    INDEX ix_tickets_user_created (user_rut, created_at, id),
+    INDEX ix_tickets_event_status (event_id, status)
 );
 
 -- Tabla de Pagos
@@ -36,3 +46,29 @@ CREATE TABLE IF NOT EXISTS payments (
     ticket_id INT UNIQUE NOT NULL, -- Relación 1 a 1
     FOREIGN KEY (ticket_id) REFERENCES tickets(id)
 );
+
+-- Resumen de ventas por evento y estado, mantenido en la misma transacción que cada
+-- cambio de estado de un ticket (SalesAggregates). Valor real = suma de los slots
+CREATE TABLE IF NOT EXISTS event_sales (
+    event_id INT NOT NULL,
+    status ENUM('PENDING_PAYMENT', 'PAID', 'USED', 'REFUNDED') NOT NULL,
+    slot INT NOT NULL,
+    tickets INT NOT NULL DEFAULT 0,
+    amount DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (event_id, status, slot),
+    FOREIGN KEY (event_id) REFERENCES events(id)
+);
+
+-- Outbox de eventos hacia el Middleware (se escribe en la misma transacción que el pago/reembolso)
+CREATE TABLE IF NOT EXISTS outbox_events (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    event_type VARCHAR(32) NOT NULL,
+    payload TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    attempts INT NOT NULL DEFAULT 0,
+    last_error VARCHAR(255),
+    delivered_at TIMESTAMP NULL,
+    claimed_until TIMESTAMP NULL,
+    INDEX ix_outbox_pending (delivered_at, id)
+);
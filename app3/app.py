@@ -2,14 +2,21 @@ import os
 import requests
 import json
 from flask import Flask, render_template, request, jsonify
+from app1_client import app1_client_from_env
+from order_queue import order_worker_from_env
 
 app = Flask(__name__)
 
 # URLs de servicios
-APP1_API_URL = "http://nginx/api/events"
-APP1_RESERVE_URL = "http://nginx/api/reserve"
 MIDDLEWARE_URL = "http://middleware:8000/order"
 
+# Cliente compartido de App1 (pool keep-alive + caché TTL de eventos y asientos)
+app1 = app1_client_from_env()
+
+# Órdenes que no llegan al Middleware: journal local, reintento y compensación en segundo plano
+order_worker = order_worker_from_env(app1, MIDDLEWARE_URL)
+order_worker.start()
+
 @app.route('/')
 def index():
     """
@@ -18,10 +25,7 @@ def index():
     events = []
     error_message = None
     try:
-        response = requests.get(APP1_API_URL, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        events = data.get('events', [])
+        events = app1.get_events()
     except requests.exceptions.RequestException as e:
         print(f"Error al conectar con App1: {e}")
         error_message = "No se pudo cargar la lista de eventos. El servicio de App1 podría no estar disponible."
@@ -38,20 +42,12 @@ def ver_asientos(event_id):
     error_message = None
     
     try:
-        all_events_response = requests.get(APP1_API_URL, timeout=5)
-        all_events_response.raise_for_status()
-        all_events = all_events_response.json().get('events', [])
-        for e in all_events:
-            if e.get('id') == event_id:
-                event = e
-                break
+        event = app1.get_event(event_id)
         
         if not event:
             error_message = "El evento especificado no fue encontrado."
         else:
-            seats_response = requests.get(f"http://nginx/api/events/{event_id}/seats", timeout=5)
-            seats_response.raise_for_status()
-            seats = seats_response.json().get('seats', [])
+            seats = app1.get_seats(event_id)
 
     except requests.exceptions.RequestException as e:
         print(f"Error al conectar con App1 para obtener asientos: {e}")
@@ -73,8 +69,8 @@ def reservar_asiento():
 
     # Paso 1: Intentar reservar el asiento en App1
     try:
-        reserve_payload = {'seat_id': seat_id, 'user_id': user_id}
-        response_app1 = requests.post(APP1_RESERVE_URL, json=reserve_payload, timeout=5)
+        # Si reserva, invalida el mapa de asientos en caché de ese evento
+        response_app1 = app1.reserve(seat_id, user_id, event_id)
 
         if response_app1.status_code != 200:
             # Si App1 falla la reserva (ej: asiento ocupado), retornar el error.
@@ -85,7 +81,10 @@ def reservar_asiento():
         print(f"Error de conexión con App1 al reservar: {e}")
         return jsonify({'error': 'No se pudo conectar con el servicio de reservas (App1)'}), 503
 
-    # Paso 2: Si la reserva en App1 tuvo éxito, enviar al Middleware
+    # Paso 2: Si la reserva en App1 tuvo éxito, enviar al Middleware.
+    # Con el Middleware caído se encola directo, sin esperar el timeout.
+    if order_worker.middleware_down:
+        return encolar_orden(seat_id, event_id, user_id, 'middleware no disponible')
     try:
         middleware_payload = {
             'event_id': str(event_id), 
@@ -96,19 +95,36 @@ def reservar_asiento():
         response_middleware.raise_for_status()
 
     except requests.exceptions.RequestException as e:
-        # Aquí estamos en un estado inconsistente: el asiento se reservó en App1,
-        # pero no se pudo enviar a facturación. En un sistema real, se necesitaría
-        # un mecanismo de compensación o reintento.
-        print(f"¡INCONSISTENCIA! Asiento {seat_id} reservado pero no se pudo encolar para facturación: {e}")
-        return jsonify({
-            'message': '¡Asiento reservado! Pero hubo un problema al generar tu factura. Contacta a soporte.'
-        }), 200 # Aún así damos éxito al usuario, ya que tiene su asiento.
+        # El asiento ya está reservado en App1: la orden queda en el journal local y
+        # el worker la reintenta (o libera el asiento si vence ORDER_QUEUE_DEADLINE_S)
+        return encolar_orden(seat_id, event_id, user_id, str(e))
 
     # Si todo fue bien:
     return jsonify({
         'message': '¡Reserva y orden de facturación procesadas exitosamente!'
     }), 200
 
+def encolar_orden(seat_id, event_id, user_id, error):
+    order_id = order_worker.enqueue(seat_id, event_id, user_id, error)
+    print(f"Orden {order_id} del asiento {seat_id} en cola de reintento: {error}")
+    return jsonify({
+        'message': '¡Asiento reservado! Tu orden de facturación quedó en cola y se procesará en breve.'
+    }), 202
+
+@app.route('/cache-stats')
+def cache_stats():
+    """
+    Contadores de la caché de App1 (hits, misses, desalojos, invalidaciones).
+    """
+    return jsonify(app1.stats())
+
+@app.route('/order-queue-stats')
+def order_queue_stats():
+    """
+    Estado de la cola de órdenes pendientes (en cola, enviadas, liberadas, backoff).
+    """
+    return jsonify(order_worker.stats())
+
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,163 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class TTLCache:
+    """
+    Caché en memoria con expiración por entrada y tamaño acotado: al superar
+    max_size se desaloja la entrada usada hace más tiempo (LRU).
+    """
+    def __init__(self, ttl, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, key):
+        """Devuelve (True, valor) si hay una entrada vigente, (False, None) si no."""
+        with self._lock:
+            hit, value = self._lookup(key)
+            self.counters['hits' if hit else 'misses'] += 1
+            return hit, value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def get_or_load(self, key, loader):
+        """
+        Devuelve el valor en caché o lo carga con loader(). Ante un miss, solo
+        un hilo por clave llama a loader; los demás esperan y reutilizan el
+        resultado (evita una estampida contra App1 al expirar una entrada).
+        Solo cuenta como miss la llamada que efectivamente va a App1.
+        """
+        with self._lock:
+            hit, value = self._lookup(key)
+            if hit:
+                self.counters['hits'] += 1
+                return value
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                hit, value = self._lookup(key)
+                self.counters['hits' if hit else 'misses'] += 1
+            if hit:
+                return value
+            value = loader()
+            self.set(key, value)
+            return value
+
+    def _lookup(self, key):
+        # Llamar con self._lock tomado
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        if entry[0] <= time.monotonic():
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, entry[1]
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.counters['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return dict(
+                self.counters,
+                size=len(self._data),
+                hit_rate=round(self.counters['hits'] / lookups, 4) if lookups else 0.0,
+            )
+
+
+class App1Client:
+    """
+    Cliente HTTP compartido para App1: una sesión con pool de conexiones
+    keep-alive y cachés TTL para el catálogo de eventos (y la búsqueda por id,
+    que se resuelve desde el catálogo) y para los mapas de asientos, con un TTL
+    corto e invalidación explícita tras reservar.
+    """
+    def __init__(self, base_url, timeout=5, pool_size=20, events_ttl=30, seats_ttl=2, max_entries=1024):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.events_cache = TTLCache(events_ttl, max_entries)
+        self.seats_cache = TTLCache(seats_ttl, max_entries)
+
+    def get_events(self):
+        return self.events_cache.get_or_load('events', self._fetch_events)
+
+    def get_event(self, event_id):
+        """Busca un evento por id; usa el índice por id construido al cargar el catálogo."""
+        by_id = self.events_cache.get_or_load('events_by_id', lambda: {e.get('id'): e for e in self.get_events()})
+        return by_id.get(event_id)
+
+    def get_seats(self, event_id):
+        return self.seats_cache.get_or_load(event_id, lambda: self._fetch_seats(event_id))
+
+    def reserve(self, seat_id, user_id, event_id=None):
+        response = self.session.post(
+            f"{self.base_url}/api/reserve", json={'seat_id': seat_id, 'user_id': user_id}, timeout=self.timeout
+        )
+        if response.status_code == 200 and event_id is not None:
+            self.invalidate_seats(event_id)
+        return response
+
+    def release(self, seat_id, user_id, event_id=None):
+        """Libera un asiento reservado por user_id (compensación de una orden que no se facturó)."""
+        response = self.session.post(
+            f"{self.base_url}/api/release", json={'seat_id': seat_id, 'user_id': user_id}, timeout=self.timeout
+        )
+        if response.status_code == 200 and event_id is not None:
+            self.invalidate_seats(event_id)
+        return response
+
+    def invalidate_seats(self, event_id):
+        # Las claves son el id entero de la ruta /evento/<int:event_id>; el JSON puede traerlo como texto
+        try:
+            event_id = int(event_id)
+        except (TypeError, ValueError):
+            return
+        self.seats_cache.invalidate(event_id)
+
+    def stats(self):
+        return {'events': self.events_cache.stats(), 'seats': self.seats_cache.stats()}
+
+    def _fetch_events(self):
+        response = self.session.get(f"{self.base_url}/api/events", timeout=self.timeout)
+        response.raise_for_status()
+        # Un catálogo nuevo invalida el índice por id derivado del anterior
+        self.events_cache.invalidate('events_by_id')
+        return response.json().get('events', [])
+
+    def _fetch_seats(self, event_id):
+        response = self.session.get(f"{self.base_url}/api/events/{event_id}/seats", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json().get('seats', [])
+
+
+def app1_client_from_env():
+    return App1Client(
+        os.environ.get('APP1_BASE_URL', 'http://nginx'),
+        timeout=float(os.environ.get('APP1_TIMEOUT', 5)),
+        pool_size=int(os.environ.get('APP1_POOL_SIZE', 20)),
+        events_ttl=float(os.environ.get('APP1_EVENTS_TTL', 30)),
+        seats_ttl=float(os.environ.get('APP1_SEATS_TTL', 2)),
+        max_entries=int(os.environ.get('APP1_CACHE_MAX_ENTRIES', 1024)),
+    )
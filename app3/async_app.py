@@ -0,0 +1,281 @@
+"""
+Modo ASGI del portal de venta (APP3_SERVER=asgi en start.sh, servido por hypercorn).
+
+Mismas rutas que app.py, pero las vistas son corrutinas que comparten un
+httpx.AsyncClient: una reserva que espera a App1 o al Middleware no ocupa un
+hilo, así unos pocos procesos sostienen miles de reservas en curso. Cada
+upstream tiene su propio límite de peticiones simultáneas y cada petición un
+plazo total (APP3_REQUEST_DEADLINE); si vence se responde 504, salvo
+que App1 ya haya reservado: entonces la orden pasa a la cola de reintento.
+"""
+import os
+import asyncio
+import httpx
+from quart import Quart, render_template, request, jsonify
+from app1_client import TTLCache, app1_client_from_env
+from order_queue import order_worker_from_env
+
+app = Quart(__name__)
+
+# URLs de servicios
+APP1_BASE_URL = os.environ.get('APP1_BASE_URL', 'http://nginx').rstrip('/')
+MIDDLEWARE_URL = os.environ.get('MIDDLEWARE_URL', 'http://middleware:8000/order')
+
+UPSTREAM_TIMEOUT = float(os.environ.get('APP1_TIMEOUT', 5))
+REQUEST_DEADLINE = float(os.environ.get('APP3_REQUEST_DEADLINE', 8))
+APP1_MAX_CONCURRENCY = int(os.environ.get('APP1_MAX_CONCURRENCY', 200))
+MIDDLEWARE_MAX_CONCURRENCY = int(os.environ.get('MIDDLEWARE_MAX_CONCURRENCY', 200))
+
+
+class Upstream:
+    """Un servicio remoto con su propio límite de peticiones simultáneas."""
+    def __init__(self, client, max_concurrency):
+        self.client = client
+        self.limit = asyncio.Semaphore(max_concurrency)
+        self.counters = {'requests': 0, 'errors': 0, 'in_flight': 0, 'waiting': 0}
+
+    async def request(self, method, url, **kwargs):
+        self.counters['waiting'] += 1
+        try:
+            await self.limit.acquire()
+        finally:
+            self.counters['waiting'] -= 1
+        self.counters['in_flight'] += 1
+        self.counters['requests'] += 1
+        try:
+            return await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.counters['errors'] += 1
+            raise
+        finally:
+            self.counters['in_flight'] -= 1
+            self.limit.release()
+
+
+class AsyncApp1Client:
+    """
+    Versión async de App1Client: mismas cachés TTL, y ante un miss una sola
+    carga por clave que comparten todas las peticiones que la esperan.
+    """
+    def __init__(self, upstream, base_url, events_ttl=30, seats_ttl=2, max_entries=1024):
+        self.upstream = upstream
+        self.base_url = base_url
+        self.events_cache = TTLCache(events_ttl, max_entries)
+        self.seats_cache = TTLCache(seats_ttl, max_entries)
+        self._loading = {}
+
+    async def get_events(self):
+        return await self._cached(self.events_cache, 'events', self._fetch_events)
+
+    async def get_event(self, event_id):
+        async def build_index():
+            return {e.get('id'): e for e in await self.get_events()}
+        by_id = await self._cached(self.events_cache, 'events_by_id', build_index)
+        return by_id.get(event_id)
+
+    async def get_seats(self, event_id):
+        return await self._cached(self.seats_cache, event_id, lambda: self._fetch_seats(event_id))
+
+    async def reserve(self, seat_id, user_id, event_id=None):
+        response = await self.upstream.request(
+            'POST', f"{self.base_url}/api/reserve", json={'seat_id': seat_id, 'user_id': user_id}
+        )
+        if response.status_code == 200 and event_id is not None:
+            try:
+                self.seats_cache.invalidate(int(event_id))
+            except (TypeError, ValueError):
+                pass
+        return response
+
+    def stats(self):
+        return {'events': self.events_cache.stats(), 'seats': self.seats_cache.stats()}
+
+    async def _cached(self, cache, key, loader):
+        # Igual que TTLCache.get_or_load: solo cuenta como miss la carga que va a App1
+        with cache._lock:
+            hit, value = cache._lookup(key)
+            if hit:
+                cache.counters['hits'] += 1
+                return value
+        task = self._loading.get((id(cache), key))
+        if task is None:
+            with cache._lock:
+                cache.counters['misses'] += 1
+            async def load():
+                value = await loader()
+                cache.set(key, value)
+                return value
+            task = asyncio.ensure_future(load())
+            self._loading[(id(cache), key)] = task
+            task.add_done_callback(lambda _: self._loading.pop((id(cache), key), None))
+        else:
+            with cache._lock:
+                cache.counters['hits'] += 1
+        # shield: si vence el plazo de una petición no se cancela la carga que esperan las demás
+        return await asyncio.shield(task)
+
+    async def _fetch_events(self):
+        response = await self.upstream.request('GET', f"{self.base_url}/api/events")
+        response.raise_for_status()
+        self.events_cache.invalidate('events_by_id')
+        return response.json().get('events', [])
+
+    async def _fetch_seats(self, event_id):
+        response = await self.upstream.request('GET', f"{self.base_url}/api/events/{event_id}/seats")
+        response.raise_for_status()
+        return response.json().get('seats', [])
+
+
+http_client = None
+app1 = None
+middleware = None
+order_worker = None
+
+
+@app.before_serving
+async def startup():
+    # Los semáforos y el cliente se crean dentro del event loop del servidor
+    global http_client, app1, middleware, order_worker
+    http_client = httpx.AsyncClient(
+        timeout=UPSTREAM_TIMEOUT,
+        limits=httpx.Limits(max_connections=APP1_MAX_CONCURRENCY + MIDDLEWARE_MAX_CONCURRENCY,
+                            max_keepalive_connections=100),
+    )
+    app1 = AsyncApp1Client(
+        Upstream(http_client, APP1_MAX_CONCURRENCY), APP1_BASE_URL,
+        events_ttl=float(os.environ.get('APP1_EVENTS_TTL', 30)),
+        seats_ttl=float(os.environ.get('APP1_SEATS_TTL', 2)),
+        max_entries=int(os.environ.get('APP1_CACHE_MAX_ENTRIES', 1024)),
+    )
+    middleware = Upstream(http_client, MIDDLEWARE_MAX_CONCURRENCY)
+    # Los reintentos corren en un hilo propio con el cliente síncrono (ver order_queue.py)
+    order_worker = order_worker_from_env(app1_client_from_env(), MIDDLEWARE_URL)
+    order_worker.start()
+
+
+@app.after_serving
+async def shutdown():
+    await http_client.aclose()
+
+
+@app.route('/')
+async def index():
+    """
+    Renderiza la página principal con la lista de eventos de App1.
+    """
+    events = []
+    error_message = None
+    try:
+        events = await asyncio.wait_for(app1.get_events(), REQUEST_DEADLINE)
+    except (httpx.HTTPError, asyncio.TimeoutError) as e:
+        print(f"Error al conectar con App1: {e!r}")
+        error_message = "No se pudo cargar la lista de eventos. El servicio de App1 podría no estar disponible."
+
+    return await render_template('index.html', events=events, error_message=error_message)
+
+
+@app.route('/evento/<int:event_id>/asientos')
+async def ver_asientos(event_id):
+    """
+    Muestra los asientos para un evento específico.
+    """
+    event = None
+    seats = []
+    error_message = None
+
+    async def load():
+        event = await app1.get_event(event_id)
+        seats = await app1.get_seats(event_id) if event else []
+        return event, seats
+
+    try:
+        event, seats = await asyncio.wait_for(load(), REQUEST_DEADLINE)
+        if not event:
+            error_message = "El evento especificado no fue encontrado."
+    except (httpx.HTTPError, asyncio.TimeoutError) as e:
+        print(f"Error al conectar con App1 para obtener asientos: {e!r}")
+        error_message = "No se pudo cargar la información de los asientos."
+
+    return await render_template('seats.html', event=event, seats=seats, error_message=error_message)
+
+
+@app.route('/reservar_asiento', methods=['POST'])
+async def reservar_asiento():
+    """
+    Endpoint para reservar un asiento (misma lógica que app.py, sin bloquear hilos).
+    1. Llama a App1 para reservar el asiento.
+    2. Si tiene éxito, llama al Middleware para encolar la facturación.
+    Ambos pasos comparten el plazo APP3_REQUEST_DEADLINE.
+    """
+    data = await request.get_json()
+    seat_id = data.get('seat_id')
+    user_id = data.get('user_id')
+    event_id = data.get('event_id')
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + REQUEST_DEADLINE
+
+    # Paso 1: Intentar reservar el asiento en App1
+    try:
+        response_app1 = await asyncio.wait_for(app1.reserve(seat_id, user_id, event_id), REQUEST_DEADLINE)
+
+        if response_app1.status_code != 200:
+            # Si App1 falla la reserva (ej: asiento ocupado), retornar el error.
+            error_details = response_app1.json().get('error', 'Error desconocido en App1')
+            return jsonify({'error': f"App1 no pudo reservar el asiento: {error_details}"}), response_app1.status_code
+
+    except asyncio.TimeoutError:
+        print(f"Reserva del asiento {seat_id} excedió el plazo de {REQUEST_DEADLINE}s")
+        return jsonify({'error': 'La reserva tardó demasiado. Intenta nuevamente.'}), 504
+    except httpx.HTTPError as e:
+        print(f"Error de conexión con App1 al reservar: {e!r}")
+        return jsonify({'error': 'No se pudo conectar con el servicio de reservas (App1)'}), 503
+
+    # Paso 2: Si la reserva en App1 tuvo éxito, enviar al Middleware.
+    # Con el Middleware caído se encola directo, sin esperar el timeout.
+    if order_worker.middleware_down:
+        return await _encolar_orden(seat_id, event_id, user_id, 'middleware no disponible')
+    try:
+        middleware_payload = {
+            'event_id': str(event_id),
+            'user_id': str(user_id),
+            'quantity': 1
+        }
+        response_middleware = await asyncio.wait_for(
+            middleware.request('POST', MIDDLEWARE_URL, json=middleware_payload), max(deadline - loop.time(), 0)
+        )
+        response_middleware.raise_for_status()
+
+    except (httpx.HTTPError, asyncio.TimeoutError) as e:
+        # El asiento ya está reservado en App1: si el Middleware falla o se agota
+        # el plazo, la orden queda en el journal local en vez de perderse
+        return await _encolar_orden(seat_id, event_id, user_id, repr(e))
+
+    # Si todo fue bien:
+    return jsonify({
+        'message': '¡Reserva y orden de facturación procesadas exitosamente!'
+    }), 200
+
+
+async def _encolar_orden(seat_id, event_id, user_id, error):
+    # El journal es SQLite síncrono: se escribe en un hilo para no bloquear el event loop
+    order_id = await asyncio.to_thread(order_worker.enqueue, seat_id, event_id, user_id, error)
+    print(f"Orden {order_id} del asiento {seat_id} en cola de reintento: {error}")
+    return jsonify({
+        'message': '¡Asiento reservado! Tu orden de facturación quedó en cola y se procesará en breve.'
+    }), 202
+
+
+@app.route('/cache-stats')
+async def cache_stats():
+    """
+    Contadores de la caché de App1 y de cada upstream (en curso, en espera, errores).
+    """
+    return jsonify(dict(app1.stats(), upstreams={'app1': app1.upstream.counters, 'middleware': middleware.counters}))
+
+
+@app.route('/order-queue-stats')
+async def order_queue_stats():
+    """
+    Estado de la cola de órdenes pendientes (en cola, enviadas, liberadas, backoff).
+    """
+    return jsonify(await asyncio.to_thread(order_worker.stats))
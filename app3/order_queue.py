@@ -0,0 +1,253 @@
+"""
+Cola local y durable para las órdenes que no llegaron al Middleware.
+
+Si el POST a /order falla después de que App1 ya reservó el asiento, la orden
+se guarda en un journal SQLite (ORDER_QUEUE_PATH) y la petición del usuario
+retorna de inmediato. OrderRetryWorker la reintenta en segundo plano con
+backoff exponencial y, cuando el Middleware vuelve, vacía el journal por
+lotes. Si una orden supera ORDER_QUEUE_DEADLINE_S sin enviarse, se libera el
+asiento en App1 (compensación) para que no quede reservado sin factura.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+import requests
+
+PENDING = 'pending'
+SENT = 'sent'
+RELEASED = 'released'
+
+# Tiempo que una fila tomada por un worker queda oculta para los demás procesos
+CLAIM_LEASE_S = 60
+
+
+class OrderJournal:
+    """
+    Tabla pending_orders en SQLite (modo WAL). Varios procesos pueden compartir
+    el archivo: claim() toma las filas con BEGIN IMMEDIATE y les pone un lease.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS pending_orders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                created_at REAL NOT NULL,
+                next_attempt_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_pending_orders_due ON pending_orders (state, next_attempt_at)"
+        )
+
+    def enqueue(self, seat_id, event_id, user_id, error=None):
+        payload = json.dumps({'seat_id': seat_id, 'event_id': event_id, 'user_id': user_id})
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO pending_orders (payload, created_at, next_attempt_at, last_error) VALUES (?, ?, ?, ?)",
+                (payload, now, now, error)
+            )
+            return cursor.lastrowid
+
+    def claim(self, limit, lease=CLAIM_LEASE_S):
+        """Toma hasta limit órdenes vencidas, en orden de llegada."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, payload, created_at, attempts FROM pending_orders "
+                    "WHERE state = ? AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                    (PENDING, now, limit)
+                ).fetchall()
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE pending_orders SET next_attempt_at = ? WHERE id IN ({','.join('?' * len(rows))})",
+                        [now + lease] + [row['id'] for row in rows]
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [dict(json.loads(row['payload']), id=row['id'], created_at=row['created_at'],
+                     attempts=row['attempts']) for row in rows]
+
+    def mark(self, ids, state):
+        if not ids:
+            return
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE pending_orders SET state = ? WHERE id IN ({','.join('?' * len(ids))})",
+                [state] + list(ids)
+            )
+
+    def retry(self, ids, error, delay):
+        if not ids:
+            return
+        with self._lock:
+            self._conn.execute(
+                "UPDATE pending_orders SET attempts = attempts + 1, last_error = ?, next_attempt_at = ? "
+                f"WHERE id IN ({','.join('?' * len(ids))})",
+                [str(error)[:255], time.time() + delay] + list(ids)
+            )
+
+    def prune(self, older_than_s):
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM pending_orders WHERE state != ? AND created_at < ?",
+                (PENDING, time.time() - older_than_s)
+            )
+            return cursor.rowcount
+
+    def stats(self):
+        with self._lock:
+            counts = {state: n for state, n in self._conn.execute(
+                "SELECT state, COUNT(*) FROM pending_orders GROUP BY state"
+            )}
+            oldest = self._conn.execute(
+                "SELECT MIN(created_at) FROM pending_orders WHERE state = ?", (PENDING,)
+            ).fetchone()[0]
+        return {
+            'pending': counts.get(PENDING, 0),
+            'sent': counts.get(SENT, 0),
+            'released': counts.get(RELEASED, 0),
+            'oldest_pending_age_s': round(time.time() - oldest, 1) if oldest else 0.0,
+        }
+
+
+class OrderRetryWorker:
+    """
+    Hilo de fondo que reintenta las órdenes del journal contra el Middleware.
+    Un fallo de conexión o 5xx detiene el lote y aplica backoff exponencial a
+    todo el Middleware (middleware_down queda activo, y el portal encola sin
+    esperar el timeout). Un 4xx no se arregla reintentando: se compensa al tiro.
+    """
+    def __init__(self, journal, app1, middleware_url, deadline_s=900, batch_size=50,
+                 poll_interval=1.0, max_backoff=60, timeout=5, retention_hours=24):
+        self.journal = journal
+        self.app1 = app1
+        self.middleware_url = middleware_url
+        self.deadline = deadline_s
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.retention = retention_hours * 3600
+        self.session = requests.Session()
+        self.backoff = poll_interval
+        self.middleware_down = False
+        self.counters = {'enqueued': 0, 'sent': 0, 'retries': 0, 'released': 0, 'release_errors': 0}
+        self._thread = None
+
+    def enqueue(self, seat_id, event_id, user_id, error=None):
+        order_id = self.journal.enqueue(seat_id, event_id, user_id, error)
+        self.counters['enqueued'] += 1
+        return order_id
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run_forever, name='order-retry', daemon=True)
+            self._thread.start()
+
+    def drain_once(self):
+        """Procesa un lote. Devuelve cuántas órdenes se resolvieron; lanza RequestException si el Middleware falla."""
+        rows = self.journal.claim(self.batch_size)
+        now = time.time()
+        sent = []
+        try:
+            for i, row in enumerate(rows):
+                if now - row['created_at'] >= self.deadline:
+                    self._release(row, 'deadline')
+                    continue
+                try:
+                    response = self.session.post(self.middleware_url, json={
+                        'event_id': str(row['event_id']),
+                        'user_id': str(row['user_id']),
+                        'quantity': 1
+                    }, timeout=self.timeout)
+                    response.raise_for_status()
+                except requests.exceptions.HTTPError as e:
+                    if e.response is not None and 400 <= e.response.status_code < 500:
+                        self._release(row, f"middleware {e.response.status_code}")
+                        continue
+                    self._retry_rest(rows[i:], e)
+                    raise
+                except requests.exceptions.RequestException as e:
+                    self._retry_rest(rows[i:], e)
+                    raise
+                sent.append(row['id'])
+        finally:
+            self.journal.mark(sent, SENT)
+            self.counters['sent'] += len(sent)
+        return len(rows)
+
+    def run_forever(self):
+        print(f" [*] Reintentos de órdenes: journal {self.journal.path}, plazo {self.deadline:.0f}s")
+        last_prune = 0
+        while True:
+            try:
+                handled = self.drain_once()
+                self.middleware_down = False
+                self.backoff = self.poll_interval
+                if time.monotonic() - last_prune > 3600:
+                    self.journal.prune(self.retention)
+                    last_prune = time.monotonic()
+            except requests.exceptions.RequestException as e:
+                self.middleware_down = True
+                print(f" [!] Middleware no disponible: {e}, reintento en {self.backoff:.1f}s")
+                time.sleep(self.backoff)
+                continue
+            except sqlite3.Error as e:
+                print(f" [!] Error en el journal de órdenes: {e}")
+                handled = 0
+            if handled:
+                print(f" [orders] {handled} órdenes pendientes procesadas ({self.journal.stats()['pending']} en cola)")
+            if handled < self.batch_size:
+                time.sleep(self.poll_interval)
+
+    def stats(self):
+        return dict(self.counters, middleware_down=self.middleware_down, backoff_s=self.backoff,
+                    **self.journal.stats())
+
+    def _retry_rest(self, rows, error):
+        # El lote se corta en la primera falla: el resto vuelve a la cola con el mismo backoff
+        self.backoff = min(self.backoff * 2, self.max_backoff)
+        self.journal.retry([row['id'] for row in rows], error, self.backoff)
+        self.counters['retries'] += len(rows)
+
+    def _release(self, row, reason):
+        """Compensación: libera el asiento en App1. 409 significa que ya no estaba reservado por ese usuario."""
+        try:
+            response = self.app1.release(row['seat_id'], row['user_id'], row['event_id'])
+            if response.status_code not in (200, 409):
+                response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            self.counters['release_errors'] += 1
+            self.journal.retry([row['id']], f"release: {e}", min(self.backoff * 2, self.max_backoff))
+            print(f" [!] No se pudo liberar el asiento {row['seat_id']} (orden {row['id']}): {e}")
+            return
+        self.journal.mark([row['id']], RELEASED)
+        self.counters['released'] += 1
+        print(f" [orders] Asiento {row['seat_id']} liberado en App1 (orden {row['id']}, {reason})")
+
+
+def order_worker_from_env(app1, middleware_url):
+    return OrderRetryWorker(
+        OrderJournal(os.environ.get('ORDER_QUEUE_PATH', 'order_queue.db')),
+        app1,
+        middleware_url,
+        deadline_s=float(os.environ.get('ORDER_QUEUE_DEADLINE_S', 900)),
+        batch_size=int(os.environ.get('ORDER_QUEUE_BATCH_SIZE', 50)),
+        poll_interval=float(os.environ.get('ORDER_QUEUE_POLL_INTERVAL_S', 1)),
+        max_backoff=float(os.environ.get('ORDER_QUEUE_MAX_BACKOFF_S', 60)),
+    )
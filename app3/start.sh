@@ -0,0 +1,9 @@
+#!/bin/sh
+
+# APP3_SERVER=asgi: vistas async bajo hypercorn (ver async_app.py)
+# Por defecto: servidor de Flask con vistas síncronas (app.py)
+if [ "${APP3_SERVER:-flask}" = "asgi" ]; then
+    exec hypercorn async_app:app --bind 0.0.0.0:5000 --workers "${APP3_WORKERS:-2}"
+else
+    exec python app.py
+fi
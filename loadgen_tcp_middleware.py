@@ -0,0 +1,432 @@
+"""
+Generador de carga para el listener TCP de App2, construido sobre
+simulate_tcp_middleware.py (mismo framing, host y puertos).
+
+Abre N conexiones productoras persistentes y envía tickets a una tasa total
+objetivo (lazo abierto, --rate) o, con --rate 0, en lazo cerrado: cada
+conexión espera a que su ticket sea visible en la BD antes de enviar el
+siguiente. RUTs con distribución Zipf (pocos compradores frecuentes, muchos
+ocasionales), eventos con pesos y una fracción de ids duplicados.
+
+Un hilo consulta la tabla tickets de la misma BD que usa App2 (APP2_DB_* o
+DATABASE_URL, o --db-url; sirve SQLite o una MariaDB local) y mide la latencia
+envío -> fila visible. En lazo abierto se mide desde el instante programado
+de envío, para que un productor atrasado no esconda la cola. Con
+--pay-ratio > 0 se paga una fracción de los tickets con TicketService y el
+listener de notificaciones (puerto de notify) mide pago -> eco TICKET_PAID.
+
+Con más de una conexión conviene MIDDLEWARE_TYPE=tcp_async en App2: tcp_server
+atiende una conexión a la vez y el resto espera en el backlog.
+
+El resultado se escribe como JSON (--out) para comparar corridas entre commits:
+
+  python3 loadgen_tcp_middleware.py --connections 8 --rate 500 --duration 30 --out run.json
+  python3 loadgen_tcp_middleware.py --connections 32 --rate 0 --duration 30 --out closed.json
+"""
+import argparse
+import json
+import os
+import queue
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import importlib.util
+from datetime import datetime
+
+from sqlalchemy import create_engine, text
+
+import simulate_tcp_middleware as sim
+
+framing = sim.framing
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+EVENTS = [
+    # (nombre, peso, precios posibles)
+    ("Concierto TCP Rock", 0.5, (7500, 9000)),
+    ("Gala de Sockets", 0.3, (12000, 15000)),
+    ("Festival Async", 0.2, (5000,)),
+]
+
+
+def default_db_url():
+    # Misma URI que la app: se carga app2/app/config.py por ruta, sin importar Flask
+    spec = importlib.util.spec_from_file_location('app2_config', os.path.join(ROOT, 'app2', 'app', 'config.py'))
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    return config.Config.SQLALCHEMY_DATABASE_URI
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def rank(p):
+        return values[min(len(values) - 1, max(0, int(round(p / 100.0 * len(values))) - 1))]
+
+    return {
+        'count': len(values),
+        'p50': round(rank(50), 2),
+        'p95': round(rank(95), 2),
+        'p99': round(rank(99), 2),
+        'max': round(values[-1], 2),
+        'mean': round(sum(values) / len(values), 2),
+    }
+
+
+class Workload:
+    """Genera los mensajes: ids únicos por corrida, RUTs Zipf, eventos con pesos y duplicados."""
+    def __init__(self, prefix, users, rut_skew, dup_ratio, seed=None):
+        self.prefix = prefix
+        self.dup_ratio = dup_ratio
+        self.random = random.Random(seed)
+        self.ruts = [10000000 + rank for rank in range(1, users + 1)]
+        cum, total = [], 0.0
+        for rank in range(1, users + 1):
+            total += 1.0 / rank ** rut_skew
+            cum.append(total)
+        self.rut_weights = cum
+        self.event_weights = [w for _, w, _ in EVENTS]
+        self.sent_ids = []
+        self.seq = 0
+        self.lock = threading.Lock()
+
+    def next(self):
+        """Devuelve (external_id, línea codificada, es_duplicado)."""
+        with self.lock:
+            if self.sent_ids and self.random.random() < self.dup_ratio:
+                return self.random.choice(self.sent_ids) + (True,)
+            self.seq += 1
+            external_id = f"{self.prefix}-{self.seq}"
+            rut = self.random.choices(self.ruts, cum_weights=self.rut_weights)[0]
+            name, _, prices = self.random.choices(EVENTS, weights=self.event_weights)[0]
+            line = (json.dumps({
+                "id": external_id,
+                "rut": rut,
+                "price": self.random.choice(prices),
+                "event": name,
+            }) + "\n").encode('utf-8')
+            self.sent_ids.append((external_id, line))
+            return external_id, line, False
+
+
+class Tracker:
+    """Lleva los envíos pendientes de ver en la BD y las latencias observadas."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.waiters = {}
+        self.latencies_ms = []
+        self.sent = 0
+        self.duplicates = 0
+        self.send_errors = 0
+
+    def sent_at(self, external_id, t, waiter=None):
+        with self.lock:
+            self.sent += 1
+            self.pending[external_id] = t
+            if waiter is not None:
+                self.waiters[external_id] = waiter
+
+    def visible(self, external_id, t):
+        with self.lock:
+            start = self.pending.pop(external_id, None)
+            waiter = self.waiters.pop(external_id, None)
+            if start is not None:
+                self.latencies_ms.append((t - start) * 1000)
+        if waiter is not None:
+            waiter.set()
+        return start is not None
+
+
+class Producer(threading.Thread):
+    """Una conexión persistente al listener; en lazo abierto envía en los instantes programados."""
+    def __init__(self, args, workload, tracker, stop, rate):
+        super().__init__(daemon=True)
+        self.args = args
+        self.workload = workload
+        self.tracker = tracker
+        self.stop = stop
+        self.interval = 1.0 / rate if rate else 0
+
+    def run(self):
+        sock = socket.create_connection((self.args.host, self.args.port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        next_at = time.monotonic()
+        try:
+            while not self.stop.is_set():
+                if self.interval:
+                    delay = next_at - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    scheduled = next_at
+                    next_at += self.interval
+                external_id, line, duplicate = self.workload.next()
+                waiter = threading.Event() if not self.interval and not duplicate else None
+                if duplicate:
+                    with self.tracker.lock:
+                        self.tracker.duplicates += 1
+                else:
+                    self.tracker.sent_at(external_id, scheduled if self.interval else time.monotonic(), waiter)
+                try:
+                    sock.sendall(line)
+                except OSError as e:
+                    with self.tracker.lock:
+                        self.tracker.send_errors += 1
+                    print(f" [!] Error enviando: {e}; reconectando")
+                    sock.close()
+                    sock = socket.create_connection((self.args.host, self.args.port))
+                    continue
+                if waiter is not None:
+                    waiter.wait(self.args.drain_timeout)
+        finally:
+            sock.close()
+
+
+class DbPoller(threading.Thread):
+    """Detecta las filas nuevas de la corrida (por id creciente) y registra cuándo se vieron."""
+    def __init__(self, engine, prefix, tracker, interval, paid_queue=None, pay_ratio=0.0):
+        super().__init__(daemon=True)
+        self.engine = engine
+        self.prefix = prefix
+        self.tracker = tracker
+        self.interval = interval
+        self.paid_queue = paid_queue
+        self.pay_ratio = pay_ratio
+        self.stop = threading.Event()
+        self.rows_seen = 0
+        with engine.connect() as conn:
+            self.last_id = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM tickets")).scalar()
+
+    def run(self):
+        query = text(
+            "SELECT id, external_id, user_rut FROM tickets "
+            "WHERE id > :last_id AND external_id LIKE :prefix ORDER BY id"
+        )
+        while not self.stop.wait(self.interval):
+            # Una conexión del pool por consulta: cada lectura ve los commits más recientes
+            with self.engine.connect() as conn:
+                rows = conn.execute(query, {'last_id': self.last_id, 'prefix': f"{self.prefix}-%"}).fetchall()
+            now = time.monotonic()
+            for ticket_id, external_id, user_rut in rows:
+                self.last_id = max(self.last_id, ticket_id)
+                if self.tracker.visible(external_id, now):
+                    self.rows_seen += 1
+                    if self.paid_queue is not None and random.random() < self.pay_ratio:
+                        self.paid_queue.put((ticket_id, user_rut, external_id))
+
+
+class Payer(threading.Thread):
+    """Paga tickets con TicketService.process_payment (pago real, con outbox) para provocar ecos TICKET_PAID."""
+    def __init__(self, paid_queue, paid_at):
+        super().__init__(daemon=True)
+        self.paid_queue = paid_queue
+        self.paid_at = paid_at
+        self.paid = 0
+
+    def run(self):
+        sys.path.insert(0, os.path.join(ROOT, 'app2'))
+        from app import create_app
+        from app.services import TicketService
+        app = create_app()
+        with app.app_context():
+            while True:
+                ticket_id, user_rut, external_id = self.paid_queue.get()
+                # Se registra antes del pago: en modo direct el eco puede llegar antes de que retorne
+                self.paid_at[external_id] = time.monotonic()
+                if TicketService.process_payment(user_rut, ticket_id):
+                    self.paid += 1
+                else:
+                    self.paid_at.pop(external_id, None)
+
+
+class NotifyListener(threading.Thread):
+    """Escucha el puerto de notify como lo hace el simulador y mide pago -> eco TICKET_PAID."""
+    def __init__(self, port, paid_at):
+        super().__init__(daemon=True)
+        self.port = port
+        self.paid_at = paid_at
+        self.received = 0
+        self.latencies_ms = []
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((sim.NOTIFY_HOST, port))
+        self.server.listen()
+
+    def run(self):
+        while True:
+            conn, _ = self.server.accept()
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def handle(self, conn):
+        with conn:
+            try:
+                framer = sim.accept_framer(conn)
+                while framer:
+                    frames = framer.recv_into(conn)
+                    if frames is None:
+                        return
+                    now = time.monotonic()
+                    for line in frames:
+                        try:
+                            msg = line if isinstance(line, dict) else json.loads(line)
+                        except ValueError:
+                            continue
+                        self.received += 1
+                        if msg.get('type') == 'TICKET_PAID':
+                            paid = self.paid_at.pop(msg.get('data', {}).get('external_id'), None)
+                            if paid is not None:
+                                self.latencies_ms.append((now - paid) * 1000)
+            except (ValueError, ConnectionError):
+                return
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def forget_sales(conn, pattern):
+    """
+    Descuenta de event_sales los tickets que se van a borrar, en la misma
+    transacción (equivale a SalesAggregates.delete_tickets sin cargar la app).
+    Cualquier slot existente sirve: el resumen suma todos los slots.
+    """
+    rows = conn.execute(text(
+        "SELECT event_id, status, COUNT(id), SUM(price) FROM tickets"
+        " WHERE external_id LIKE :prefix GROUP BY event_id, status"
+    ), {'prefix': pattern}).fetchall()
+    for event_id, status, count, amount in rows:
+        key = {'event_id': event_id, 'status': status}
+        slot = conn.execute(text(
+            "SELECT MIN(slot) FROM event_sales WHERE event_id = :event_id AND status = :status"
+        ), key).scalar()
+        delta = dict(key, count=count, amount=float(amount or 0), now=datetime.utcnow())
+        if slot is None:
+            conn.execute(text(
+                "INSERT INTO event_sales (event_id, status, slot, tickets, amount, updated_at)"
+                " VALUES (:event_id, :status, 0, -:count, -:amount, :now)"
+            ), delta)
+        else:
+            conn.execute(text(
+                "UPDATE event_sales SET tickets = tickets - :count, amount = amount - :amount, updated_at = :now"
+                " WHERE event_id = :event_id AND status = :status AND slot = :slot"
+            ), dict(delta, slot=slot))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga y latencia extremo a extremo del listener TCP de App2")
+    parser.add_argument('--host', default=sim.HOST)
+    parser.add_argument('--port', type=int, default=sim.PORT)
+    parser.add_argument('--connections', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=500, help="Mensajes/s en total; 0 = lazo cerrado")
+    parser.add_argument('--duration', type=float, default=30, help="Segundos de envío")
+    parser.add_argument('--users', type=int, default=5000, help="RUTs distintos")
+    parser.add_argument('--rut-skew', type=float, default=1.1, help="Exponente Zipf de los RUTs")
+    parser.add_argument('--dup-ratio', type=float, default=0.02, help="Fracción de mensajes con id repetido")
+    parser.add_argument('--db-url', default=None, help="Por defecto la URI de App2 (APP2_DB_* o DATABASE_URL)")
+    parser.add_argument('--poll-interval-ms', type=float, default=20)
+    parser.add_argument('--drain-timeout', type=float, default=30, help="Espera máxima a que aparezcan las filas")
+    parser.add_argument('--notify-port', type=int, default=sim.NOTIFY_PORT)
+    parser.add_argument('--no-notify', action='store_true', help="No escuchar el puerto de notificaciones")
+    parser.add_argument('--pay-ratio', type=float, default=0.0, help="Fracción de tickets a pagar (ecos TICKET_PAID)")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--out', default=None, help="Archivo JSON de resultados (por defecto stdout)")
+    args = parser.parse_args()
+
+    db_url = args.db_url or default_db_url()
+    if not db_url:
+        parser.error("Sin base de datos: define APP2_DB_* o DATABASE_URL, o usa --db-url")
+    engine = create_engine(db_url, pool_pre_ping=True)
+
+    prefix = f"LOAD-{uuid.uuid4().hex[:8]}"
+    workload = Workload(prefix, args.users, args.rut_skew, args.dup_ratio, args.seed)
+    tracker = Tracker()
+
+    paid_at = {}
+    paid_queue = queue.Queue() if args.pay_ratio > 0 else None
+    notifier = None
+    if not args.no_notify:
+        notifier = NotifyListener(args.notify_port, paid_at)
+        notifier.start()
+    payer = None
+    if paid_queue is not None:
+        payer = Payer(paid_queue, paid_at)
+        payer.start()
+
+    poller = DbPoller(engine, prefix, tracker, args.poll_interval_ms / 1000.0, paid_queue, args.pay_ratio)
+    poller.start()
+
+    mode = 'closed' if not args.rate else 'open'
+    print(f" [*] {mode} loop, {args.connections} conexiones, {args.rate or '-'} msg/s, "
+          f"{args.duration:.0f}s hacia {args.host}:{args.port} (prefijo {prefix})")
+    stop = threading.Event()
+    per_connection = args.rate / args.connections if args.rate else 0
+    producers = [Producer(args, workload, tracker, stop, per_connection) for _ in range(args.connections)]
+    start = time.monotonic()
+    for producer in producers:
+        producer.start()
+    time.sleep(args.duration)
+    stop.set()
+    for producer in producers:
+        producer.join(args.drain_timeout)
+    send_elapsed = time.monotonic() - start
+
+    # Drenaje: esperar a que todo lo enviado aparezca (o se agote el plazo)
+    deadline = time.monotonic() + args.drain_timeout
+    while tracker.pending and time.monotonic() < deadline:
+        time.sleep(0.05)
+    if paid_queue is not None and notifier is not None:
+        while (paid_at or not paid_queue.empty()) and time.monotonic() < deadline:
+            time.sleep(0.05)
+    total_elapsed = time.monotonic() - start
+    poller.stop.set()
+
+    with engine.begin() as conn:
+        # Deja la BD como estaba para la próxima corrida
+        conn.execute(text(
+            "DELETE FROM payments WHERE ticket_id IN (SELECT id FROM tickets WHERE external_id LIKE :prefix)"
+        ), {'prefix': f"{prefix}-%"})
+        forget_sales(conn, f"{prefix}-%")
+        conn.execute(text("DELETE FROM tickets WHERE external_id LIKE :prefix"), {'prefix': f"{prefix}-%"})
+
+    result = {
+        'tool': 'loadgen_tcp_middleware',
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'git_commit': git_commit(),
+        'backend': engine.dialect.name,
+        'config': dict(vars(args), mode=mode, db_url=None),
+        'sent': tracker.sent,
+        'duplicates_sent': tracker.duplicates,
+        'send_errors': tracker.send_errors,
+        'visible': poller.rows_seen,
+        'lost': len(tracker.pending),
+        'send_duration_s': round(send_elapsed, 3),
+        'total_duration_s': round(total_elapsed, 3),
+        'send_rate': round((tracker.sent + tracker.duplicates) / send_elapsed, 1),
+        'commit_rate': round(poller.rows_seen / total_elapsed, 1),
+        'latency_ms': percentiles(tracker.latencies_ms),
+        'notifications': {
+            'received': notifier.received if notifier else None,
+            'paid': payer.paid if payer else 0,
+            'paid_to_echo_ms': percentiles(notifier.latencies_ms) if notifier else None,
+        },
+    }
+    output = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output + "\n")
+        print(f" [v] Resultados en {args.out}")
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
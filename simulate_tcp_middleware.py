@@ -1,8 +1,25 @@
+import os
+import sys
 import socket
 import json
 import time
 import random
 import threading
+import importlib.util
+
+# Reutilizamos el codec de framing y el protocolo de acks de App2 cargándolos
+# por ruta, para no importar el paquete `app` (que arrastra Flask) desde este
+# script suelto.
+def _load_app2_module(name):
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app2', 'app', f'{name}.py')
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+framing = _load_app2_module('framing')
+feed_ack = _load_app2_module('feed_ack')
 
 # Configuración
 HOST = 'localhost'
@@ -14,7 +31,9 @@ NOTIFY_PORT = 7002
 
 def listen_for_notifications():
     """
-    Servidor TCP simple que escucha notificaciones desde App2
+    Servidor TCP simple que escucha notificaciones desde App2. App2 mantiene
+    conexiones persistentes (una por worker web y otra por relay del outbox):
+    cada conexión se atiende en su propio hilo.
     """
     print(f" [Middleware Listener] Esperando notificaciones en {NOTIFY_HOST}:{NOTIFY_PORT}...")
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
@@ -24,27 +43,87 @@ def listen_for_notifications():
             s.listen()
             while True:
                 conn, addr = s.accept()
-                with conn:
-                    # print(f" [Middleware Listener] Conexión desde {addr}")
-                    buffer = ""
-                    while True:
-                        data = conn.recv(1024)
-                        if not data:
-                            break
-                        buffer += data.decode('utf-8')
-                        while '\n' in buffer:
-                            line, buffer = buffer.split('\n', 1)
-                            if line.strip():
-                                try:
-                                    msg = json.loads(line)
-                                    print(f"\n [!!!] NOTIFICACIÓN RECIBIDA: {msg['type']}")
-                                    print(f"       Datos: {msg['data']}")
-                                    print(f"       Timestamp: {msg['timestamp']}\n")
-                                except json.JSONDecodeError:
-                                    print(f" [!] Error decodificando JSON: {line}")
+                threading.Thread(target=handle_notifications, args=(conn, addr), daemon=True).start()
         except Exception as e:
             print(f" [!] Error en listener de notificaciones: {e}")
 
+def handle_notifications(conn, addr):
+    """
+    Si App2 lo pide (el relay del outbox, con OUTBOX_REQUIRE_ACK) confirma cada
+    notificación ya procesada con el protocolo de feed_ack.py; sin hello, las
+    notificaciones se leen sin responder nada.
+    """
+    def abort():
+        conn.shutdown(socket.SHUT_RDWR)
+
+    with conn:
+        # print(f" [Middleware Listener] Conexión desde {addr}")
+        session = feed_ack.FeedSession(conn.sendall, abort)
+        try:
+            framer = accept_framer(conn)
+            while framer:
+                session.idle()
+                frames = framer.recv_into(conn)
+                if frames is None:
+                    break
+                for frame in frames:
+                    item = session.admit(frame)
+                    if not item:
+                        continue
+                    line, ack = item
+                    try:
+                        # En modo binario el frame ya viene decodificado
+                        msg = line if isinstance(line, dict) else json.loads(line)
+                        print(f"\n [!!!] NOTIFICACIÓN RECIBIDA: {msg['type']}")
+                        print(f"       Datos: {msg['data']}")
+                        print(f"       Timestamp: {msg['timestamp']}\n")
+                    except json.JSONDecodeError:
+                        print(f" [!] Error decodificando JSON: {line}")
+                    # Inválido o no, reenviarlo no cambia nada: se confirma igual
+                    if ack:
+                        ack()
+        except (ValueError, ConnectionError) as e:
+            print(f" [!] Cerrando conexión de {addr}: {e}")
+        if session.enabled:
+            print(f" [i] Sesión con acks cerrada: {session.stats}")
+
+def accept_framer(conn):
+    """Framer según el primer byte: frames binarios si App2 los negocia (MIDDLEWARE_NOTIFY_CODEC=msgpack)."""
+    first = conn.recv(1, socket.MSG_PEEK)
+    if not first:
+        return None
+    if first != framing.BINARY_HANDSHAKE:
+        return framing.LineFramer()
+    conn.recv(1)
+    if not framing.msgpack_available():
+        conn.sendall(framing.HANDSHAKE_REFUSED)
+        return framing.LineFramer()
+    conn.sendall(framing.BINARY_HANDSHAKE)
+    print(" [i] Notificaciones en frames binarios")
+    return framing.BinaryFramer()
+
+def send_tcp_tickets_binary(tickets, batch_size=100):
+    """
+    Envía los tickets en frames binarios (MessagePack, lotes de batch_size,
+    comprimidos con zlib si conviene; ver app2/app/framing.py), negociados con
+    el byte de handshake.
+    """
+    print(f"--- Enviando {len(tickets)} tickets en frames binarios a {HOST}:{PORT} ---")
+    with socket.create_connection((HOST, PORT), timeout=5) as s:
+        s.sendall(framing.BINARY_HANDSHAKE)
+        reply = s.recv(1)
+        if reply != framing.BINARY_HANDSHAKE:
+            print(f" [!] El listener no aceptó frames binarios (respuesta {reply!r})")
+            return
+        sent = 0
+        for i in range(0, len(tickets), batch_size):
+            frame = framing.encode_batch(tickets[i:i + batch_size])
+            s.sendall(frame)
+            sent += len(frame)
+        json_bytes = sum(len(json.dumps(t)) + 1 for t in tickets)
+        print(f" [v] {len(tickets)} tickets en {sent} bytes ({json_bytes} como líneas JSON)")
+        time.sleep(0.1)
+
 def send_tcp_ticket(ticket_id, rut, price, event):
     print(f"--- Intentando enviar ticket {ticket_id} a {HOST}:{PORT} ---")
     try:
@@ -74,9 +153,30 @@ def send_tcp_ticket(ticket_id, rut, price, event):
     except Exception as e:
         print(f" [!] Error: {e}")
 
+def send_tcp_tickets_acked(tickets):
+    """
+    Envía los tickets por una sola conexión en modo con confirmaciones
+    (app2/app/feed_ack.py) y espera a que el listener confirme el commit de
+    todos. Si el listener se reinicia en medio, se reenvía solo lo no confirmado.
+    """
+    producer = feed_ack.AckingProducer(HOST, PORT)
+    print(f"--- Enviando {len(tickets)} tickets con acks a {HOST}:{PORT} ---")
+    start = time.time()
+    for ticket in tickets:
+        producer.send(ticket)
+    if producer.flush(timeout=30):
+        print(f" [v] {len(tickets)} tickets confirmados en {time.time() - start:.2f}s "
+              f"(último ack {producer.acked}, crédito hasta {producer.limit})")
+    else:
+        print(f" [!] {len(producer.unacked)} tickets sin confirmar después de 30s")
+    print(f"     {producer.stats}")
+    producer.close()
+
 if __name__ == '__main__':
     print("Simulador de Middleware TCP (Bidireccional)")
     print("Asegúrate de que en .env tengas MIDDLEWARE_TYPE=tcp_server")
+    print("Uso: python simulate_tcp_middleware.py [--ack [N] | --binary [N]]  "
+          "(--ack: con confirmaciones; --binary: frames MessagePack; N tickets)")
     
     # Iniciar el listener de notificaciones en segundo plano
     listener_thread = threading.Thread(target=listen_for_notifications, daemon=True)
@@ -84,6 +184,22 @@ if __name__ == '__main__':
     
     # Dar tiempo al listener para arrancar
     time.sleep(1)
+
+    for mode in ('--ack', '--binary'):
+        if mode in sys.argv:
+            position = sys.argv.index(mode) + 1
+            count = int(sys.argv[position]) if position < len(sys.argv) else 2
+            events = [("Concierto TCP Rock", 7500), ("Gala de Sockets", 12000)]
+            tickets = [
+                {"id": f"TCP-{mode[2:].upper()}-{random.randint(0, 10**9)}-{i}", "rut": 11223344 + i % 50,
+                 "price": events[i % 2][1], "event": events[i % 2][0]}
+                for i in range(count)
+            ]
+            if mode == '--ack':
+                send_tcp_tickets_acked(tickets)
+            else:
+                send_tcp_tickets_binary(tickets)
+            sys.exit(0)
     
     # Enviar un par de tickets de prueba
     send_tcp_ticket(